@@ -7,7 +7,10 @@ import numpy as np
 from .model_init import AtomModelSingleton
 from ...utils.config_reader import get_formula_enable, get_table_enable
 from ...utils.model_utils import crop_img, get_res_list_from_layout_res
-from ...utils.ocr_utils import get_adjusted_mfdetrec_res, get_ocr_result_list, OcrConfidence
+from ...utils.ocr_utils import get_adjusted_mfdetrec_res, get_ocr_result_list, OcrConfidence, merge_det_boxes, \
+    update_det_boxes, sorted_boxes
+from ...utils.pdf_image_tools import PageImage
+from ...utils.stage_timing import timed_stage
 
 YOLO_LAYOUT_BASE_BATCH_SIZE = 1
 MFD_BASE_BATCH_SIZE = 1
@@ -15,64 +18,86 @@ MFR_BASE_BATCH_SIZE = 16
 
 
 class BatchAnalyze:
-    def __init__(self, model_manager, batch_ratio: int, formula_enable, table_enable, enable_ocr_det_batch: bool = True):
+    # 各推理阶段按顺序执行，StagePipeline可以让相邻批次的不同阶段重叠执行
+    STAGES = ('layout', 'mfd', 'mfr', 'ocr_det', 'table', 'ocr_rec')
+
+    def __init__(self, model_manager, batch_ratio: int, formula_enable, table_enable, enable_ocr_det_batch: bool = True, batch_sizes: dict | None = None, ocr_det_mosaic=None):
         self.batch_ratio = batch_ratio
+        # 自动调优得到的各阶段batch大小(见batch_autotune)，未提供的阶段仍按batch_ratio计算
+        self.batch_sizes = batch_sizes or {}
         self.formula_enable = get_formula_enable(formula_enable)
         self.table_enable = get_table_enable(table_enable)
         self.model_manager = model_manager
         self.enable_ocr_det_batch = enable_ocr_det_batch
+        # 批处理模式下把小的OCR-det crop拼到画布上检测(见OcrDetMosaic)，为None时只按分辨率分组
+        self.ocr_det_mosaic = ocr_det_mosaic
 
     def __call__(self, images_with_extra_info: list) -> list:
         if len(images_with_extra_info) == 0:
             return []
 
-        images_layout_res = []
+        batch = self.prepare(images_with_extra_info)
+        for stage in self.STAGES:
+            self.run_stage(stage, batch)
+        return batch.images_layout_res
 
+    def prepare(self, images_with_extra_info: list) -> 'AnalyzeBatch':
         self.model = self.model_manager.get_model(
             lang=None,
             formula_enable=self.formula_enable,
             table_enable=self.table_enable,
         )
-        atom_model_manager = AtomModelSingleton()
+        return AnalyzeBatch(images_with_extra_info)
 
-        images = [image for image, _, _ in images_with_extra_info]
+    def run_stage(self, stage: str, batch: 'AnalyzeBatch') -> 'AnalyzeBatch':
+        if len(batch.np_images) > 0:
+            with timed_stage(stage, len(batch.np_images)):
+                getattr(self, f'_{stage}')(batch)
+        return batch
 
+    def _layout(self, batch):
         # doclayout_yolo
-        layout_images = []
-        for image_index, image in enumerate(images):
-            layout_images.append(image)
-
-
-        images_layout_res += self.model.layout_model.batch_predict(
-            layout_images, YOLO_LAYOUT_BASE_BATCH_SIZE
+        batch.images_layout_res += self.model.layout_model.batch_predict(
+            batch.np_images, self.batch_sizes.get('layout', YOLO_LAYOUT_BASE_BATCH_SIZE)
         )
 
+    def _mfd(self, batch):
         if self.formula_enable:
             # 公式检测
-            images_mfd_res = self.model.mfd_model.batch_predict(
-                images, MFD_BASE_BATCH_SIZE
+            batch.images_mfd_res = self.model.mfd_model.batch_predict(
+                batch.np_images, self.batch_sizes.get('mfd', MFD_BASE_BATCH_SIZE)
             )
 
+    def _mfr(self, batch):
+        if self.formula_enable:
+            np_images = batch.np_images
+            images_layout_res = batch.images_layout_res
             # 公式识别
             images_formula_list = self.model.mfr_model.batch_predict(
-                images_mfd_res,
-                images,
-                batch_size=self.batch_ratio * MFR_BASE_BATCH_SIZE,
+                batch.images_mfd_res,
+                np_images,
+                batch_size=self.batch_sizes.get('mfr', self.batch_ratio * MFR_BASE_BATCH_SIZE),
             )
             mfr_count = 0
-            for image_index in range(len(images)):
+            for image_index in range(len(np_images)):
                 images_layout_res[image_index] += images_formula_list[image_index]
                 mfr_count += len(images_formula_list[image_index])
 
+    def _ocr_det(self, batch):
+        images_with_extra_info = batch.images_with_extra_info
+        images_layout_res = batch.images_layout_res
+        np_images = batch.np_images
+        atom_model_manager = AtomModelSingleton()
+
         # 清理显存
         # clean_vram(self.model.device, vram_threshold=8)
 
         ocr_res_list_all_page = []
-        table_res_list_all_page = []
-        for index in range(len(images)):
+        table_res_list_all_page = batch.table_res_list_all_page
+        for index in range(len(np_images)):
             _, ocr_enable, _lang = images_with_extra_info[index]
             layout_res = images_layout_res[index]
-            pil_img = images[index]
+            np_img = np_images[index]
 
             ocr_res_list, table_res_list, single_page_mfdetrec_res = (
                 get_res_list_from_layout_res(layout_res)
@@ -81,13 +106,14 @@ class BatchAnalyze:
             ocr_res_list_all_page.append({'ocr_res_list':ocr_res_list,
                                           'lang':_lang,
                                           'ocr_enable':ocr_enable,
-                                          'pil_img':pil_img,
+                                          'np_img':np_img,
                                           'single_page_mfdetrec_res':single_page_mfdetrec_res,
                                           'layout_res':layout_res,
                                           })
 
             for table_res in table_res_list:
-                table_img, _ = crop_img(table_res, pil_img)
+                table_img, _ = crop_img(table_res, np_img)
+                table_img = cv2.cvtColor(table_img, cv2.COLOR_BGR2RGB)
                 table_res_list_all_page.append({'table_res':table_res,
                                                 'lang':_lang,
                                                 'table_img':table_img,
@@ -103,16 +129,14 @@ class BatchAnalyze:
                 _lang = ocr_res_list_dict['lang']
 
                 for res in ocr_res_list_dict['ocr_res_list']:
+                    # 直接从BGR页面数组裁剪，无需再做颜色转换
                     new_image, useful_list = crop_img(
-                        res, ocr_res_list_dict['pil_img'], crop_paste_x=50, crop_paste_y=50
+                        res, ocr_res_list_dict['np_img'], crop_paste_x=50, crop_paste_y=50
                     )
                     adjusted_mfdetrec_res = get_adjusted_mfdetrec_res(
                         ocr_res_list_dict['single_page_mfdetrec_res'], useful_list
                     )
 
-                    # BGR转换
-                    new_image = cv2.cvtColor(np.asarray(new_image), cv2.COLOR_RGB2BGR)
-
                     all_cropped_images_info.append((
                         new_image, useful_list, ocr_res_list_dict, res, adjusted_mfdetrec_res, _lang
                     ))
@@ -137,6 +161,13 @@ class BatchAnalyze:
                     lang=lang
                 )
 
+                if self.ocr_det_mosaic is not None:
+                    # 能放进画布的crop拼到同样大小的画布上批量检测，放不下的仍按分辨率分组
+                    mosaic_crops = [crop_info for crop_info in lang_crop_list if self.ocr_det_mosaic.fits(crop_info[0].shape)]
+                    lang_crop_list = [crop_info for crop_info in lang_crop_list if not self.ocr_det_mosaic.fits(crop_info[0].shape)]
+                    if mosaic_crops:
+                        self._ocr_det_mosaic_predict(ocr_model, mosaic_crops, lang)
+
                 # 按分辨率分组并同时完成padding
                 resolution_groups = defaultdict(list)
                 for crop_info in lang_crop_list:
@@ -170,47 +201,13 @@ class BatchAnalyze:
                         batch_images.append(padded_img)
 
                     # 批处理检测
-                    batch_size = min(len(batch_images), self.batch_ratio * 16)  # 增加批处理大小
+                    batch_size = min(len(batch_images), self.batch_sizes.get('ocr_det', self.batch_ratio * 16))  # 增加批处理大小
                     # logger.debug(f"OCR-det batch: {batch_size} images, target size: {target_h}x{target_w}")
                     batch_results = ocr_model.text_detector.batch_predict(batch_images, batch_size)
 
                     # 处理批处理结果
-                    for i, (crop_info, (dt_boxes, elapse)) in enumerate(zip(group_crops, batch_results)):
-                        new_image, useful_list, ocr_res_list_dict, res, adjusted_mfdetrec_res, _lang = crop_info
-
-                        if dt_boxes is not None and len(dt_boxes) > 0:
-                            # 直接应用原始OCR流程中的关键处理步骤
-                            from mineru.utils.ocr_utils import (
-                                merge_det_boxes, update_det_boxes, sorted_boxes
-                            )
-
-                            # 1. 排序检测框
-                            if len(dt_boxes) > 0:
-                                dt_boxes_sorted = sorted_boxes(dt_boxes)
-                            else:
-                                dt_boxes_sorted = []
-
-                            # 2. 合并相邻检测框
-                            if dt_boxes_sorted:
-                                dt_boxes_merged = merge_det_boxes(dt_boxes_sorted)
-                            else:
-                                dt_boxes_merged = []
-
-                            # 3. 根据公式位置更新检测框（关键步骤！）
-                            if dt_boxes_merged and adjusted_mfdetrec_res:
-                                dt_boxes_final = update_det_boxes(dt_boxes_merged, adjusted_mfdetrec_res)
-                            else:
-                                dt_boxes_final = dt_boxes_merged
-
-                            # 构造OCR结果格式
-                            ocr_res = [box.tolist() if hasattr(box, 'tolist') else box for box in dt_boxes_final]
-
-                            if ocr_res:
-                                ocr_result_list = get_ocr_result_list(
-                                    ocr_res, useful_list, ocr_res_list_dict['ocr_enable'], new_image, _lang
-                                )
-
-                                ocr_res_list_dict['layout_res'].extend(ocr_result_list)
+                    for crop_info, (dt_boxes, elapse) in zip(group_crops, batch_results):
+                        self._apply_det_boxes(crop_info, dt_boxes)
         else:
             # 原始单张处理模式
             for ocr_res_list_dict in tqdm(ocr_res_list_all_page, desc="OCR-det Predict"):
@@ -225,13 +222,12 @@ class BatchAnalyze:
                 )
                 for res in ocr_res_list_dict['ocr_res_list']:
                     new_image, useful_list = crop_img(
-                        res, ocr_res_list_dict['pil_img'], crop_paste_x=50, crop_paste_y=50
+                        res, ocr_res_list_dict['np_img'], crop_paste_x=50, crop_paste_y=50
                     )
                     adjusted_mfdetrec_res = get_adjusted_mfdetrec_res(
                         ocr_res_list_dict['single_page_mfdetrec_res'], useful_list
                     )
                     # OCR-det
-                    new_image = cv2.cvtColor(np.asarray(new_image), cv2.COLOR_RGB2BGR)
                     ocr_res = ocr_model.ocr(
                         new_image, mfd_res=adjusted_mfdetrec_res, rec=False
                     )[0]
@@ -244,9 +240,65 @@ class BatchAnalyze:
 
                         ocr_res_list_dict['layout_res'].extend(ocr_result_list)
 
+    def _ocr_det_mosaic_predict(self, ocr_model, mosaic_crops: list, lang: str):
+        mosaic = self.ocr_det_mosaic
+        crop_images = [crop_info[0] for crop_info in mosaic_crops]
+        crop_shapes = [img.shape for img in crop_images]
+        canvas_placements = mosaic.pack(crop_shapes)
+        canvases = [mosaic.render(placements, crop_images) for placements in canvas_placements]
+        logger.debug(f"OCR-det {lang}: {len(mosaic_crops)} crops packed into {len(canvases)} canvases")
+
+        # 画布按实际用到的高度裁剪，batch_predict要求同一批的尺寸一致，按高度分组
+        height_groups = defaultdict(list)
+        for canvas_idx, canvas in enumerate(canvases):
+            height_groups[canvas.shape[0]].append(canvas_idx)
+
+        for canvas_indices in height_groups.values():
+            batch_size = min(len(canvas_indices), self.batch_sizes.get('ocr_det', self.batch_ratio * 16))
+            batch_results = ocr_model.text_detector.batch_predict([canvases[idx] for idx in canvas_indices], batch_size)
+
+            for canvas_idx, (dt_boxes, elapse) in zip(canvas_indices, batch_results):
+                placements = canvas_placements[canvas_idx]
+                crop_boxes = mosaic.split_boxes(dt_boxes, placements, crop_shapes)
+                for crop_idx, _, _ in placements:
+                    self._apply_det_boxes(mosaic_crops[crop_idx], crop_boxes.get(crop_idx))
+
+    @staticmethod
+    def _apply_det_boxes(crop_info, dt_boxes):
+        new_image, useful_list, ocr_res_list_dict, res, adjusted_mfdetrec_res, _lang = crop_info
+
+        if dt_boxes is not None and len(dt_boxes) > 0:
+            # 直接应用原始OCR流程中的关键处理步骤
+            # 1. 排序检测框
+            dt_boxes_sorted = sorted_boxes(dt_boxes)
+
+            # 2. 合并相邻检测框
+            if dt_boxes_sorted:
+                dt_boxes_merged = merge_det_boxes(dt_boxes_sorted)
+            else:
+                dt_boxes_merged = []
+
+            # 3. 根据公式位置更新检测框（关键步骤！）
+            if dt_boxes_merged and adjusted_mfdetrec_res:
+                dt_boxes_final = update_det_boxes(dt_boxes_merged, adjusted_mfdetrec_res)
+            else:
+                dt_boxes_final = dt_boxes_merged
+
+            # 构造OCR结果格式
+            ocr_res = [box.tolist() if hasattr(box, 'tolist') else box for box in dt_boxes_final]
+
+            if ocr_res:
+                ocr_result_list = get_ocr_result_list(
+                    ocr_res, useful_list, ocr_res_list_dict['ocr_enable'], new_image, _lang
+                )
+
+                ocr_res_list_dict['layout_res'].extend(ocr_result_list)
+
+    def _table(self, batch):
+        atom_model_manager = AtomModelSingleton()
         # 表格识别 table recognition
         if self.table_enable:
-            for table_res_dict in tqdm(table_res_list_all_page, desc="Table Predict"):
+            for table_res_dict in tqdm(batch.table_res_list_all_page, desc="Table Predict"):
                 _lang = table_res_dict['lang']
                 table_model = atom_model_manager.get_atom_model(
                     atom_model_name='table',
@@ -267,11 +319,13 @@ class BatchAnalyze:
                         'table recognition processing fails, not get html return'
                     )
 
+    def _ocr_rec(self, batch):
+        atom_model_manager = AtomModelSingleton()
         # Create dictionaries to store items by language
         need_ocr_lists_by_lang = {}  # Dict of lists for each language
         img_crop_lists_by_lang = {}  # Dict of lists for each language
 
-        for layout_res in images_layout_res:
+        for layout_res in batch.images_layout_res:
             for layout_res_item in layout_res:
                 if layout_res_item['category_id'] in [15]:
                     if 'np_img' in layout_res_item and 'lang' in layout_res_item:
@@ -321,4 +375,18 @@ class BatchAnalyze:
 
                     total_processed += len(img_crop_list)
 
-        return images_layout_res
+
+class AnalyzeBatch:
+    """一个推理批次在各阶段之间传递的中间结果"""
+
+    def __init__(self, images_with_extra_info: list):
+        self.images_with_extra_info = images_with_extra_info
+        # 页面以BGR数组的形式由layout、mfd、mfr、ocr和表格共享，裁剪均为数组切片
+        self.page_images = [
+            image if isinstance(image, PageImage) else PageImage(image, 1)
+            for image, _, _ in images_with_extra_info
+        ]
+        self.np_images = [page_image.np_bgr for page_image in self.page_images]
+        self.images_layout_res = []
+        self.images_mfd_res = []
+        self.table_res_list_all_page = []
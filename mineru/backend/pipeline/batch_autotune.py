@@ -0,0 +1,314 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import json
+import os
+import platform
+import threading
+import time
+
+import numpy as np
+import torch
+from loguru import logger
+
+from mineru.utils.config_reader import get_device
+from mineru.utils.model_utils import clean_memory, get_vram
+
+# 参与调优的阶段
+TUNED_STAGES = ('layout', 'mfd', 'mfr', 'ocr_det', 'ocr_rec')
+# 吞吐提升不足5%时不再增大batch
+MIN_SPEEDUP = 1.05
+
+
+def get_profile_path():
+    """调优结果保存路径，可通过环境变量MINERU_BATCH_PROFILE_PATH设置"""
+    profile_path = os.getenv('MINERU_BATCH_PROFILE_PATH')
+    if profile_path:
+        return os.path.expanduser(profile_path)
+    return os.path.join(os.path.expanduser('~'), '.cache', 'mineru', 'batch_profiles.json')
+
+
+def get_device_key(device):
+    """设备标识，显卡型号或cpu型号与核数不同的机器分别保存调优结果"""
+    device = str(device)
+    if device.startswith('cuda') and torch.cuda.is_available():
+        device_name = torch.cuda.get_device_name(device)
+    elif device.startswith('npu'):
+        import torch_npu
+        device_name = torch_npu.npu.get_device_name(device)
+    else:
+        device_name = f'{platform.processor() or platform.machine()}x{os.cpu_count()}'
+    return f'{device}|{device_name}|torch-{torch.__version__}'
+
+
+def get_memory_budget(device):
+    """调优时允许使用的内存上限(字节)，可通过环境变量MINERU_AUTOTUNE_MEMORY_BUDGET_GB设置，
+    默认为显存的80%，cpu上为物理内存的50%(与推理时进程内存的增量比较)"""
+    budget_gb = os.getenv('MINERU_AUTOTUNE_MEMORY_BUDGET_GB')
+    if budget_gb:
+        return float(budget_gb) * 1024 ** 3
+    vram = get_vram(device)
+    if vram is not None:
+        return vram * 0.8 * 1024 ** 3
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 0.5
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def get_process_rss():
+    """当前进程的常驻内存(字节)，无法获取时返回None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def load_batch_profile(device=None):
+    device = device or get_device()
+    profile_path = get_profile_path()
+    if not os.path.exists(profile_path):
+        return None
+    try:
+        with open(profile_path, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f'read batch profile {profile_path} failed: {e}')
+        return None
+    return profiles.get(get_device_key(device))
+
+
+def save_batch_profile(profile, device=None):
+    device = device or get_device()
+    profile_path = get_profile_path()
+    profiles = {}
+    if os.path.exists(profile_path):
+        try:
+            with open(profile_path, 'r', encoding='utf-8') as f:
+                profiles = json.load(f)
+        except (OSError, ValueError):
+            profiles = {}
+    profiles[get_device_key(device)] = profile
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    tmp_path = f'{profile_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(profiles, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, profile_path)
+
+
+def make_page(height=2339, width=1654, seed=0):
+    """A4页面大小(200dpi)的合成页面：白底上随机分布的深色文本行"""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    for y in range(120, height - 120, 48):
+        x = 120
+        while x < width - 200:
+            word_width = int(rng.integers(40, 160))
+            page[y:y + 22, x:x + word_width] = rng.integers(0, 80, size=(22, word_width, 3), dtype=np.uint8)
+            x += word_width + int(rng.integers(12, 30))
+    return page
+
+
+class _SyntheticBoxes:
+    def __init__(self, boxes):
+        self.xyxy = torch.tensor([box for box in boxes], dtype=torch.float32)
+        self.conf = torch.full((len(boxes),), 0.9)
+        self.cls = torch.zeros(len(boxes))
+
+
+class _SyntheticMfdResult:
+    """与ultralytics检测结果同构的公式框，用于单独测量公式识别"""
+
+    def __init__(self, boxes):
+        self.boxes = _SyntheticBoxes(boxes)
+
+
+class _RssPeakSampler:
+    """在后台线程中定期读取进程常驻内存，记录运行期间的峰值"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = get_process_rss()
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = get_process_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            rss = get_process_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+
+def _measure(run, batch_size, item_count, device):
+    """
+    执行一次预热后计时，返回(每秒处理的条目数, 内存占用字节)，
+    加速卡上为峰值显存，cpu上为运行期间进程常驻内存相对运行前的峰值增量(不含已加载的模型)
+    """
+    run(batch_size, batch_size)
+    if str(device).startswith('cuda'):
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+    rss_before = get_process_rss()
+    with _RssPeakSampler() as rss_sampler:
+        start = time.perf_counter()
+        run(batch_size, item_count)
+        if str(device).startswith('cuda'):
+            torch.cuda.synchronize(device)
+        elapsed = time.perf_counter() - start
+    if str(device).startswith('cuda'):
+        peak_memory = torch.cuda.max_memory_allocated(device)
+    elif rss_before is not None and rss_sampler.peak is not None:
+        peak_memory = max(rss_sampler.peak - rss_before, 0)
+    else:
+        peak_memory = None
+    return item_count / max(elapsed, 1e-9), peak_memory
+
+
+def _is_oom(e):
+    return isinstance(e, MemoryError) or 'out of memory' in str(e).lower()
+
+
+def tune_stage(stage, run, candidates, device, memory_budget, items_per_batch=2):
+    """依次尝试候选batch，吞吐不再明显提升、超出内存预算或OOM时停止，返回吞吐最高的batch"""
+    best_batch_size, best_throughput = candidates[0], 0.0
+    for batch_size in candidates:
+        try:
+            throughput, peak_memory = _measure(run, batch_size, batch_size * items_per_batch, device)
+        except Exception as e:
+            if _is_oom(e):
+                logger.info(f'autotune {stage}: batch {batch_size} out of memory')
+                clean_memory(device)
+                break
+            raise
+        logger.info(
+            f'autotune {stage}: batch {batch_size}, {throughput:.2f} items/s'
+            + (f', memory {peak_memory / 1024 ** 3:.2f} GB' if peak_memory is not None else '')
+        )
+        if memory_budget is not None and peak_memory is not None and peak_memory > memory_budget:
+            logger.info(f'autotune {stage}: batch {batch_size} exceeds memory budget')
+            break
+        if throughput > best_throughput * MIN_SPEEDUP:
+            best_batch_size, best_throughput = batch_size, throughput
+        elif throughput < best_throughput:
+            # 吞吐开始下降，继续增大batch没有意义
+            break
+    clean_memory(device)
+    return best_batch_size, best_throughput
+
+
+def autotune_batch_sizes(model, ocr_model, device=None, candidates=None):
+    """
+    用合成输入在当前设备上测量layout、mfd、mfr、ocr-det和ocr-rec在不同batch下的吞吐，
+    在内存预算内选出吞吐最高的batch大小
+
+    Args:
+        model: MineruPipelineModel
+        ocr_model: PytorchPaddleOCR
+        candidates: 候选batch大小，默认cpu上为1~8，加速卡上为1~64
+
+    Returns:
+        dict: 各阶段的batch大小，以及测得的吞吐(items/s)
+    """
+    device = device or get_device()
+    if candidates is None:
+        candidates = [1, 2, 4, 8] if str(device) == 'cpu' else [1, 2, 4, 8, 16, 32, 64]
+    memory_budget = get_memory_budget(device)
+    pages = [make_page(seed=seed) for seed in range(4)]
+
+    def pages_for(item_count):
+        return [pages[index % len(pages)] for index in range(item_count)]
+
+    def run_layout(batch_size, item_count):
+        model.layout_model.batch_predict(pages_for(item_count), batch_size)
+
+    def run_mfd(batch_size, item_count):
+        model.mfd_model.batch_predict(pages_for(item_count), batch_size)
+
+    # 每页放4个大小不一的公式框，batch以公式为单位
+    formula_boxes = [[120, 200, 520, 260], [120, 400, 900, 470], [200, 800, 420, 850], [300, 1200, 1300, 1330]]
+
+    def run_mfr(batch_size, item_count):
+        page_count = -(-item_count // len(formula_boxes))
+        mfd_res = [_SyntheticMfdResult(formula_boxes) for _ in range(page_count)]
+        model.mfr_model.batch_predict(mfd_res, pages_for(page_count), batch_size=batch_size)
+
+    det_crop = pages[0][100:676, 100:1252].copy()
+
+    def run_ocr_det(batch_size, item_count):
+        ocr_model.text_detector.batch_predict([det_crop] * item_count, batch_size)
+
+    rec_crops = [pages[0][118 + 48 * row:146 + 48 * row, 100:100 + width].copy()
+                 for row, width in enumerate([160, 320, 480, 640, 800, 960, 1120, 1280])]
+
+    def run_ocr_rec(batch_size, item_count):
+        rec_batch_num = ocr_model.text_recognizer.rec_batch_num
+        ocr_model.text_recognizer.rec_batch_num = batch_size
+        try:
+            ocr_model.text_recognizer([rec_crops[index % len(rec_crops)] for index in range(item_count)])
+        finally:
+            ocr_model.text_recognizer.rec_batch_num = rec_batch_num
+
+    stage_runs = {
+        'layout': (run_layout, 2),
+        'mfd': (run_mfd, 2),
+        'mfr': (run_mfr, 4),
+        'ocr_det': (run_ocr_det, 4),
+        'ocr_rec': (run_ocr_rec, 8),
+    }
+    profile = {'batch_sizes': {}, 'throughput': {}, 'tuned_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+    for stage in TUNED_STAGES:
+        if stage in ('mfd', 'mfr') and getattr(model, 'mfd_model', None) is None:
+            continue
+        run, items_per_batch = stage_runs[stage]
+        tune_start = time.time()
+        # ocr-rec的batch通常远大于其它阶段
+        stage_candidates = candidates + [candidates[-1] * 2, candidates[-1] * 4] if stage == 'ocr_rec' else candidates
+        batch_size, throughput = tune_stage(stage, run, stage_candidates, device, memory_budget, items_per_batch)
+        profile['batch_sizes'][stage] = batch_size
+        profile['throughput'][stage] = round(throughput, 3)
+        logger.info(f'autotune {stage}: use batch {batch_size}, cost {round(time.time() - tune_start, 2)}s')
+    return profile
+
+
+_batch_sizes_cache = {}
+
+
+def get_batch_sizes(model, ocr_model, device=None):
+    """读取当前设备已保存的调优结果，没有时现场调优并保存"""
+    device = device or get_device()
+    if device in _batch_sizes_cache:
+        return _batch_sizes_cache[device]
+    profile = load_batch_profile(device)
+    if profile is None:
+        logger.info(f'no batch profile for {get_device_key(device)}, autotuning batch sizes')
+        profile = autotune_batch_sizes(model, ocr_model, device)
+        save_batch_profile(profile, device)
+        logger.info(f'batch profile saved to {get_profile_path()}')
+    logger.info(f'batch sizes for {get_device_key(device)}: {profile["batch_sizes"]}')
+    _batch_sizes_cache[device] = profile['batch_sizes']
+    return profile['batch_sizes']
+
+
+if __name__ == '__main__':
+    from mineru.backend.pipeline.model_init import AtomModelSingleton
+    from mineru.backend.pipeline.pipeline_analyze import ModelSingleton
+
+    _model = ModelSingleton().get_model(lang=None, formula_enable=True, table_enable=True)
+    _ocr_model = AtomModelSingleton().get_atom_model(atom_model_name='ocr', det_db_box_thresh=0.3, lang='ch')
+    _profile = autotune_batch_sizes(_model, _ocr_model)
+    save_batch_profile(_profile)
+    logger.info(json.dumps(_profile, indent=4))
@@ -0,0 +1,66 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import numpy as np
+from loguru import logger
+
+from mineru.utils.pdf_image_tools import PageImage
+
+
+def get_ink_ratio(np_bgr: np.ndarray, ink_threshold: int = 200, stride: int = 2) -> float:
+    """页面中墨迹像素的比例，任一通道低于ink_threshold即视为墨迹(彩色内容也计入)，隔stride个像素采样"""
+    sample = np_bgr[::stride, ::stride]
+    if sample.size == 0:
+        return 0.0
+    if sample.ndim == 3:
+        # 逐通道取最小值比any(axis=2)快一个数量级
+        darkest = sample[..., 0]
+        for channel in range(1, sample.shape[2]):
+            darkest = np.minimum(darkest, sample[..., channel])
+    else:
+        darkest = sample
+    return float(np.count_nonzero(darkest < ink_threshold)) / darkest.size
+
+
+class BlankPageFilter:
+    """Skip model inference for pages that carry (almost) no ink.
+
+    A page whose ink ratio (see get_ink_ratio) is at most ``max_ink_ratio`` gets
+    an empty ``layout_dets`` without going through any model. The default ratio
+    lets a page number or scanner speckles through as blank, but not a line of
+    text. Only pages that go through OCR are checked: the text of a txt-mode
+    page comes from its text layer, which the rendered ink says nothing about
+    (e.g. a short page number or light-colored text), so such pages are always
+    inferred. Same ``split``/``merge`` interface as PageDedup.
+    """
+
+    def __init__(self, ink_threshold: int = 200, max_ink_ratio: float = 0.0002):
+        self.ink_threshold = ink_threshold
+        self.max_ink_ratio = max_ink_ratio
+        self.pages = 0
+        self.blank_pages = 0
+
+    def is_blank(self, page_image) -> bool:
+        if not isinstance(page_image, PageImage):
+            return False
+        return get_ink_ratio(page_image.np_bgr, self.ink_threshold) <= self.max_ink_ratio
+
+    def split(self, batch_image: list) -> tuple[list, list]:
+        """返回(需要推理的页面, 合并计划)，空白页在计划中为None"""
+        infer_image = []
+        plan = []
+        for page_info in batch_image:
+            self.pages += 1
+            # page_info为(页面图像, 是否ocr, 语言)，txt模式的页面总是推理
+            if page_info[1] and self.is_blank(page_info[0]):
+                self.blank_pages += 1
+                plan.append(None)
+                continue
+            plan.append(len(infer_image))
+            infer_image.append(page_info)
+        return infer_image, plan
+
+    def merge(self, plan: list, infer_results: list) -> list:
+        return [[] if infer_idx is None else infer_results[infer_idx] for infer_idx in plan]
+
+    def log_stats(self):
+        if self.pages > 0:
+            logger.info(f'blank page: {self.blank_pages}/{self.pages} pages skipped inference')
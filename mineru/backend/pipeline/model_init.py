@@ -13,13 +13,14 @@ from ...utils.enum_class import ModelPath
 from ...utils.models_download_utils import auto_download_and_get_model_root_path
 
 
-def table_model_init(lang=None):
+def table_model_init(lang=None, rec_batch_pixels=None):
     atom_model_manager = AtomModelSingleton()
     ocr_engine = atom_model_manager.get_atom_model(
         atom_model_name='ocr',
         det_db_box_thresh=0.5,
         det_db_unclip_ratio=1.6,
-        lang=lang
+        lang=lang,
+        rec_batch_pixels=rec_batch_pixels,
     )
     table_model = RapidTableModel(ocr_engine)
     return table_model
@@ -47,19 +48,36 @@ def ocr_model_init(det_db_box_thresh=0.3,
                    lang=None,
                    use_dilation=True,
                    det_db_unclip_ratio=1.8,
+                   rec_batch_pixels=None,
+                   rec_preprocess_workers=None,
+                   rec_batch_num=None,
                    ):
+    if rec_batch_pixels is None:
+        # OCR识别每个batch的像素预算，0表示按rec_batch_num计算
+        rec_batch_pixels = int(os.getenv('MINERU_OCR_REC_BATCH_PIXELS', 0))
+    if rec_preprocess_workers is None:
+        # OCR预处理线程数，-1表示自动选择，0表示串行
+        rec_preprocess_workers = int(os.getenv('MINERU_OCR_PREPROCESS_WORKERS', -1))
+    # 未指定时使用OCR默认的识别batch大小
+    extra_kwargs = {'rec_batch_num': rec_batch_num} if rec_batch_num else {}
     if lang is not None and lang != '':
         model = PytorchPaddleOCR(
             det_db_box_thresh=det_db_box_thresh,
             lang=lang,
             use_dilation=use_dilation,
             det_db_unclip_ratio=det_db_unclip_ratio,
+            rec_batch_pixels=rec_batch_pixels,
+            rec_preprocess_workers=rec_preprocess_workers,
+            **extra_kwargs,
         )
     else:
         model = PytorchPaddleOCR(
             det_db_box_thresh=det_db_box_thresh,
             use_dilation=use_dilation,
             det_db_unclip_ratio=det_db_unclip_ratio,
+            rec_batch_pixels=rec_batch_pixels,
+            rec_preprocess_workers=rec_preprocess_workers,
+            **extra_kwargs,
         )
     return model
 
@@ -67,12 +85,23 @@ def ocr_model_init(det_db_box_thresh=0.3,
 class AtomModelSingleton:
     _instance = None
     _models = {}
+    # batch调优得到的OCR识别batch大小，之后创建的OCR模型同样使用
+    _ocr_rec_batch_num = None
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
 
+    def set_ocr_rec_batch_num(self, rec_batch_num: int):
+        """设置所有OCR模型(包括之后按语言创建的)的识别batch大小，与当前设置相同时不做任何事"""
+        if AtomModelSingleton._ocr_rec_batch_num == rec_batch_num:
+            return
+        AtomModelSingleton._ocr_rec_batch_num = rec_batch_num
+        for key, model in self._models.items():
+            if isinstance(key, tuple) and key[0] == AtomicModel.OCR:
+                model.text_recognizer.rec_batch_num = rec_batch_num
+
     def get_atom_model(self, atom_model_name: str, **kwargs):
 
         lang = kwargs.get('lang', None)
@@ -110,10 +139,13 @@ def atom_model_init(model_name: str, **kwargs):
         atom_model = ocr_model_init(
             kwargs.get('det_db_box_thresh'),
             kwargs.get('lang'),
+            rec_batch_pixels=kwargs.get('rec_batch_pixels'),
+            rec_batch_num=kwargs.get('rec_batch_num', AtomModelSingleton._ocr_rec_batch_num),
         )
     elif model_name == AtomicModel.Table:
         atom_model = table_model_init(
             kwargs.get('lang'),
+            rec_batch_pixels=kwargs.get('rec_batch_pixels'),
         )
     else:
         logger.error('model name not allow')
@@ -16,17 +16,18 @@ from mineru.utils.llm_aided import llm_aided_title
 from mineru.utils.model_utils import clean_memory
 from mineru.backend.pipeline.pipeline_magic_model import MagicModel
 from mineru.utils.ocr_utils import OcrConfidence
+from mineru.utils.pdf_image_tools import PdfPageImages
+from mineru.utils.stage_timing import timed_stage
 from mineru.utils.span_block_fix import fill_spans_in_blocks, fix_discarded_block, fix_block_spans
 from mineru.utils.span_pre_proc import remove_outside_spans, remove_overlaps_low_confidence_spans, \
     remove_overlaps_min_spans, txt_spans_extract
 from mineru.version import __version__
-from mineru.utils.hash_utils import str_md5
 
 
-def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer, page_index, ocr_enable=False, formula_enabled=True):
-    scale = image_dict["scale"]
-    page_pil_img = image_dict["img_pil"]
-    page_img_md5 = str_md5(image_dict["img_base64"])
+def page_model_info_to_page_info(page_model_info, page_image, page, image_writer, page_index, ocr_enable=False, formula_enabled=True):
+    scale = page_image.scale
+    page_img = page_image.np_bgr
+    page_img_md5 = page_image.img_hash
     page_w, page_h = map(int, page.get_size())
     magic_model = MagicModel(page_model_info, scale)
 
@@ -126,7 +127,7 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
         pass
     else:
         """使用新版本的混合ocr方案."""
-        spans = txt_spans_extract(page, spans, page_pil_img, scale, all_bboxes, all_discarded_blocks)
+        spans = txt_spans_extract(page, spans, page_img, scale, all_bboxes, all_discarded_blocks)
 
     """先处理不需要排版的discarded_blocks"""
     discarded_block_with_spans, spans = fill_spans_in_blocks(
@@ -142,7 +143,7 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
     for span in spans:
         if span['type'] in [ContentType.IMAGE, ContentType.TABLE, ContentType.INTERLINE_EQUATION]:
             span = cut_image_and_table(
-                span, page_pil_img, page_img_md5, page_index, image_writer, scale=scale
+                span, page_img, page_img_md5, page_index, image_writer, scale=scale
             )
 
     """span填充进block"""
@@ -164,18 +165,25 @@ def page_model_info_to_page_info(page_model_info, image_dict, page, image_writer
 
 
 def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=None, ocr_enable=False, formula_enabled=True):
+    """ocr_enable可以是整个文档的设置，也可以是doc_analyze逐页判断得到的bool列表"""
     middle_json = {"pdf_info": [], "_backend":"pipeline", "_version_name": __version__}
     formula_enabled = get_formula_enable(formula_enabled)
     for page_index, page_model_info in tqdm(enumerate(model_list), total=len(model_list), desc="Processing pages"):
         page = pdf_doc[page_index]
-        image_dict = images_list[page_index]
+        page_image = images_list[page_index]
+        page_ocr_enable = ocr_enable[page_index] if isinstance(ocr_enable, list) else ocr_enable
         page_info = page_model_info_to_page_info(
-            page_model_info, image_dict, page, image_writer, page_index, ocr_enable=ocr_enable, formula_enabled=formula_enabled
+            page_model_info, page_image, page, image_writer, page_index, ocr_enable=page_ocr_enable, formula_enabled=formula_enabled
         )
         if page_info is None:
             page_w, page_h = map(int, page.get_size())
             page_info = make_page_info_dict([], page_index, page_w, page_h, [])
+        # 记录该页实际使用的解析方式
+        page_info['parse_type'] = 'ocr' if page_ocr_enable else 'txt'
         middle_json["pdf_info"].append(page_info)
+        # 该页的middle json已生成，释放渲染好的页面图像
+        if isinstance(images_list, PdfPageImages):
+            images_list.release(page_index)
 
     """后置ocr处理"""
     need_ocr_list = []
@@ -206,7 +214,8 @@ def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=N
             det_db_box_thresh=0.3,
             lang=lang
         )
-        ocr_res_list = ocr_model.ocr(img_crop_list, det=False, tqdm_enable=True)[0]
+        with timed_stage('ocr_rec', len(img_crop_list)):
+            ocr_res_list = ocr_model.ocr(img_crop_list, det=False, tqdm_enable=True)[0]
         assert len(ocr_res_list) == len(
             need_ocr_list), f'ocr_res_list: {len(ocr_res_list)}, need_ocr_list: {len(need_ocr_list)}'
         for index, span in enumerate(need_ocr_list):
@@ -219,7 +228,8 @@ def result_to_middle_json(model_list, images_list, pdf_doc, image_writer, lang=N
                 span['score'] = 0.0
 
     """分段"""
-    para_split(middle_json["pdf_info"])
+    with timed_stage('para_split', len(middle_json["pdf_info"])):
+        para_split(middle_json["pdf_info"])
 
     """llm优化"""
     llm_aided_config = get_llm_aided_config()
@@ -0,0 +1,100 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import numpy as np
+
+
+class OcrDetMosaic:
+    """Tile many small OCR-det crops onto shared fixed-size canvases.
+
+    Crops are placed with a shelf packer (tallest first, left to right, a new
+    shelf when a row is full, a new canvas when a canvas is full), separated by
+    a white gutter of ``gutter`` pixels. Canvases are ``canvas_size`` wide and
+    as tall as their used shelves (rounded up to 32), so full canvases share one
+    size and the detector runs them as a few full batches instead of one small
+    batch per resolution group, while a mostly empty last canvas does not pay
+    for its blank rows. ``canvas_size`` is rounded down to a multiple of 32 and
+    should not exceed the detector's det_limit_side_len, otherwise the canvas
+    gets downscaled and small text is detected at a lower resolution. Crops
+    that do not fit on an empty canvas are left to the caller. ``split_boxes``
+    hands every detected box to the crop its center lies in, shifted back to
+    crop coordinates and clipped to the crop.
+    """
+
+    def __init__(self, canvas_size: int = 960, gutter: int = 16):
+        self.canvas_size = max(32, canvas_size // 32 * 32)
+        self.gutter = gutter
+
+    def fits(self, shape) -> bool:
+        h, w = shape[:2]
+        return h <= self.canvas_size and w <= self.canvas_size
+
+    def pack(self, shapes: list) -> list[list[tuple[int, int, int]]]:
+        """
+        shapes中的尺寸都需要fits，返回每张画布上的[(crop序号, x, y), ...]
+        """
+        canvases = []
+        # 每张画布的shelf: [y, 高度, 下一个x]
+        canvas_shelves = []
+        canvas_bottoms = []
+        order = sorted(range(len(shapes)), key=lambda idx: (-shapes[idx][0], -shapes[idx][1]))
+        for crop_idx in order:
+            h, w = shapes[crop_idx][:2]
+            placed = False
+            for canvas_idx, shelves in enumerate(canvas_shelves):
+                # 先尝试已有的shelf
+                for shelf in shelves:
+                    if h <= shelf[1] and shelf[2] + w <= self.canvas_size:
+                        canvases[canvas_idx].append((crop_idx, shelf[2], shelf[0]))
+                        shelf[2] += w + self.gutter
+                        placed = True
+                        break
+                if placed:
+                    break
+                # 再尝试在画布剩余的高度上开一个新的shelf
+                shelf_y = canvas_bottoms[canvas_idx]
+                if shelf_y + h <= self.canvas_size:
+                    shelves.append([shelf_y, h, w + self.gutter])
+                    canvas_bottoms[canvas_idx] = shelf_y + h + self.gutter
+                    canvases[canvas_idx].append((crop_idx, 0, shelf_y))
+                    placed = True
+                    break
+            if not placed:
+                canvases.append([(crop_idx, 0, 0)])
+                canvas_shelves.append([[0, h, w + self.gutter]])
+                canvas_bottoms.append(h + self.gutter)
+        return canvases
+
+    def canvas_height(self, placements: list[tuple[int, int, int]], shapes: list) -> int:
+        """画布实际用到的高度，向上取整到32的倍数"""
+        used_h = max((y + shapes[crop_idx][0] for crop_idx, _, y in placements), default=0)
+        return min(self.canvas_size, max(32, (used_h + 32 - 1) // 32 * 32))
+
+    def render(self, placements: list[tuple[int, int, int]], images: list) -> np.ndarray:
+        canvas_h = self.canvas_height(placements, [img.shape for img in images])
+        canvas = np.full((canvas_h, self.canvas_size, 3), 255, dtype=np.uint8)
+        for crop_idx, x, y in placements:
+            img = images[crop_idx]
+            h, w = img.shape[:2]
+            canvas[y:y + h, x:x + w] = img
+        return canvas
+
+    @staticmethod
+    def split_boxes(dt_boxes, placements: list[tuple[int, int, int]], shapes: list) -> dict:
+        """把画布上的检测框分回各crop，返回{crop序号: 检测框数组}，没有检测框的crop不在结果中"""
+        if dt_boxes is None or len(dt_boxes) == 0:
+            return {}
+        dt_boxes = np.asarray(dt_boxes, dtype=np.float32)
+        centers = dt_boxes.mean(axis=1)
+        crop_boxes = {}
+        for crop_idx, x, y in placements:
+            h, w = shapes[crop_idx][:2]
+            inside = (
+                (centers[:, 0] >= x) & (centers[:, 0] < x + w) &
+                (centers[:, 1] >= y) & (centers[:, 1] < y + h)
+            )
+            if not inside.any():
+                continue
+            boxes = dt_boxes[inside] - np.array([x, y], dtype=np.float32)
+            boxes[..., 0] = np.clip(boxes[..., 0], 0, w - 1)
+            boxes[..., 1] = np.clip(boxes[..., 1], 0, h - 1)
+            crop_boxes[crop_idx] = boxes
+        return crop_boxes
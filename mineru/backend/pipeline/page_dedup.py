@@ -0,0 +1,73 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import copy
+
+from loguru import logger
+
+from mineru.utils.pdf_image_tools import PageImage
+
+
+class PageDedup:
+    """Infer each distinct rendered page once, within a batch and across batches.
+
+    Pages are keyed by the exact hash of the rendered bitmap (which includes its
+    shape, so the reused coordinates are always in the right page space),
+    together with the ocr setting and the language, since both change the model
+    output. ``split`` keeps only the first occurrence of every key for
+    inference; ``merge`` maps the results back and hands every duplicate a deep
+    copy of the first page's ``layout_dets``. ``merge`` must be called in the
+    same order as ``split``, which lets a duplicate of a page from an earlier
+    batch that is still in flight (stage pipeline) be resolved at merge time.
+
+    At most ``max_pages`` distinct results are kept; after that new pages are
+    still inferred but no longer remembered.
+    """
+
+    def __init__(self, max_pages: int = 10000):
+        self.max_pages = max_pages
+        self.pages = 0
+        self.hits = 0
+        self._known = set()
+        self._results = {}
+
+    @staticmethod
+    def page_key(page_image, ocr_enable: bool, lang: str) -> str | None:
+        if not isinstance(page_image, PageImage):
+            return None
+        return f"{page_image.img_hash}_{int(bool(ocr_enable))}_{lang}"
+
+    def split(self, batch_image: list) -> tuple[list, list]:
+        """返回(需要推理的页面, 合并计划)，计划中每页为('infer', 推理列表中的序号, key)或('reuse', None, key)"""
+        infer_image = []
+        plan = []
+        for page_image, ocr_enable, lang in batch_image:
+            self.pages += 1
+            key = self.page_key(page_image, ocr_enable, lang)
+            if key is not None and key in self._known:
+                self.hits += 1
+                plan.append(('reuse', None, key))
+                continue
+            if key is not None and len(self._known) < self.max_pages:
+                self._known.add(key)
+            else:
+                key = None
+            plan.append(('infer', len(infer_image), key))
+            infer_image.append((page_image, ocr_enable, lang))
+        return infer_image, plan
+
+    def merge(self, plan: list, infer_results: list) -> list:
+        results = [None] * len(plan)
+        for index, (action, infer_idx, key) in enumerate(plan):
+            if action == 'infer':
+                results[index] = infer_results[infer_idx]
+                if key is not None:
+                    # 保存副本，下游对本页结果的修改不影响之后的重复页
+                    self._results[key] = copy.deepcopy(infer_results[infer_idx])
+        for index, (action, _, key) in enumerate(plan):
+            if action == 'reuse':
+                # 下游会原地修改layout_dets，每页使用独立的副本
+                results[index] = copy.deepcopy(self._results[key])
+        return results
+
+    def log_stats(self):
+        if self.pages > 0:
+            logger.info(f'page dedup: {self.hits}/{self.pages} pages reused the result of an identical page')
@@ -1,14 +1,22 @@
+import itertools
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Tuple
 import PIL.Image
 from loguru import logger
 
-from .model_init import MineruPipelineModel
-from mineru.utils.config_reader import get_device
-from ...utils.pdf_classify import classify
-from ...utils.pdf_image_tools import load_images_from_pdf
+from .model_init import AtomModelSingleton, MineruPipelineModel
+from mineru.utils.config_reader import get_classify_workers, get_cpu_workers, get_device, get_formula_enable, \
+    get_render_workers, get_table_enable, get_threads_per_worker
+from ...utils.checkpoint import get_checkpoint_store
+from ...utils.pdf_classify import classify, classify_pages, classify_range
+from ...utils.stage_timing import timed_stage
+from ...utils.pdf_image_tools import (
+    ImageDocument, PageImage, get_page_memory_budget, get_page_window_size, open_images_from_pdf, reopen_document
+)
 from ...utils.model_utils import get_vram, clean_memory
+from ...version import __version__
 
 
 os.environ['PYTORCH_ENABLE_MPS_FALLBACK'] = '1'  # 让mps可以fallback
@@ -72,86 +80,473 @@ def doc_analyze(
         parse_method: str = 'auto',
         formula_enable=True,
         table_enable=True,
+        render_workers=None,
+        cpu_workers=None,
+        threads_per_worker=None,
 ):
     """
+    对所有文档推理完成后一次性返回结果，参数与配置项见doc_analyze_streaming。
+    """
+    infer_results = [[] for _ in pdf_bytes_list]
+    all_image_lists = [None] * len(pdf_bytes_list)
+    all_pdf_docs = [None] * len(pdf_bytes_list)
+    ocr_enabled_list = [False] * len(pdf_bytes_list)
+    for pdf_idx, model_list, images_list, pdf_doc, _lang, _ocr_enable in doc_analyze_streaming(
+        pdf_bytes_list, lang_list, parse_method, formula_enable, table_enable, render_workers,
+        cpu_workers, threads_per_worker,
+    ):
+        infer_results[pdf_idx] = model_list
+        all_image_lists[pdf_idx] = images_list
+        all_pdf_docs[pdf_idx] = pdf_doc
+        ocr_enabled_list[pdf_idx] = _ocr_enable
+
+    return infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list
+
+
+def doc_analyze_streaming(
+        pdf_bytes_list,
+        lang_list,
+        parse_method: str = 'auto',
+        formula_enable=True,
+        table_enable=True,
+        render_workers=None,
+        cpu_workers=None,
+        threads_per_worker=None,
+):
+    """
+    逐文档产出推理结果：一个文档的所有页面推理完成后立即产出
+    (pdf_idx, model_list, images_list, pdf_doc, lang, ocr_enable)，
+    不必等待其它文档，页面仍然跨文档组成批次推理。文档按输入顺序产出。
     适当调大MIN_BATCH_INFERENCE_SIZE可以提高性能，可能会增加显存使用量，
     可通过环境变量MINERU_MIN_BATCH_INFERENCE_SIZE设置，默认值为100。
+    页面图像按需渲染，默认保留到生成middle json之后，每页只渲染一次。
+    可通过环境变量MINERU_PAGE_WINDOW_SIZE限制同时驻留内存的渲染页数，
+    超出窗口的页面会被释放并在生成middle json时重新渲染(启用渲染缓存时从缓存读取)，见get_page_window_size。
+    也可通过环境变量MINERU_PAGE_MEMORY_BUDGET(字节)限制所有文档已渲染页面的总内存，
+    超出的页面写入内存映射文件，生成middle json时再读取，不必重新渲染，见PageMemoryBudget。
+    render_workers大于1时使用多进程渲染页面，未指定时读取环境变量MINERU_PDF_RENDER_WORKERS。
+    pdf_bytes_list中的元素可以是pdf的bytes，也可以是已打开并选定页码范围的PdfHandle或图片的ImageDocument。
+    parse_method为auto时先按文档抽样判断，判为ocr的文档再逐页判断txt/ocr，文本页直接提取文本，只有扫描页走OCR检测与识别，
+    此时ocr_enabled_list中对应文档的值为逐页的bool列表(所有页面结论相同时仍为单个bool)，
+    可通过环境变量MINERU_PAGE_LEVEL_CLASSIFY=false恢复为按整个文档判断。
+    多个文档需要判断类型时在进程池中并行分类，进程数可通过环境变量MINERU_CLASSIFY_WORKERS设置，
+    parse_method指定为ocr或txt时不做分类。
+    设置环境变量MINERU_STAGE_PIPELINE=true后以流水线方式执行各批次的渲染与推理，见run_stage_pipeline。
+    设置环境变量MINERU_CHECKPOINT_DIR后每批的推理结果按文档hash与页码保存，
+    重新运行时已有结果的页面不再渲染与推理，所有页面都已保存的文档也不再分类，见CheckpointStore。
+    设置环境变量MINERU_PAGE_DEDUP=true后，渲染结果完全相同的页面(空白页、重复的封面与表单等)只推理一次，见PageDedup。
+    设置环境变量MINERU_BLANK_PAGE_SKIP=true后，走OCR且几乎没有墨迹的页面(空白页、只有页码的页面)不经过模型，
+    直接得到空的layout_dets，见BlankPageFilter，阈值见get_page_filters。
+    cpu_workers大于1且在cpu上推理时，文档按页数分到多个fork出的子进程中推理，见doc_analyze_forked，
+    未指定时读取环境变量MINERU_CPU_WORKERS与MINERU_THREADS_PER_WORKER。
     """
-    min_batch_inference_size = int(os.environ.get('MINERU_MIN_BATCH_INFERENCE_SIZE', 100))
+    cpu_workers = get_cpu_workers(cpu_workers)
+    if cpu_workers > 1 and len(pdf_bytes_list) > 1:
+        yield from doc_analyze_forked(
+            pdf_bytes_list, lang_list, parse_method, formula_enable, table_enable,
+            cpu_workers, get_threads_per_worker(cpu_workers, threads_per_worker),
+        )
+        return
 
-    # 收集所有页面信息
-    all_pages_info = []  # 存储(dataset_index, page_index, img, ocr, lang, width, height)
+    min_batch_inference_size = int(os.environ.get('MINERU_MIN_BATCH_INFERENCE_SIZE', 100))
+    page_level_classify = os.environ.get('MINERU_PAGE_LEVEL_CLASSIFY', 'true').lower() == 'true'
+    page_window_size = get_page_window_size()
+    render_workers = get_render_workers(render_workers)
+    stage_pipeline_enable = os.environ.get('MINERU_STAGE_PIPELINE', 'false').lower() == 'true'
+    page_filters = get_page_filters()
+    memory_budget = get_page_memory_budget()
 
     all_image_lists = []
     all_pdf_docs = []
-    ocr_enabled_list = []
-    for pdf_idx, pdf_bytes in enumerate(pdf_bytes_list):
-        # 确定OCR设置
-        _ocr_enable = False
-        if parse_method == 'auto':
-            if classify(pdf_bytes) == 'ocr':
-                _ocr_enable = True
-        elif parse_method == 'ocr':
-            _ocr_enable = True
-
-        ocr_enabled_list.append(_ocr_enable)
-        _lang = lang_list[pdf_idx]
-
-        # 收集每个数据集中的页面
-        images_list, pdf_doc = load_images_from_pdf(pdf_bytes)
+    for pdf_bytes in pdf_bytes_list:
+        # 打开所有文档，图像在推理时才渲染
+        images_list, pdf_doc = open_images_from_pdf(
+            pdf_bytes, window_size=page_window_size, render_workers=render_workers, memory_budget=memory_budget
+        )
         all_image_lists.append(images_list)
         all_pdf_docs.append(pdf_doc)
-        for page_idx in range(len(images_list)):
-            img_dict = images_list[page_idx]
-            all_pages_info.append((
-                pdf_idx, page_idx,
-                img_dict['img_pil'], _ocr_enable, _lang,
-            ))
+    total_page_count = sum(len(images_list) for images_list in all_image_lists)
+
+    # 已在检查点中保存结果的页面跳过推理，文档产出时再读取
+    checkpoint_store = get_checkpoint_store()
+    checkpoint_tag = None
+    cached_pages = [set() for _ in all_pdf_docs]
+    # 所有页面都已保存的文档直接使用保存的ocr设置，不再分类
+    cached_ocr_enable = {}
+    if checkpoint_store is not None:
+        checkpoint_tag = checkpoint_store.make_tag(
+            'pipeline', __version__, parse_method, page_level_classify,
+            get_formula_enable(formula_enable), get_table_enable(table_enable),
+        )
+        for pdf_idx, pdf_doc in enumerate(all_pdf_docs):
+            doc_tag = get_page_checkpoint_tag(checkpoint_tag, lang_list[pdf_idx])
+            cached_pages[pdf_idx] = {
+                page_idx for page_idx, page_id in enumerate(pdf_doc.page_ids)
+                if checkpoint_store.has(pdf_doc.doc_hash, doc_tag, page_id)
+            }
+            if parse_method == 'auto' and len(cached_pages[pdf_idx]) == len(all_image_lists[pdf_idx]):
+                doc_ocr_enable = checkpoint_store.get(pdf_doc.doc_hash, doc_tag, OCR_ENABLE_CHECKPOINT_KEY)
+                if doc_ocr_enable is not None:
+                    cached_ocr_enable[pdf_idx] = doc_ocr_enable
+        cached_page_count = sum(len(pages) for pages in cached_pages)
+        if cached_page_count > 0:
+            logger.info(f'checkpoint: {cached_page_count}/{total_page_count} pages already inferred, skip them')
+    pending_page_count = total_page_count - sum(len(pages) for pages in cached_pages)
+
+    # 需要判断类型的文档在进程池中并行分类，推理从已分类完成的文档开始，与后续文档的分类重叠
+    classify_docs = [
+        pdf_doc for pdf_idx, pdf_doc in enumerate(all_pdf_docs)
+        if parse_method == 'auto' and not isinstance(pdf_doc, ImageDocument) and pdf_idx not in cached_ocr_enable
+    ]
+    classify_workers = get_classify_workers(len(classify_docs))
+    classify_executor = ProcessPoolExecutor(max_workers=classify_workers) if classify_workers > 1 else None
+    classify_futures = {}
+    if classify_executor is not None:
+        logger.info(f'classify {len(classify_docs)} docs with {classify_workers} processes')
+        for pdf_doc in classify_docs:
+            classify_futures[id(pdf_doc)] = classify_executor.submit(
+                classify_range, pdf_doc.pdf_bytes, pdf_doc.start_page_id, pdf_doc.end_page_id, page_level_classify
+            )
+
+    ocr_enabled_list = []
+
+    def get_doc_ocr_enable(pdf_idx, pdf_doc):
+        # 确定OCR设置
+        if isinstance(pdf_doc, ImageDocument):
+            # 图片没有文本层，总是走ocr
+            return True
+        if parse_method == 'ocr':
+            return True
+        if parse_method != 'auto':
+            return False
+        if pdf_idx in cached_ocr_enable:
+            return cached_ocr_enable[pdf_idx]
+        _ocr_enable = classify_doc(pdf_idx, pdf_doc)
+        if checkpoint_store is not None:
+            pdf_doc_tag = get_page_checkpoint_tag(checkpoint_tag, lang_list[pdf_idx])
+            checkpoint_store.put(pdf_doc.doc_hash, pdf_doc_tag, OCR_ENABLE_CHECKPOINT_KEY, _ocr_enable)
+        return _ocr_enable
+
+    def classify_doc(pdf_idx, pdf_doc):
+        # 进程池分类时记录的是等待分类结果的时间
+        with timed_stage('classify', len(pdf_doc)):
+            if id(pdf_doc) in classify_futures:
+                classify_result = classify_futures[id(pdf_doc)].result()
+            elif page_level_classify:
+                classify_result = classify_pages(pdf_doc)
+            else:
+                classify_result = classify(pdf_doc)
+        if not page_level_classify:
+            return classify_result == 'ocr'
+        page_ocr_list = [page_type == 'ocr' for page_type in classify_result]
+        ocr_page_count = sum(page_ocr_list)
+        if 0 < ocr_page_count < len(page_ocr_list):
+            logger.info(f'doc {pdf_idx}: {ocr_page_count}/{len(page_ocr_list)} pages need ocr')
+            return page_ocr_list
+        return ocr_page_count > 0
+
+    def iter_pages_info():
+        # 按文档顺序产出(dataset_index, page_index, ocr, lang)，只等待当前文档的分类结果
+        for pdf_idx, pdf_doc in enumerate(all_pdf_docs):
+            _ocr_enable = get_doc_ocr_enable(pdf_idx, pdf_doc)
+            ocr_enabled_list.append(_ocr_enable)
+            for page_idx in range(len(all_image_lists[pdf_idx])):
+                if page_idx in cached_pages[pdf_idx]:
+                    continue
+                yield pdf_idx, page_idx, get_page_ocr_enable(_ocr_enable, page_idx), lang_list[pdf_idx]
 
     # 准备批处理
-    images_with_extra_info = [(info[2], info[3], info[4]) for info in all_pages_info]
     batch_size = min_batch_inference_size
-    batch_images = [
-        images_with_extra_info[i:i + batch_size]
-        for i in range(0, len(images_with_extra_info), batch_size)
-    ]
+    batch_count = -(-pending_page_count // batch_size)
 
-    # 执行批处理
-    results = []
+    # 构建返回结果，按页码存放，done_counts记录各文档已推理的页数
+    infer_results = [[None] * len(images_list) for images_list in all_image_lists]
+    done_counts = [len(pages) for pages in cached_pages]
+
+    pages_info_iter = iter_pages_info()
     processed_images_count = 0
-    for index, batch_image in enumerate(batch_images):
-        processed_images_count += len(batch_image)
+
+    def render_batch(index):
+        # 按文档渲染本批次的页面，多进程渲染时一次提交整段页码
+        nonlocal processed_images_count
+        batch_page = list(itertools.islice(pages_info_iter, batch_size))
+        processed_images_count += len(batch_page)
         logger.info(
-            f'Batch {index + 1}/{len(batch_images)}: '
-            f'{processed_images_count} pages/{len(images_with_extra_info)} pages'
+            f'Batch {index + 1}/{batch_count}: '
+            f'{processed_images_count} pages/{pending_page_count} pages'
+        )
+        batch_page_images = {}
+        for pdf_idx in dict.fromkeys(page_info[0] for page_info in batch_page):
+            page_ids = [page_idx for _pdf_idx, page_idx, _, _ in batch_page if _pdf_idx == pdf_idx]
+            page_images = all_image_lists[pdf_idx].prefetch(page_ids)
+            for page_idx, page_image in zip(page_ids, page_images):
+                batch_page_images[(pdf_idx, page_idx)] = page_image
+        batch_image = [
+            (batch_page_images[(pdf_idx, page_idx)], _ocr_enable, _lang)
+            for pdf_idx, page_idx, _ocr_enable, _lang in batch_page
+        ]
+        return batch_page, batch_image
+
+    def collect_batch(batch_page, batch_image, batch_results):
+        for page_info, (page_image, _, _), result in zip(batch_page, batch_image, batch_results):
+            pdf_idx, page_idx, _, _ = page_info
+            width, height = page_image.size
+            page_info_dict = {'page_no': page_idx, 'width': width, 'height': height}
+            page_dict = {'layout_dets': result, 'page_info': page_info_dict}
+            infer_results[pdf_idx][page_idx] = page_dict
+            done_counts[pdf_idx] += 1
+            page_image.clear_cache()
+            if checkpoint_store is not None:
+                pdf_doc = all_pdf_docs[pdf_idx]
+                checkpoint_store.put(
+                    pdf_doc.doc_hash, get_page_checkpoint_tag(checkpoint_tag, lang_list[pdf_idx]),
+                    pdf_doc.page_ids[page_idx], page_dict,
+                )
+
+    def load_cached_pages(pdf_idx):
+        pdf_doc = all_pdf_docs[pdf_idx]
+        doc_tag = get_page_checkpoint_tag(checkpoint_tag, lang_list[pdf_idx])
+        for page_idx in sorted(cached_pages[pdf_idx]):
+            page_dict = checkpoint_store.get(pdf_doc.doc_hash, doc_tag, pdf_doc.page_ids[page_idx])
+            if page_dict is None:
+                raise RuntimeError(
+                    f'checkpoint of doc {pdf_idx} page {page_idx} is missing or broken, please run again'
+                )
+            # 页码范围可能与保存时不同，page_no按本次选定的范围重新编号
+            page_dict['page_info']['page_no'] = page_idx
+            infer_results[pdf_idx][page_idx] = page_dict
+
+    next_doc_idx = 0
+
+    def pop_finished_docs():
+        # 文档按顺序进入批次，已确定ocr设置且页面全部推理完成的文档即可产出
+        nonlocal next_doc_idx
+        while (
+            next_doc_idx < len(all_pdf_docs)
+            and next_doc_idx < len(ocr_enabled_list)
+            and done_counts[next_doc_idx] == len(all_image_lists[next_doc_idx])
+        ):
+            pdf_idx = next_doc_idx
+            next_doc_idx += 1
+            if cached_pages[pdf_idx]:
+                load_cached_pages(pdf_idx)
+            doc_result = (
+                pdf_idx, infer_results[pdf_idx], all_image_lists[pdf_idx], all_pdf_docs[pdf_idx],
+                lang_list[pdf_idx], ocr_enabled_list[pdf_idx],
+            )
+            # 产出后不再持有该文档的结果，由调用方决定何时释放
+            infer_results[pdf_idx] = all_image_lists[pdf_idx] = all_pdf_docs[pdf_idx] = None
+            yield doc_result
+
+    # 执行批处理
+    try:
+        if stage_pipeline_enable and batch_count > 1:
+            # 调用方处理已产出的文档时(如生成middle json)会访问pdfium，pdfium不是线程安全的；
+            # 渲染在本生成器的线程中进行(见StagePipeline.run)，不会与调用方同时访问pdfium
+            for batch_page, batch_image, batch_results in run_stage_pipeline(
+                range(batch_count), render_batch, formula_enable, table_enable, page_filters
+            ):
+                collect_batch(batch_page, batch_image, batch_results)
+                yield from pop_finished_docs()
+        else:
+            for index in range(batch_count):
+                batch_page, batch_image = render_batch(index)
+                infer_image, filter_plans = split_batch(batch_image, page_filters)
+                batch_results = merge_batch(
+                    filter_plans, batch_image_analyze(infer_image, formula_enable, table_enable), page_filters
+                )
+                collect_batch(batch_page, batch_image, batch_results)
+                yield from pop_finished_docs()
+        # 没有页面的文档不会被批处理取到，这里补齐它们的ocr设置
+        for _ in pages_info_iter:
+            pass
+        for page_filter in page_filters:
+            page_filter.log_stats()
+        if memory_budget is not None and memory_budget.spilled_pages > 0:
+            logger.info(f'page memory budget: {memory_budget.spilled_pages} pages spilled to {memory_budget.spill_dir}')
+        yield from pop_finished_docs()
+    finally:
+        if classify_executor is not None:
+            classify_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def doc_analyze_forked(
+        pdf_bytes_list,
+        lang_list,
+        parse_method: str = 'auto',
+        formula_enable=True,
+        table_enable=True,
+        cpu_workers=2,
+        threads_per_worker=1,
+):
+    """
+    多进程cpu推理：模型在父进程中加载一次，子进程fork后以写时复制的方式共享权重，
+    文档按页数均衡地分到cpu_workers个子进程，每个子进程用threads_per_worker个线程推理，
+    推理结果(包括ocr设置)回传父进程后按文档顺序产出，产出内容与doc_analyze_streaming相同。
+    不能安全地fork时(见fork_doc_shards)在单进程中推理。
+    """
+    from .worker_pool import fork_doc_shards
+
+    page_window_size = get_page_window_size()
+    memory_budget = get_page_memory_budget()
+    all_image_lists = []
+    all_pdf_docs = []
+    for pdf_bytes in pdf_bytes_list:
+        images_list, pdf_doc = open_images_from_pdf(pdf_bytes, window_size=page_window_size, memory_budget=memory_budget)
+        all_image_lists.append(images_list)
+        all_pdf_docs.append(pdf_doc)
+
+    def analyze_shard(doc_indices):
+        # 在子进程中执行，父进程中已打开的pdfium文档不能跨fork使用，这里重新打开
+        shard_results = []
+        for shard_pos, model_list, _, _, _, _ocr_enable in doc_analyze_streaming(
+            [reopen_document(all_pdf_docs[pdf_idx]) for pdf_idx in doc_indices],
+            [lang_list[pdf_idx] for pdf_idx in doc_indices],
+            parse_method, formula_enable, table_enable, render_workers=1, cpu_workers=1,
+        ):
+            shard_results.append((doc_indices[shard_pos], model_list, _ocr_enable))
+        return shard_results
+
+    shard_results_iter = fork_doc_shards(
+        analyze_shard, [len(images_list) for images_list in all_image_lists], lang_list,
+        formula_enable, table_enable, cpu_workers, threads_per_worker,
+    )
+    if shard_results_iter is None:
+        yield from doc_analyze_streaming(
+            all_pdf_docs, lang_list, parse_method, formula_enable, table_enable, cpu_workers=1,
         )
-        batch_results = batch_image_analyze(batch_image, formula_enable, table_enable)
-        results.extend(batch_results)
+        return
+
+    finished = {}
+    next_doc_idx = 0
+    for _, shard_results in shard_results_iter:
+        for pdf_idx, model_list, _ocr_enable in shard_results:
+            finished[pdf_idx] = (model_list, _ocr_enable)
+        while next_doc_idx in finished:
+            model_list, _ocr_enable = finished.pop(next_doc_idx)
+            yield (
+                next_doc_idx, model_list, all_image_lists[next_doc_idx], all_pdf_docs[next_doc_idx],
+                lang_list[next_doc_idx], _ocr_enable,
+            )
+            all_image_lists[next_doc_idx] = all_pdf_docs[next_doc_idx] = None
+            next_doc_idx += 1
 
-    # 构建返回结果
-    infer_results = []
 
-    for _ in range(len(pdf_bytes_list)):
-        infer_results.append([])
+# 文档的ocr设置与页面结果保存在同一目录下，以此代替页码
+OCR_ENABLE_CHECKPOINT_KEY = 'ocr_enable'
 
-    for i, page_info in enumerate(all_pages_info):
-        pdf_idx, page_idx, pil_img, _, _ = page_info
-        result = results[i]
 
-        page_info_dict = {'page_no': page_idx, 'width': pil_img.width, 'height': pil_img.height}
-        page_dict = {'layout_dets': result, 'page_info': page_info_dict}
+def get_page_checkpoint_tag(checkpoint_tag: str, lang: str) -> str:
+    """检查点的标签，语言不同的同一文档分别保存"""
+    return f'{checkpoint_tag}_{lang}'
 
-        infer_results[pdf_idx].append(page_dict)
 
-    return infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list
+def get_page_ocr_enable(ocr_enable: bool | list[bool], page_idx: int) -> bool:
+    """ocr_enable为整个文档的设置或逐页的列表，返回指定页面是否走ocr"""
+    if isinstance(ocr_enable, list):
+        return ocr_enable[page_idx]
+    return ocr_enable
+
+
+def get_page_filters() -> list:
+    """
+    推理前过滤页面的步骤，依次为空白页跳过与重复页去重。
+    MINERU_BLANK_PAGE_SKIP: 走OCR的空白页不经过模型直接得到空结果，默认关闭，设为true时开启
+    MINERU_BLANK_PAGE_INK_THRESHOLD: 任一通道低于该灰度值的像素视为墨迹，默认200
+    MINERU_BLANK_PAGE_MAX_INK_RATIO: 墨迹像素比例不超过该值的页面视为空白页，默认0.0002
+    MINERU_PAGE_DEDUP: 渲染结果完全相同的页面只推理一次，默认关闭，设为true时开启；
+        重复页直接使用第一页的layout_dets，适合包含大量重复封面、分隔页或模板页的批量文档
+    MINERU_PAGE_DEDUP_MAX_PAGES: 去重时最多记住的不同页面数，默认10000
+    """
+    page_filters = []
+    if os.environ.get('MINERU_BLANK_PAGE_SKIP', 'false').lower() == 'true':
+        from .blank_page import BlankPageFilter
+        page_filters.append(BlankPageFilter(
+            ink_threshold=int(os.environ.get('MINERU_BLANK_PAGE_INK_THRESHOLD', 200)),
+            max_ink_ratio=float(os.environ.get('MINERU_BLANK_PAGE_MAX_INK_RATIO', 0.0002)),
+        ))
+    if os.environ.get('MINERU_PAGE_DEDUP', 'false').lower() == 'true':
+        from .page_dedup import PageDedup
+        page_filters.append(PageDedup(int(os.environ.get('MINERU_PAGE_DEDUP_MAX_PAGES', 10000))))
+    return page_filters
+
+
+def split_batch(batch_image: list, page_filters: list) -> tuple[list, list]:
+    """依次用各过滤步骤去掉不需要推理的页面，返回(需要推理的页面, 各步骤的合并计划)"""
+    filter_plans = []
+    for page_filter in page_filters:
+        batch_image, plan = page_filter.split(batch_image)
+        filter_plans.append(plan)
+    return batch_image, filter_plans
+
+
+def merge_batch(filter_plans: list, batch_results: list, page_filters: list) -> list:
+    """按与split_batch相反的顺序把推理结果映射回原批次的每一页"""
+    for page_filter, plan in zip(reversed(page_filters), reversed(filter_plans)):
+        batch_results = page_filter.merge(plan, batch_results)
+    return batch_results
+
+
+def run_stage_pipeline(batch_indices, render_batch, formula_enable=True, table_enable=True, page_filters=None):
+    """
+    流水线执行：各模型阶段在各自的线程中运行，阶段之间用有界队列连接，
+    第N+1批的layout可以与第N批的OCR识别同时进行。按批次顺序产出(batch_page, batch_image, layout_dets列表)。
+    渲染(render_batch)在调用方的线程中进行，第一个队列有空位时才渲染下一批，与模型阶段重叠执行。
+    队列长度通过环境变量MINERU_STAGE_QUEUE_SIZE设置(默认2)，
+    各阶段线程数通过MINERU_STAGE_WORKERS设置，如"ocr_det=2,table=2"。
+    prepare、layout与mfd阶段不是线程安全的，固定为单线程。
+    提供page_filters(见get_page_filters)时，prepare阶段去掉空白页与重复页，只有其余页面进入模型阶段。
+    """
+    from .stage_pipeline import StagePipeline, parse_stage_workers
+
+    page_filters = page_filters or []
+    batch_model = get_batch_model(formula_enable, table_enable)
+    stage_workers = parse_stage_workers(os.getenv('MINERU_STAGE_WORKERS'))
+    single_thread_stages = {'prepare', 'layout', 'mfd'}
+    for stage in single_thread_stages:
+        if stage_workers.get(stage, 1) > 1:
+            logger.warning(f'stage {stage} is not thread safe, use 1 worker')
+            stage_workers[stage] = 1
+
+    def prepare_stage(item):
+        batch_page, batch_image = item
+        infer_image, filter_plans = split_batch(batch_image, page_filters)
+        # 空白页与重复页不进入模型阶段，计入prepare阶段的统计
+        pipeline.stats[0].add_skipped(len(batch_image) - len(infer_image))
+        return batch_page, batch_image, filter_plans, batch_model.prepare(infer_image)
+
+    def model_stage(stage):
+        def run(item):
+            batch_model.run_stage(stage, item[3])
+            return item
+        return run
+
+    stages = [('prepare', prepare_stage, 1)]
+    stages += [(stage, model_stage(stage), stage_workers.get(stage, 1)) for stage in batch_model.STAGES]
+    pipeline = StagePipeline(stages, queue_size=int(os.getenv('MINERU_STAGE_QUEUE_SIZE', 2)))
+    rendered_batches = (render_batch(index) for index in batch_indices)
+    for batch_page, batch_image, filter_plans, batch in pipeline.run(rendered_batches):
+        yield batch_page, batch_image, merge_batch(filter_plans, batch.images_layout_res, page_filters)
+    pipeline.log_report()
+
+    clean_memory(get_device())
 
 
 def batch_image_analyze(
-        images_with_extra_info: List[Tuple[PIL.Image.Image, bool, str]],
+        images_with_extra_info: List[Tuple[PageImage | PIL.Image.Image, bool, str]],
         formula_enable=True,
         table_enable=True):
     # os.environ['CUDA_VISIBLE_DEVICES'] = str(idx)
 
+    batch_model = get_batch_model(formula_enable, table_enable)
+    results = batch_model(images_with_extra_info)
+
+    clean_memory(get_device())
+
+    return results
+
+
+def get_batch_model(formula_enable=True, table_enable=True):
     from .batch_analyze import BatchAnalyze
 
     model_manager = ModelSingleton()
@@ -190,9 +585,33 @@ def batch_image_analyze(
             batch_ratio = 1
             logger.info(f'Could not determine GPU memory, using default batch_ratio: {batch_ratio}')
 
-    batch_model = BatchAnalyze(model_manager, batch_ratio, formula_enable, table_enable)
-    results = batch_model(images_with_extra_info)
+    batch_sizes = None
+    if os.getenv('MINERU_BATCH_AUTOTUNE', 'false').lower() == 'true':
+        # 按设备读取(或首次运行时测量)各阶段吞吐最优的batch大小，代替按显存估算的batch_ratio
+        from .batch_autotune import get_batch_sizes
+        model = model_manager.get_model(
+            lang=None, formula_enable=get_formula_enable(formula_enable), table_enable=get_table_enable(table_enable)
+        )
+        batch_sizes = get_batch_sizes(model, model.ocr_model, device)
+        if 'ocr_rec' in batch_sizes:
+            AtomModelSingleton().set_ocr_rec_batch_num(batch_sizes['ocr_rec'])
+
+    return BatchAnalyze(
+        model_manager, batch_ratio, formula_enable, table_enable,
+        batch_sizes=batch_sizes, ocr_det_mosaic=get_ocr_det_mosaic(),
+    )
 
-    clean_memory(get_device())
 
-    return results
\ No newline at end of file
+def get_ocr_det_mosaic():
+    """
+    OCR-det的crop拼图，默认关闭(逐个crop检测)，设置环境变量MINERU_OCR_DET_MOSAIC=true开启。
+    MINERU_OCR_DET_MOSAIC_SIZE: 画布边长，默认960(检测模型不缩放的最大边长)
+    MINERU_OCR_DET_MOSAIC_GUTTER: crop之间的白色间隔，默认16
+    """
+    if os.environ.get('MINERU_OCR_DET_MOSAIC', 'false').lower() != 'true':
+        return None
+    from .ocr_det_mosaic import OcrDetMosaic
+    return OcrDetMosaic(
+        canvas_size=int(os.environ.get('MINERU_OCR_DET_MOSAIC_SIZE', 960)),
+        gutter=int(os.environ.get('MINERU_OCR_DET_MOSAIC_GUTTER', 16)),
+    )
\ No newline at end of file
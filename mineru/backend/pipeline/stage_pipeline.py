@@ -0,0 +1,206 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator
+
+from loguru import logger
+
+_STOP = object()
+
+
+class StageStats:
+    """一个阶段的耗时统计，busy为处理耗时，wait_in/wait_out为等待上游/下游队列的耗时，
+    skipped为该阶段判定无需进入后续模型的条目数(如空白页、重复页)"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def add(self, busy: float, wait_in: float, wait_out: float):
+        with self._lock:
+            self.items += 1
+            self.busy += busy
+            self.wait_in += wait_in
+            self.wait_out += wait_out
+
+    def add_skipped(self, count: int):
+        with self._lock:
+            self.skipped += count
+
+    def to_dict(self, wall_time: float) -> dict:
+        capacity = max(wall_time * self.workers, 1e-9)
+        return {
+            'stage': self.name,
+            'workers': self.workers,
+            'items': self.items,
+            'skipped': self.skipped,
+            'busy_s': round(self.busy, 3),
+            'wait_input_s': round(self.wait_in, 3),
+            'wait_output_s': round(self.wait_out, 3),
+            'utilization': round(self.busy / capacity, 3),
+        }
+
+
+class StagePipeline:
+    """Run items through a chain of stages, each stage in its own worker threads.
+
+    Stages are connected by bounded queues, so while one batch is in a late
+    stage the next batches can already be in the earlier ones; the queue size
+    bounds how many batches are in flight between two stages. The model stages
+    spend most of their time in torch/onnx/opencv calls that release the GIL,
+    which is what lets them overlap. Results are yielded in input order.
+
+    ``items`` is consumed lazily in the caller's thread, whenever the first
+    queue has room. Producing an item (e.g. rendering pages with pdfium, which
+    is not thread safe) therefore still overlaps with the stage threads, but
+    never with the caller's own code between two results.
+
+    ``stages`` is a list of ``(name, fn, workers)``; ``fn`` receives the output
+    of the previous stage. A stage should only get more than one worker if its
+    function is thread safe.
+    """
+
+    def __init__(self, stages: list[tuple[str, Callable, int]], queue_size: int = 2):
+        self.stages = [(name, fn, max(1, workers)) for name, fn, workers in stages]
+        self.queue_size = max(1, queue_size)
+        self.stats = [StageStats(name, workers) for name, _, workers in self.stages]
+        self.wall_time = 0.0
+        self._stop = threading.Event()
+        self._error = None
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _fail(self, e: BaseException):
+        if self._error is None:
+            self._error = e
+        self._stop.set()
+
+    def _work(self, stage_index: int, in_q: queue.Queue, out_q: queue.Queue, remaining: list, lock: threading.Lock):
+        _, fn, _ = self.stages[stage_index]
+        stats = self.stats[stage_index]
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                packet = self._get(in_q)
+                if packet is _STOP:
+                    # 放回结束标记让同阶段的其他线程也能退出，最后一个线程通知下游
+                    self._put(in_q, _STOP)
+                    with lock:
+                        remaining[0] -= 1
+                        last = remaining[0] == 0
+                    if last:
+                        self._put(out_q, _STOP)
+                    return
+                busy_start = time.perf_counter()
+                seq, item = packet
+                result = fn(item)
+                put_start = time.perf_counter()
+                if not self._put(out_q, (seq, result)):
+                    return
+                stats.add(put_start - busy_start, busy_start - wait_start, time.perf_counter() - put_start)
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self, items: Iterable) -> Iterator:
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = []
+        for stage_index, (name, _, workers) in enumerate(self.stages):
+            remaining, lock = [workers], threading.Lock()
+            for worker_index in range(workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage_index, queues[stage_index], queues[stage_index + 1], remaining, lock),
+                    name=f'stage-{name}-{worker_index}',
+                    daemon=True,
+                ))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        items = iter(items)
+        feeding = True
+        fed_count = 0
+        try:
+            # 多线程的阶段可能乱序完成，按输入顺序输出
+            pending = {}
+            next_seq = 0
+            while True:
+                # 输入在调用方线程中取出，第一个队列有空位时才取下一个；只有本线程向其中放入条目
+                while feeding and not queues[0].full():
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        feeding = False
+                        queues[0].put(_STOP)
+                        break
+                    queues[0].put((fed_count, item))
+                    fed_count += 1
+                if self._stop.is_set():
+                    break
+                try:
+                    # 还有输入时短暂等待，以便及时补充第一个队列
+                    packet = queues[-1].get(timeout=0.02 if feeding else 0.1)
+                except queue.Empty:
+                    continue
+                if packet is _STOP:
+                    break
+                seq, result = packet
+                pending[seq] = result
+                while next_seq in pending:
+                    yield pending.pop(next_seq)
+                    next_seq += 1
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.wall_time = time.perf_counter() - start
+        if self._error is not None:
+            raise self._error
+
+    def report(self) -> list[dict]:
+        return [stats.to_dict(self.wall_time) for stats in self.stats]
+
+    def log_report(self):
+        logger.info(f'stage pipeline wall time: {round(self.wall_time, 2)}s')
+        for stage_report in self.report():
+            logger.info(
+                f"stage {stage_report['stage']:<8} workers: {stage_report['workers']}, "
+                f"items: {stage_report['items']}, skipped: {stage_report['skipped']}, busy: {stage_report['busy_s']}s, "
+                f"wait input: {stage_report['wait_input_s']}s, wait output: {stage_report['wait_output_s']}s, "
+                f"utilization: {stage_report['utilization']:.1%}"
+            )
+
+
+def parse_stage_workers(spec: str | None) -> dict[str, int]:
+    """解析形如"ocr_det=2,table=2"的各阶段线程数配置"""
+    stage_workers = {}
+    if not spec:
+        return stage_workers
+    for part in spec.split(','):
+        if '=' not in part:
+            continue
+        name, workers = part.split('=', 1)
+        stage_workers[name.strip()] = int(workers)
+    return stage_workers
@@ -0,0 +1,160 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from loguru import logger
+
+from mineru.utils.config_reader import get_device, get_formula_enable, get_table_enable
+
+# fork前设置，子进程通过继承的内存读取，任务和分片都不需要pickle
+_fork_task: Callable | None = None
+_fork_shards: list | None = None
+
+
+def can_fork_workers(device=None) -> bool:
+    """只有cpu推理且平台支持fork时才能让子进程以写时复制的方式共享父进程加载的模型"""
+    device = device or get_device()
+    return str(device) == 'cpu' and 'fork' in multiprocessing.get_all_start_methods()
+
+
+def shard_by_pages(page_counts: list[int], shard_count: int) -> list[list[int]]:
+    """
+    按页数把文档分到shard_count个分片，页数多的文档优先放入当前页数最少的分片，
+    每个分片内保持文档的原始顺序，不返回空分片
+    """
+    shards = [[] for _ in range(max(1, shard_count))]
+    shard_pages = [0] * len(shards)
+    for doc_idx in sorted(range(len(page_counts)), key=lambda idx: -page_counts[idx]):
+        shard_idx = shard_pages.index(min(shard_pages))
+        shards[shard_idx].append(doc_idx)
+        shard_pages[shard_idx] += page_counts[doc_idx]
+    return [sorted(shard) for shard in shards if shard]
+
+
+def get_native_thread_count() -> int | None:
+    """当前进程中不属于python的线程数(如OpenMP、MKL的线程池)，无法获取时返回None"""
+    try:
+        return len(os.listdir('/proc/self/task')) - threading.active_count()
+    except OSError:
+        return None
+
+
+def fork_is_safe() -> bool:
+    """
+    进程中有OpenMP等原生线程池时fork出的子进程可能在下一次并行计算时死锁，
+    只有父进程还没有执行过推理、没有创建原生线程时才fork
+    """
+    return get_native_thread_count() == 0
+
+
+@contextmanager
+def _torch_single_thread():
+    # 加载模型时个别初始化操作(如融合卷积层)会执行计算，单线程执行不会创建OpenMP线程池
+    import torch
+    num_threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(num_threads)
+
+
+def _tune_batch_sizes(model_config):
+    from mineru.backend.pipeline.pipeline_analyze import get_batch_model
+    get_batch_model(*model_config)
+
+
+def preload_models(lang_list, formula_enable=True, table_enable=True):
+    """
+    在父进程中加载推理会用到的全部模型，fork后子进程直接使用，不再各自加载一份。
+    父进程只加载模型不执行推理：开启自动调优且还没有保存的调优结果时，调优在一个单独的子进程中进行
+    """
+    from mineru.backend.pipeline.batch_autotune import load_batch_profile
+    from mineru.backend.pipeline.model_init import AtomModelSingleton
+    from mineru.backend.pipeline.pipeline_analyze import ModelSingleton, get_batch_model
+
+    with _torch_single_thread():
+        ModelSingleton().get_model(
+            lang=None, formula_enable=get_formula_enable(formula_enable), table_enable=get_table_enable(table_enable)
+        )
+        atom_model_manager = AtomModelSingleton()
+        for lang in dict.fromkeys(lang_list):
+            atom_model_manager.get_atom_model(atom_model_name='ocr', det_db_box_thresh=0.3, lang=lang)
+            if get_table_enable(table_enable):
+                atom_model_manager.get_atom_model(atom_model_name='table', lang=lang)
+    if os.getenv('MINERU_BATCH_AUTOTUNE', 'false').lower() == 'true' and load_batch_profile() is None:
+        for _ in run_forked(_tune_batch_sizes, [(formula_enable, table_enable)], os.cpu_count() or 1):
+            pass
+    # 开启自动调优时读取保存的batch配置
+    get_batch_model(formula_enable, table_enable)
+
+
+def fork_doc_shards(
+    task: Callable, page_counts: list[int], lang_list: list, formula_enable, table_enable,
+    cpu_workers: int, threads_per_worker: int,
+) -> Iterator[tuple[list[int], object]] | None:
+    """
+    多进程cpu推理的统一入口：文档按页数分成cpu_workers个分片，父进程加载模型后fork子进程，
+    每个子进程执行task(分片内的文档序号列表)，按完成顺序产出(文档序号列表, task结果)。
+    task应在子进程中重新打开分到的文档，不使用父进程中已打开的pdfium文档。
+    只有一个进程或一个文档、不是cpu推理、平台不支持fork，或父进程已有原生线程(已执行过推理)时返回None，
+    调用方退回单进程执行
+    """
+    if cpu_workers <= 1 or len(page_counts) <= 1:
+        return None
+    if not can_fork_workers():
+        logger.warning('cpu workers need the cpu device and fork support, fall back to a single process')
+        return None
+    if not fork_is_safe():
+        logger.warning('this process already runs native threads (e.g. after inference), '
+                       'fork is not safe, fall back to a single process')
+        return None
+    shards = shard_by_pages(page_counts, cpu_workers)
+    preload_models(lang_list, formula_enable, table_enable)
+    if not fork_is_safe():
+        logger.warning('loading the models started native threads, fork is not safe, fall back to a single process')
+        return None
+    return ((shards[shard_idx], result) for shard_idx, result in run_forked(task, shards, threads_per_worker))
+
+
+def _init_worker(threads_per_worker: int):
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    # 子进程内不再嵌套进程池
+    os.environ['MINERU_CPU_WORKERS'] = '1'
+    os.environ['MINERU_CLASSIFY_WORKERS'] = '1'
+    os.environ['MINERU_PDF_RENDER_WORKERS'] = '1'
+
+
+def _run_shard(shard_idx: int):
+    return _fork_task(_fork_shards[shard_idx])
+
+
+def run_forked(task: Callable, shards: list, threads_per_worker: int) -> Iterator[tuple[int, object]]:
+    """
+    每个分片在一个fork出的子进程中执行task(shard)，按完成顺序产出(shard_idx, result)。
+    调用前应先在父进程中加载好模型(见preload_models)，模型权重在子进程间写时复制共享；
+    task的返回值需要可以pickle。一般通过fork_doc_shards调用。
+    """
+    global _fork_task, _fork_shards
+    if _fork_task is not None:
+        raise RuntimeError('forked workers are already running')
+    _fork_task, _fork_shards = task, shards
+    executor = ProcessPoolExecutor(
+        max_workers=len(shards),
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=_init_worker,
+        initargs=(threads_per_worker,),
+    )
+    try:
+        futures = {executor.submit(_run_shard, shard_idx): shard_idx for shard_idx in range(len(shards))}
+        logger.info(f'run {len(shards)} cpu workers, {threads_per_worker} threads per worker')
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        _fork_task = _fork_shards = None
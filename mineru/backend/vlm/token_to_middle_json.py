@@ -2,21 +2,20 @@ import re
 
 from mineru.utils.cut_image import cut_image_and_table
 from mineru.utils.enum_class import BlockType, ContentType
-from mineru.utils.hash_utils import str_md5
 from mineru.backend.vlm.vlm_magic_model import MagicModel
 from mineru.version import __version__
 
 
-def token_to_page_info(token, image_dict, page, image_writer, page_index) -> dict:
+def token_to_page_info(token, page_image, page, image_writer, page_index) -> dict:
     """将token转换为页面信息"""
     # 解析token，提取坐标和类型
     # 假设token格式为：<|box_start|>x0 y0 x1 y1<|box_end|><|ref_start|>type<|ref_end|><|md_start|>content<|md_end|>
     # 这里需要根据实际的token格式进行解析
     # 提取所有完整块，每个块从<|box_start|>开始到<|md_end|>或<|im_end|>结束
 
-    scale = image_dict["scale"]
-    page_pil_img = image_dict["img_pil"]
-    page_img_md5 = str_md5(image_dict["img_base64"])
+    scale = page_image.scale
+    page_img = page_image.np_bgr
+    page_img_md5 = page_image.img_hash
     width, height = map(int, page.get_size())
 
     magic_model = MagicModel(token, width, height)
@@ -30,7 +29,7 @@ def token_to_page_info(token, image_dict, page, image_writer, page_index) -> dic
     # 对image/table/interline_equation的span截图
     for span in all_spans:
         if span["type"] in [ContentType.IMAGE, ContentType.TABLE, ContentType.INTERLINE_EQUATION]:
-            span = cut_image_and_table(span, page_pil_img, page_img_md5, page_index, image_writer, scale=scale)
+            span = cut_image_and_table(span, page_img, page_img_md5, page_index, image_writer, scale=scale)
 
     page_blocks = []
     page_blocks.extend([*image_blocks, *table_blocks, *title_blocks, *text_blocks, *interline_equation_blocks])
@@ -45,8 +44,8 @@ def result_to_middle_json(token_list, images_list, pdf_doc, image_writer):
     middle_json = {"pdf_info": [], "_backend":"vlm", "_version_name": __version__}
     for index, token in enumerate(token_list):
         page = pdf_doc[index]
-        image_dict = images_list[index]
-        page_info = token_to_page_info(token, image_dict, page, image_writer, index)
+        page_image = images_list[index]
+        page_info = token_to_page_info(token, page_image, page, image_writer, index)
         middle_json["pdf_info"].append(page_info)
     # 关闭pdf文档
     pdf_doc.close()
@@ -1,14 +1,19 @@
 # Copyright (c) Opendatalab. All rights reserved.
+import os
 import time
 
 from loguru import logger
 
 from ...data.data_reader_writer import DataWriter
+from mineru.utils.checkpoint import CheckpointStore, get_checkpoint_store
+from mineru.utils.config_reader import get_render_workers
 from mineru.utils.pdf_image_tools import load_images_from_pdf
+from mineru.utils.stage_timing import timed_stage
 from .base_predictor import BasePredictor
 from .predictor import get_predictor
 from .token_to_middle_json import result_to_middle_json
 from ...utils.models_download_utils import auto_download_and_get_model_root_path
+from ...version import __version__
 
 
 class ModelSingleton:
@@ -38,6 +43,42 @@ class ModelSingleton:
         return self._models[key]
 
 
+class VlmCheckpoint:
+    """
+    按页保存vlm的token输出，设置环境变量MINERU_CHECKPOINT_DIR后启用，
+    重新运行时已有结果的页面不再推理。未完成的页面按MINERU_CHECKPOINT_INTERVAL页(默认64)
+    分块推理，每块完成后立即保存
+    """
+
+    def __init__(self, store: CheckpointStore, pdf_doc, backend, model_path, server_url):
+        self.store = store
+        self.doc_hash = pdf_doc.doc_hash
+        self.page_ids = pdf_doc.page_ids
+        self.tag = store.make_tag('vlm', __version__, backend, model_path, server_url)
+        self.interval = max(1, int(os.getenv('MINERU_CHECKPOINT_INTERVAL', 64)))
+        self.results = [store.get(self.doc_hash, self.tag, page_id) for page_id in self.page_ids]
+        cached_count = sum(result is not None for result in self.results)
+        if cached_count > 0:
+            logger.info(f"checkpoint: {cached_count}/{len(self.results)} pages already inferred, skip them")
+
+    def pending_chunks(self):
+        pending = [page_idx for page_idx, result in enumerate(self.results) if result is None]
+        for start in range(0, len(pending), self.interval):
+            yield pending[start:start + self.interval]
+
+    def save(self, page_indices, results):
+        for page_idx, result in zip(page_indices, results):
+            self.results[page_idx] = result
+            self.store.put(self.doc_hash, self.tag, self.page_ids[page_idx], result)
+
+
+def get_vlm_checkpoint(pdf_doc, backend, model_path, server_url) -> VlmCheckpoint | None:
+    checkpoint_store = get_checkpoint_store()
+    if checkpoint_store is None:
+        return None
+    return VlmCheckpoint(checkpoint_store, pdf_doc, backend, model_path, server_url)
+
+
 def doc_analyze(
     pdf_bytes,
     image_writer: DataWriter | None,
@@ -45,22 +86,34 @@ def doc_analyze(
     backend="transformers",
     model_path: str | None = None,
     server_url: str | None = None,
+    render_workers: int | None = None,
 ):
     if predictor is None:
         predictor = ModelSingleton().get_model(backend, model_path, server_url)
 
     # load_images_start = time.time()
-    images_list, pdf_doc = load_images_from_pdf(pdf_bytes)
-    images_base64_list = [image_dict["img_base64"] for image_dict in images_list]
+    images_list, pdf_doc = load_images_from_pdf(pdf_bytes, render_workers=get_render_workers(render_workers))
     # load_images_time = round(time.time() - load_images_start, 2)
-    # logger.info(f"load images cost: {load_images_time}, speed: {round(len(images_base64_list)/load_images_time, 3)} images/s")
+    # logger.info(f"load images cost: {load_images_time}, speed: {round(len(images_list)/load_images_time, 3)} images/s")
 
     # infer_start = time.time()
-    results = predictor.batch_predict(images=images_base64_list)
+    checkpoint = get_vlm_checkpoint(pdf_doc, backend, model_path, server_url)
+    if checkpoint is None:
+        images_base64_list = [page_image.img_base64 for page_image in images_list]
+        with timed_stage('vlm_infer', len(images_base64_list)):
+            results = predictor.batch_predict(images=images_base64_list)
+    else:
+        # 只编码尚未推理的页面，按块编码
+        for page_indices in checkpoint.pending_chunks():
+            with timed_stage('vlm_infer', len(page_indices)):
+                chunk_results = predictor.batch_predict(images=[images_list[i].img_base64 for i in page_indices])
+            checkpoint.save(page_indices, chunk_results)
+        results = checkpoint.results
     # infer_time = round(time.time() - infer_start, 2)
     # logger.info(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
 
-    middle_json = result_to_middle_json(results, images_list, pdf_doc, image_writer)
+    with timed_stage('middle_json', len(results)):
+        middle_json = result_to_middle_json(results, images_list, pdf_doc, image_writer)
     return middle_json, results
 
 
@@ -71,19 +124,31 @@ async def aio_doc_analyze(
     backend="transformers",
     model_path: str | None = None,
     server_url: str | None = None,
+    render_workers: int | None = None,
 ):
     if predictor is None:
         predictor = ModelSingleton().get_model(backend, model_path, server_url)
 
     load_images_start = time.time()
-    images_list, pdf_doc = load_images_from_pdf(pdf_bytes)
-    images_base64_list = [image_dict["img_base64"] for image_dict in images_list]
+    images_list, pdf_doc = load_images_from_pdf(pdf_bytes, render_workers=get_render_workers(render_workers))
     load_images_time = round(time.time() - load_images_start, 2)
-    logger.info(f"load images cost: {load_images_time}, speed: {round(len(images_base64_list)/load_images_time, 3)} images/s")
+    logger.info(f"load images cost: {load_images_time}, speed: {round(len(images_list)/max(load_images_time, 0.01), 3)} images/s")
 
     infer_start = time.time()
-    results = await predictor.aio_batch_predict(images=images_base64_list)
+    checkpoint = get_vlm_checkpoint(pdf_doc, backend, model_path, server_url)
+    if checkpoint is None:
+        images_base64_list = [page_image.img_base64 for page_image in images_list]
+        with timed_stage('vlm_infer', len(images_base64_list)):
+            results = await predictor.aio_batch_predict(images=images_base64_list)
+    else:
+        # 只编码尚未推理的页面，按块编码
+        for page_indices in checkpoint.pending_chunks():
+            with timed_stage('vlm_infer', len(page_indices)):
+                chunk_results = await predictor.aio_batch_predict(images=[images_list[i].img_base64 for i in page_indices])
+            checkpoint.save(page_indices, chunk_results)
+        results = checkpoint.results
     infer_time = round(time.time() - infer_start, 2)
-    logger.info(f"infer finished, cost: {infer_time}, speed: {round(len(results)/infer_time, 3)} page/s")
-    middle_json = result_to_middle_json(results, images_list, pdf_doc, image_writer)
+    logger.info(f"infer finished, cost: {infer_time}, speed: {round(len(results)/max(infer_time, 0.01), 3)} page/s")
+    with timed_stage('middle_json', len(results)):
+        middle_json = result_to_middle_json(results, images_list, pdf_doc, image_writer)
     return middle_json
@@ -134,9 +134,23 @@ from .common import do_parse, read_fn, pdf_suffixes, image_suffixes
     """,
     default='huggingface',
 )
+@click.option(
+    '--cpu-workers',
+    'cpu_workers',
+    type=int,
+    help='Number of processes for cpu inference, documents are distributed among them and the models are loaded only once. Default is 1. Adapted only for the case where the backend is set to "pipeline" and the device is cpu. ',
+    default=None,
+)
+@click.option(
+    '--threads-per-worker',
+    'threads_per_worker',
+    type=int,
+    help='Number of torch threads for each cpu inference process. Default is the number of cpu cores divided by the number of processes. ',
+    default=None,
+)
 
 
-def main(input_path, output_dir, method, backend, lang, server_url, start_page_id, end_page_id, formula_enable, table_enable, device_mode, virtual_vram, model_source):
+def main(input_path, output_dir, method, backend, lang, server_url, start_page_id, end_page_id, formula_enable, table_enable, device_mode, virtual_vram, model_source, cpu_workers, threads_per_worker):
 
     if not backend.endswith('-client'):
         def get_device_mode() -> str:
@@ -159,6 +173,11 @@ def main(input_path, output_dir, method, backend, lang, server_url, start_page_i
         if os.getenv('MINERU_MODEL_SOURCE', None) is None:
             os.environ['MINERU_MODEL_SOURCE'] = model_source
 
+        if cpu_workers is not None:
+            os.environ['MINERU_CPU_WORKERS'] = str(cpu_workers)
+        if threads_per_worker is not None:
+            os.environ['MINERU_THREADS_PER_WORKER'] = str(threads_per_worker)
+
     os.makedirs(output_dir, exist_ok=True)
 
     def parse_doc(path_list: list[Path]):
@@ -168,7 +187,7 @@ def main(input_path, output_dir, method, backend, lang, server_url, start_page_i
             lang_list = []
             for path in path_list:
                 file_name = str(Path(path).stem)
-                pdf_bytes = read_fn(path)
+                pdf_bytes = read_fn(path, image_to_pdf=False)
                 file_name_list.append(file_name)
                 pdf_bytes_list.append(pdf_bytes)
                 lang_list.append(lang)
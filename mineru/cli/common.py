@@ -9,9 +9,11 @@ import pypdfium2 as pdfium
 from loguru import logger
 
 from mineru.data.data_reader_writer import FileBasedDataWriter
+from mineru.utils.config_reader import get_cpu_workers, get_threads_per_worker
+from mineru.utils.stage_timing import collect_stage_timing, timed_stage
 from mineru.utils.draw_bbox import draw_layout_bbox, draw_span_bbox
 from mineru.utils.enum_class import MakeMode
-from mineru.utils.pdf_image_tools import images_bytes_to_pdf_bytes
+from mineru.utils.pdf_image_tools import images_bytes_to_pdf_bytes, open_document
 from mineru.backend.vlm.vlm_middle_json_mkcontent import union_make as vlm_union_make
 from mineru.backend.vlm.vlm_analyze import doc_analyze as vlm_doc_analyze
 
@@ -19,12 +21,15 @@ pdf_suffixes = [".pdf"]
 image_suffixes = [".png", ".jpeg", ".jpg"]
 
 
-def read_fn(path):
+def read_fn(path, image_to_pdf=True):
+    """读取pdf或图片文件，image_to_pdf为False时图片保持原始字节，由do_parse直接按图片解析"""
     if not isinstance(path, Path):
         path = Path(path)
     with open(str(path), "rb") as input_file:
         file_bytes = input_file.read()
         if path.suffix in image_suffixes:
+            if not image_to_pdf:
+                return file_bytes
             return images_bytes_to_pdf_bytes(file_bytes)
         elif path.suffix in pdf_suffixes:
             return file_bytes
@@ -51,6 +56,11 @@ def convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id=0, end_page
         logger.warning("end_page_id is out of range, use pdf_docs length")
         end_page_id = len(pdf) - 1
 
+    # 选中整个文档时无需重新序列化
+    if start_page_id == 0 and end_page_id == len(pdf) - 1:
+        pdf.close()
+        return pdf_bytes
+
     # 创建一个新的PDF文档
     output_pdf = pdfium.PdfDocument.new()
 
@@ -93,76 +103,159 @@ def do_parse(
     f_make_md_mode=MakeMode.MM_MD,
     start_page_id=0,
     end_page_id=None,
+    cpu_workers=None,
+    threads_per_worker=None,
+    f_dump_timing=True,
+):
+    """
+    解析文档并输出结果，返回各阶段的耗时统计:
+    {"run": 整次调用的统计, "documents": {文件名: 单个文档的统计}}，
+    每个阶段包括耗时、条目数(页数等)与每秒处理的条目数，
+    f_dump_timing为True时每个文档的统计同时写入middle json旁的{文件名}_timing.json。
+    """
+    with collect_stage_timing() as run_timer:
+        documents_timing = {}
+        worker_reports = _do_parse(
+            output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, backend, parse_method, p_formula_enable,
+            p_table_enable, server_url, f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json,
+            f_dump_model_output, f_dump_orig_pdf, f_dump_content_list, f_make_md_mode, start_page_id, end_page_id,
+            cpu_workers, threads_per_worker, f_dump_timing, run_timer, documents_timing,
+        )
+    timing = {"backend": backend, "run": run_timer.report(), "documents": documents_timing}
+    if worker_reports:
+        # 多进程时各阶段在子进程中执行，子进程的统计按进程分别给出
+        timing["workers"] = [report["run"] for report in worker_reports]
+        for report in worker_reports:
+            documents_timing.update(report["documents"])
+    return timing
+
+
+def _do_parse(
+    output_dir, pdf_file_names, pdf_bytes_list, p_lang_list, backend, parse_method, p_formula_enable, p_table_enable,
+    server_url, f_draw_layout_bbox, f_draw_span_bbox, f_dump_md, f_dump_middle_json, f_dump_model_output,
+    f_dump_orig_pdf, f_dump_content_list, f_make_md_mode, start_page_id, end_page_id, cpu_workers,
+    threads_per_worker, f_dump_timing, run_timer, documents_timing,
 ):
-
     if backend == "pipeline":
 
-        from mineru.backend.pipeline.pipeline_middle_json_mkcontent import union_make as pipeline_union_make
-        from mineru.backend.pipeline.model_json_to_middle_json import result_to_middle_json as pipeline_result_to_middle_json
-        from mineru.backend.pipeline.pipeline_analyze import doc_analyze as pipeline_doc_analyze
-
-        for idx, pdf_bytes in enumerate(pdf_bytes_list):
-            new_pdf_bytes = convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id, end_page_id)
-            pdf_bytes_list[idx] = new_pdf_bytes
-
-        infer_results, all_image_lists, all_pdf_docs, lang_list, ocr_enabled_list = pipeline_doc_analyze(pdf_bytes_list, p_lang_list, parse_method=parse_method, formula_enable=p_formula_enable,table_enable=p_table_enable)
-
-        for idx, model_list in enumerate(infer_results):
-            model_json = copy.deepcopy(model_list)
-            pdf_file_name = pdf_file_names[idx]
-            local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
-            image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
-
-            images_list = all_image_lists[idx]
-            pdf_doc = all_pdf_docs[idx]
-            _lang = lang_list[idx]
-            _ocr_enable = ocr_enabled_list[idx]
-
-            middle_json = pipeline_result_to_middle_json(model_list, images_list, pdf_doc, image_writer, _lang, _ocr_enable, p_formula_enable)
-
-            pdf_info = middle_json["pdf_info"]
-
-            pdf_bytes = pdf_bytes_list[idx]
-            if f_draw_layout_bbox:
-                draw_layout_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf")
-
-            if f_draw_span_bbox:
-                draw_span_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf")
-
-            if f_dump_orig_pdf:
-                md_writer.write(
-                    f"{pdf_file_name}_origin.pdf",
-                    pdf_bytes,
+        cpu_workers = get_cpu_workers(cpu_workers)
+        if cpu_workers > 1 and len(pdf_bytes_list) > 1:
+            from mineru.backend.pipeline.worker_pool import fork_doc_shards
+
+            def parse_shard(doc_indices):
+                # 在子进程中执行，完整处理(推理、生成middle json与输出)分到的文档，文档从bytes重新打开
+                return do_parse(
+                    output_dir,
+                    [pdf_file_names[idx] for idx in doc_indices],
+                    [pdf_bytes_list[idx] for idx in doc_indices],
+                    [p_lang_list[idx] for idx in doc_indices],
+                    backend=backend,
+                    parse_method=parse_method,
+                    p_formula_enable=p_formula_enable,
+                    p_table_enable=p_table_enable,
+                    f_draw_layout_bbox=f_draw_layout_bbox,
+                    f_draw_span_bbox=f_draw_span_bbox,
+                    f_dump_md=f_dump_md,
+                    f_dump_middle_json=f_dump_middle_json,
+                    f_dump_model_output=f_dump_model_output,
+                    f_dump_orig_pdf=f_dump_orig_pdf,
+                    f_dump_content_list=f_dump_content_list,
+                    f_make_md_mode=f_make_md_mode,
+                    start_page_id=start_page_id,
+                    end_page_id=end_page_id,
+                    cpu_workers=1,
+                    f_dump_timing=f_dump_timing,
                 )
 
-            if f_dump_md:
-                image_dir = str(os.path.basename(local_image_dir))
-                md_content_str = pipeline_union_make(pdf_info, f_make_md_mode, image_dir)
-                md_writer.write_string(
-                    f"{pdf_file_name}.md",
-                    md_content_str,
-                )
-
-            if f_dump_content_list:
-                image_dir = str(os.path.basename(local_image_dir))
-                content_list = pipeline_union_make(pdf_info, MakeMode.CONTENT_LIST, image_dir)
-                md_writer.write_string(
-                    f"{pdf_file_name}_content_list.json",
-                    json.dumps(content_list, ensure_ascii=False, indent=4),
-                )
-
-            if f_dump_middle_json:
-                md_writer.write_string(
-                    f"{pdf_file_name}_middle.json",
-                    json.dumps(middle_json, ensure_ascii=False, indent=4),
-                )
-
-            if f_dump_model_output:
-                md_writer.write_string(
-                    f"{pdf_file_name}_model.json",
-                    json.dumps(model_json, ensure_ascii=False, indent=4),
-                )
+            page_counts = []
+            for pdf_bytes in pdf_bytes_list:
+                pdf_handle = open_document(pdf_bytes, start_page_id, end_page_id)
+                page_counts.append(len(pdf_handle))
+                pdf_handle.close()
+            shard_reports = fork_doc_shards(
+                parse_shard, page_counts, p_lang_list, p_formula_enable, p_table_enable,
+                cpu_workers, get_threads_per_worker(cpu_workers, threads_per_worker),
+            )
+            if shard_reports is not None:
+                return [report for _, report in shard_reports]
 
+        from mineru.backend.pipeline.pipeline_middle_json_mkcontent import union_make as pipeline_union_make
+        from mineru.backend.pipeline.model_json_to_middle_json import result_to_middle_json as pipeline_result_to_middle_json
+        from mineru.backend.pipeline.pipeline_analyze import doc_analyze_streaming as pipeline_doc_analyze_streaming
+
+        # 每个文档只打开一次，页码范围随句柄传递，只有导出原始pdf时才序列化；图片不转换为pdf直接解析
+        pdf_handles = [open_document(pdf_bytes, start_page_id, end_page_id) for pdf_bytes in pdf_bytes_list]
+
+        # 每个文档推理完成后立即输出，不必等待整批文档
+        for idx, model_list, images_list, pdf_doc, _lang, _ocr_enable in pipeline_doc_analyze_streaming(
+            pdf_handles, p_lang_list, parse_method=parse_method, formula_enable=p_formula_enable, table_enable=p_table_enable,
+            # 多进程在上面按文档分片处理，这里在单进程中推理
+            cpu_workers=1,
+        ):
+            with collect_stage_timing() as doc_timer:
+                model_json = copy.deepcopy(model_list)
+                pdf_file_name = pdf_file_names[idx]
+                local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
+                image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
+
+                with timed_stage("middle_json", len(model_list)):
+                    middle_json = pipeline_result_to_middle_json(model_list, images_list, pdf_doc, image_writer, _lang, _ocr_enable, p_formula_enable)
+
+                pdf_info = middle_json["pdf_info"]
+
+                pdf_handle = pdf_handles[idx]
+                # 输出后释放句柄持有的pdf字节
+                pdf_handles[idx] = None
+                with timed_stage("write"):
+                    if f_draw_layout_bbox:
+                        draw_layout_bbox(pdf_info, pdf_handle.pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf", pdf_handle.start_page_id)
+
+                    if f_draw_span_bbox:
+                        draw_span_bbox(pdf_info, pdf_handle.pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf", pdf_handle.start_page_id)
+
+                    if f_dump_orig_pdf:
+                        md_writer.write(
+                            f"{pdf_file_name}_origin.pdf",
+                            pdf_handle.to_bytes(),
+                        )
+
+                if f_dump_md:
+                    image_dir = str(os.path.basename(local_image_dir))
+                    with timed_stage("markdown", len(pdf_info)):
+                        md_content_str = pipeline_union_make(pdf_info, f_make_md_mode, image_dir)
+                    with timed_stage("write"):
+                        md_writer.write_string(
+                            f"{pdf_file_name}.md",
+                            md_content_str,
+                        )
+
+                if f_dump_content_list:
+                    image_dir = str(os.path.basename(local_image_dir))
+                    with timed_stage("markdown", len(pdf_info)):
+                        content_list = pipeline_union_make(pdf_info, MakeMode.CONTENT_LIST, image_dir)
+                    with timed_stage("write"):
+                        md_writer.write_string(
+                            f"{pdf_file_name}_content_list.json",
+                            json.dumps(content_list, ensure_ascii=False, indent=4),
+                        )
+
+                if f_dump_middle_json:
+                    with timed_stage("write"):
+                        md_writer.write_string(
+                            f"{pdf_file_name}_middle.json",
+                            json.dumps(middle_json, ensure_ascii=False, indent=4),
+                        )
+
+                if f_dump_model_output:
+                    with timed_stage("write"):
+                        md_writer.write_string(
+                            f"{pdf_file_name}_model.json",
+                            json.dumps(model_json, ensure_ascii=False, indent=4),
+                        )
+
+            documents_timing[pdf_file_name] = _dump_timing(
+                md_writer, pdf_file_name, backend, len(model_list), doc_timer, run_timer, f_dump_timing
+            )
             logger.info(f"local output dir is {local_md_dir}")
     else:
 
@@ -172,57 +265,91 @@ def do_parse(
         f_draw_span_bbox = False
         parse_method = "vlm"
         for idx, pdf_bytes in enumerate(pdf_bytes_list):
-            pdf_file_name = pdf_file_names[idx]
-            pdf_bytes = convert_pdf_bytes_to_bytes_by_pypdfium2(pdf_bytes, start_page_id, end_page_id)
-            local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
-            image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
-            middle_json, infer_result = vlm_doc_analyze(pdf_bytes, image_writer=image_writer, backend=backend, server_url=server_url)
-
-            pdf_info = middle_json["pdf_info"]
-
-            if f_draw_layout_bbox:
-                draw_layout_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf")
-
-            if f_draw_span_bbox:
-                draw_span_bbox(pdf_info, pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf")
-
-            if f_dump_orig_pdf:
-                md_writer.write(
-                    f"{pdf_file_name}_origin.pdf",
-                    pdf_bytes,
-                )
-
-            if f_dump_md:
-                image_dir = str(os.path.basename(local_image_dir))
-                md_content_str = vlm_union_make(pdf_info, f_make_md_mode, image_dir)
-                md_writer.write_string(
-                    f"{pdf_file_name}.md",
-                    md_content_str,
-                )
-
-            if f_dump_content_list:
-                image_dir = str(os.path.basename(local_image_dir))
-                content_list = vlm_union_make(pdf_info, MakeMode.CONTENT_LIST, image_dir)
-                md_writer.write_string(
-                    f"{pdf_file_name}_content_list.json",
-                    json.dumps(content_list, ensure_ascii=False, indent=4),
-                )
-
-            if f_dump_middle_json:
-                md_writer.write_string(
-                    f"{pdf_file_name}_middle.json",
-                    json.dumps(middle_json, ensure_ascii=False, indent=4),
-                )
-
-            if f_dump_model_output:
-                model_output = ("\n" + "-" * 50 + "\n").join(infer_result)
-                md_writer.write_string(
-                    f"{pdf_file_name}_model_output.txt",
-                    model_output,
-                )
-
+            with collect_stage_timing() as doc_timer:
+                pdf_file_name = pdf_file_names[idx]
+                pdf_handle = open_document(pdf_bytes, start_page_id, end_page_id)
+                local_image_dir, local_md_dir = prepare_env(output_dir, pdf_file_name, parse_method)
+                image_writer, md_writer = FileBasedDataWriter(local_image_dir), FileBasedDataWriter(local_md_dir)
+                middle_json, infer_result = vlm_doc_analyze(pdf_handle, image_writer=image_writer, backend=backend, server_url=server_url)
+
+                pdf_info = middle_json["pdf_info"]
+
+                with timed_stage("write"):
+                    if f_draw_layout_bbox:
+                        draw_layout_bbox(pdf_info, pdf_handle.pdf_bytes, local_md_dir, f"{pdf_file_name}_layout.pdf", pdf_handle.start_page_id)
+
+                    if f_draw_span_bbox:
+                        draw_span_bbox(pdf_info, pdf_handle.pdf_bytes, local_md_dir, f"{pdf_file_name}_span.pdf", pdf_handle.start_page_id)
+
+                    if f_dump_orig_pdf:
+                        md_writer.write(
+                            f"{pdf_file_name}_origin.pdf",
+                            pdf_handle.to_bytes(),
+                        )
+
+                if f_dump_md:
+                    image_dir = str(os.path.basename(local_image_dir))
+                    with timed_stage("markdown", len(pdf_info)):
+                        md_content_str = vlm_union_make(pdf_info, f_make_md_mode, image_dir)
+                    with timed_stage("write"):
+                        md_writer.write_string(
+                            f"{pdf_file_name}.md",
+                            md_content_str,
+                        )
+
+                if f_dump_content_list:
+                    image_dir = str(os.path.basename(local_image_dir))
+                    with timed_stage("markdown", len(pdf_info)):
+                        content_list = vlm_union_make(pdf_info, MakeMode.CONTENT_LIST, image_dir)
+                    with timed_stage("write"):
+                        md_writer.write_string(
+                            f"{pdf_file_name}_content_list.json",
+                            json.dumps(content_list, ensure_ascii=False, indent=4),
+                        )
+
+                if f_dump_middle_json:
+                    with timed_stage("write"):
+                        md_writer.write_string(
+                            f"{pdf_file_name}_middle.json",
+                            json.dumps(middle_json, ensure_ascii=False, indent=4),
+                        )
+
+                if f_dump_model_output:
+                    with timed_stage("write"):
+                        model_output = ("\n" + "-" * 50 + "\n").join(infer_result)
+                        md_writer.write_string(
+                            f"{pdf_file_name}_model_output.txt",
+                            model_output,
+                        )
+
+            documents_timing[pdf_file_name] = _dump_timing(
+                md_writer, pdf_file_name, f"vlm-{backend}", len(infer_result), doc_timer, doc_timer, f_dump_timing
+            )
             logger.info(f"local output dir is {local_md_dir}")
-
+    return None
+
+
+# 只属于单个文档的阶段；推理阶段跨文档组批执行，只在整次调用的统计中给出
+DOCUMENT_STAGES = ("middle_json", "para_split", "markdown", "write")
+
+
+def _dump_timing(md_writer, pdf_file_name, backend, page_count, doc_timer, run_timer, f_dump_timing):
+    """
+    单个文档的耗时统计。pipeline后端的推理阶段跨文档组批，统计中的run为截至该文档输出时整次调用的累计值；
+    vlm后端逐文档推理，run即为该文档的全部阶段
+    """
+    timing = {
+        "backend": backend,
+        "pages": page_count,
+        "document": doc_timer.report(DOCUMENT_STAGES),
+        "run": run_timer.report(),
+    }
+    if f_dump_timing:
+        md_writer.write_string(
+            f"{pdf_file_name}_timing.json",
+            json.dumps(timing, ensure_ascii=False, indent=4),
+        )
+    return timing
 
 
 if __name__ == "__main__":
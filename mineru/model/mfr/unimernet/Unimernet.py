@@ -1,4 +1,6 @@
+import numpy as np
 import torch
+from PIL import Image
 from torch.utils.data import DataLoader, Dataset
 from tqdm import tqdm
 
@@ -70,7 +72,7 @@ class UnimernetModel(object):
         # Collect images with their original indices
         for image_index in range(len(images_mfd_res)):
             mfd_res = images_mfd_res[image_index]
-            pil_img = images[image_index]
+            page_img = images[image_index]
             formula_list = []
 
             for idx, (xyxy, conf, cla) in enumerate(zip(
@@ -84,7 +86,12 @@ class UnimernetModel(object):
                     "latex": "",
                 }
                 formula_list.append(new_item)
-                bbox_img = pil_img.crop((xmin, ymin, xmax, ymax))
+                if isinstance(page_img, np.ndarray):
+                    # BGR页面数组上裁剪视图，转换为RGB的PIL图像时只拷贝一次；
+                    # 识别模型的预处理按PIL图像调校，仍然输入PIL图像
+                    bbox_img = Image.fromarray(np.ascontiguousarray(page_img[ymin:ymax, xmin:xmax, ::-1]))
+                else:
+                    bbox_img = page_img.crop((xmin, ymin, xmax, ymax))
                 area = (xmax - xmin) * (ymax - ymin)
 
                 curr_idx = len(mf_image_list)
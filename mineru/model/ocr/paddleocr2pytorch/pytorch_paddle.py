@@ -12,7 +12,10 @@ from loguru import logger
 from mineru.utils.config_reader import get_device
 from mineru.utils.enum_class import ModelPath
 from mineru.utils.models_download_utils import auto_download_and_get_model_root_path
-from ....utils.ocr_utils import check_img, preprocess_image, sorted_boxes, merge_det_boxes, update_det_boxes, get_rotate_crop_image
+from mineru.utils.stage_timing import count_stage
+from ....utils.ocr_utils import check_img, preprocess_image, sorted_boxes, merge_det_boxes, update_det_boxes, \
+    get_rotate_crop_image, get_preprocess_pool
+from .rec_cache import get_rec_cache
 from .tools.infer.predict_system import TextSystem
 from .tools.infer import pytorchocr_utility as utility
 import argparse
@@ -144,11 +147,38 @@ class PytorchPaddleOCR(TextSystem):
                     if not isinstance(img, list):
                         img = preprocess_image(img)
                         img = [img]
-                    rec_res, elapse = self.text_recognizer(img, tqdm_enable=tqdm_enable)
+                    rec_res, elapse = self.recognize(img, tqdm_enable=tqdm_enable)
                     # logger.debug("rec_res num  : {}, elapsed : {}".format(len(rec_res), elapse))
                     ocr_res.append(rec_res)
                 return ocr_res
 
+    def recognize(self, img_crop_list, tqdm_enable=False):
+        """识别文本行，与之前识别过的文本行像素完全相同时直接使用缓存的结果，同一批中相同的文本行只识别一次"""
+        rec_cache = get_rec_cache()
+        if rec_cache is None or len(img_crop_list) == 0:
+            return self.text_recognizer(img_crop_list, tqdm_enable=tqdm_enable)
+
+        model_key = f"{self.lang}|{self.text_recognizer.weights_path}"
+        keys = [rec_cache.crop_key(img_crop, model_key) for img_crop in img_crop_list]
+        rec_res = [rec_cache.get(key) for key in keys]
+        missing = {}
+        for index, (key, result) in enumerate(zip(keys, rec_res)):
+            if result is None:
+                missing.setdefault(key, []).append(index)
+
+        elapse = 0
+        if missing:
+            missing_keys = list(missing)
+            missing_res, elapse = self.text_recognizer(
+                [img_crop_list[missing[key][0]] for key in missing_keys], tqdm_enable=tqdm_enable
+            )
+            for key, result in zip(missing_keys, missing_res):
+                rec_cache.put(key, result)
+                for index in missing[key]:
+                    rec_res[index] = tuple(result)
+        count_stage({'cache_lookups': len(keys), 'cache_hits': len(keys) - len(missing)})
+        return rec_res, elapse
+
     def __call__(self, img, mfd_res=None):
 
         if img is None:
@@ -174,12 +204,17 @@ class PytorchPaddleOCR(TextSystem):
         if mfd_res:
             dt_boxes = update_det_boxes(dt_boxes, mfd_res)
 
-        for bno in range(len(dt_boxes)):
-            tmp_box = copy.deepcopy(dt_boxes[bno])
-            img_crop = get_rotate_crop_image(ori_im, tmp_box)
-            img_crop_list.append(img_crop)
+        pool = get_preprocess_pool(self.text_recognizer.rec_preprocess_workers) if len(dt_boxes) > 1 else None
+        tmp_boxes = [copy.deepcopy(dt_boxes[bno]) for bno in range(len(dt_boxes))]
+        if pool is not None:
+            # 透视变换裁剪时cv2释放GIL，多个文本框并行裁剪
+            img_crop_list = list(pool.map(get_rotate_crop_image, [ori_im] * len(tmp_boxes), tmp_boxes))
+        else:
+            for tmp_box in tmp_boxes:
+                img_crop = get_rotate_crop_image(ori_im, tmp_box)
+                img_crop_list.append(img_crop)
 
-        rec_res, elapse = self.text_recognizer(img_crop_list)
+        rec_res, elapse = self.recognize(img_crop_list)
         # logger.debug("rec_res num  : {}, elapsed : {}".format(len(rec_res), elapse))
 
         filter_boxes, filter_rec_res = [], []
@@ -9,6 +9,7 @@ from __future__ import print_function
 import numpy as np
 import cv2
 import torch
+import shapely
 from shapely.geometry import Polygon
 import pyclipper
 
@@ -44,52 +45,83 @@ class DBPostProcess(object):
         _bitmap: single map with shape (1, H, W),
                 whose values are binarized as {0, 1}
         '''
+        return self.boxes_from_bitmaps([pred], [_bitmap], [(dest_width, dest_height)])[0]
 
-        bitmap = _bitmap
-        height, width = bitmap.shape
+    def boxes_from_bitmaps(self, preds, bitmaps, dest_sizes):
+        '''
+        Same result as boxes_from_bitmap for every image, but the contours of
+        all images are ordered, scored, filtered and expanded together with
+        array operations; only cv2.minAreaRect and the pyclipper offset remain
+        per contour.
+        dest_sizes: [(dest_width, dest_height), ...]
+        returns: [(boxes, scores), ...]
+        '''
+        rects = []
+        contour_list = []
+        image_index = []
+        for index, bitmap in enumerate(bitmaps):
+            outs = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST,
+                                    cv2.CHAIN_APPROX_SIMPLE)
+            if len(outs) == 3:
+                img, contours, _ = outs[0], outs[1], outs[2]
+            elif len(outs) == 2:
+                contours, _ = outs[0], outs[1]
+            for contour in contours[:self.max_candidates]:
+                rects.append(cv2.minAreaRect(contour))
+                contour_list.append(contour)
+                image_index.append(index)
 
-        outs = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST,
-                                cv2.CHAIN_APPROX_SIMPLE)
-        if len(outs) == 3:
-            img, contours, _ = outs[0], outs[1], outs[2]
-        elif len(outs) == 2:
-            contours, _ = outs[0], outs[1]
+        results = [(np.array([], dtype=np.int16), []) for _ in bitmaps]
+        if not rects:
+            return results
+        image_index = np.array(image_index)
 
-        num_contours = min(len(contours), self.max_candidates)
+        points, ssides = self.get_mini_boxes_batch(rects)
+        keep = ssides >= self.min_size
 
-        boxes = []
-        scores = []
-        for index in range(num_contours):
-            contour = contours[index]
-            points, sside = self.get_mini_boxes(contour)
-            if sside < self.min_size:
+        scores = np.zeros(len(rects), dtype=np.float64)
+        for index, pred in enumerate(preds):
+            box_ids = np.flatnonzero(keep & (image_index == index))
+            if len(box_ids) == 0:
                 continue
-            points = np.array(points)
             if self.score_mode == "fast":
-                score = self.box_score_fast(pred, points.reshape(-1, 2))
+                scores[box_ids] = self.box_scores_fast(pred, points[box_ids])
             else:
-                score = self.box_score_slow(pred, contour)
-            if self.box_thresh > score:
-                continue
+                for box_id in box_ids:
+                    scores[box_id] = self.box_score_slow(pred, contour_list[box_id])
+        keep &= ~(self.box_thresh > scores)
+
+        box_ids = np.flatnonzero(keep)
+        if len(box_ids) == 0:
+            return results
+        polygons = shapely.polygons(points[box_ids].astype(np.float64))
+        distances = shapely.area(polygons) * self.unclip_ratio / shapely.length(polygons)
+        expanded_rects = []
+        for box_id, distance in zip(box_ids, distances):
+            expanded_rects.append(cv2.minAreaRect(
+                self.unclip(points[box_id], distance).reshape(-1, 1, 2)
+            ))
+        boxes, ssides = self.get_mini_boxes_batch(expanded_rects)
+        box_keep = ssides >= self.min_size + 2
+        box_ids, boxes = box_ids[box_keep], boxes[box_keep]
 
-            box = self.unclip(points).reshape(-1, 1, 2)
-            box, sside = self.get_mini_boxes(box)
-            if sside < self.min_size + 2:
+        for index, (dest_width, dest_height) in enumerate(dest_sizes):
+            in_image = image_index[box_ids] == index
+            if not in_image.any():
                 continue
-            box = np.array(box)
-
-            box[:, 0] = np.clip(
-                np.round(box[:, 0] / width * dest_width), 0, dest_width)
-            box[:, 1] = np.clip(
-                np.round(box[:, 1] / height * dest_height), 0, dest_height)
-            boxes.append(box.astype(np.int16))
-            scores.append(score)
-        return np.array(boxes, dtype=np.int16), scores
-
-    def unclip(self, box):
-        unclip_ratio = self.unclip_ratio
-        poly = Polygon(box)
-        distance = poly.area * unclip_ratio / poly.length
+            height, width = bitmaps[index].shape
+            image_boxes = boxes[in_image]
+            image_boxes[..., 0] = np.clip(
+                np.round(image_boxes[..., 0] / width * dest_width), 0, dest_width)
+            image_boxes[..., 1] = np.clip(
+                np.round(image_boxes[..., 1] / height * dest_height), 0, dest_height)
+            results[index] = (image_boxes.astype(np.int16), scores[box_ids[in_image]].tolist())
+        return results
+
+    def unclip(self, box, distance=None):
+        if distance is None:
+            poly = Polygon(box)
+            distance = poly.area * self.unclip_ratio / poly.length
         offset = pyclipper.PyclipperOffset()
         offset.AddPath(box, pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
         expanded = np.array(offset.Execute(distance))
@@ -118,6 +150,68 @@ class DBPostProcess(object):
         ]
         return box, min(bounding_box[1])
 
+    @staticmethod
+    def get_mini_boxes_batch(rects):
+        '''
+        get_mini_boxes for a list of cv2.minAreaRect results,
+        returns boxes (N, 4, 2) float32 and the short sides (N,)
+        '''
+        points = np.stack([cv2.boxPoints(rect) for rect in rects])
+        points = np.take_along_axis(points, np.argsort(points[..., 0], axis=1, kind='stable')[..., None], axis=1)
+        rows = np.arange(len(points))
+        left_first = points[:, 1, 1] > points[:, 0, 1]
+        right_first = points[:, 3, 1] > points[:, 2, 1]
+        index_1 = np.where(left_first, 0, 1)
+        index_4 = 1 - index_1
+        index_2 = np.where(right_first, 2, 3)
+        index_3 = 5 - index_2
+        boxes = np.stack([
+            points[rows, index_1], points[rows, index_2], points[rows, index_3], points[rows, index_4]
+        ], axis=1)
+        ssides = np.array([min(rect[1]) for rect in rects])
+        return boxes, ssides
+
+    def box_scores_fast(self, bitmap, boxes):
+        '''
+        box_score_fast for all boxes (N, 4, 2) of one image: the boxes are
+        rasterized into one label map and the means taken with np.bincount.
+        A pixel can carry only one label, so boxes whose integer bounding boxes
+        intersect another box's are scored one by one with box_score_fast.
+        '''
+        h, w = bitmap.shape[:2]
+        scores = np.zeros(len(boxes), dtype=np.float64)
+        # 与box_score_fast相同，坐标向零取整后填充，填充的像素都在取整后坐标的外接矩形内
+        polys = boxes.astype(np.int32)
+        xmin = np.clip(polys[..., 0].min(axis=1), 0, w - 1)
+        xmax = np.clip(polys[..., 0].max(axis=1), 0, w - 1)
+        ymin = np.clip(polys[..., 1].min(axis=1), 0, h - 1)
+        ymax = np.clip(polys[..., 1].max(axis=1), 0, h - 1)
+        overlap = (
+            (xmin[:, None] <= xmax[None, :]) & (xmin[None, :] <= xmax[:, None]) &
+            (ymin[:, None] <= ymax[None, :]) & (ymin[None, :] <= ymax[:, None])
+        )
+        np.fill_diagonal(overlap, False)
+        overlapped = overlap.any(axis=1)
+
+        for box_id in np.flatnonzero(overlapped):
+            scores[box_id] = self.box_score_fast(bitmap, boxes[box_id])
+
+        box_ids = np.flatnonzero(~overlapped)
+        if len(box_ids) > 0:
+            # 只在这些框的外接矩形范围内统计
+            x0, x1 = xmin[box_ids].min(), xmax[box_ids].max() + 1
+            y0, y1 = ymin[box_ids].min(), ymax[box_ids].max() + 1
+            labels = np.zeros((y1 - y0, x1 - x0), dtype=np.int32)
+            offset = np.array([x0, y0], dtype=np.int32)
+            for label, box_id in enumerate(box_ids, 1):
+                cv2.fillPoly(labels, (polys[box_id] - offset)[None], label)
+            pixels = labels > 0
+            labels = labels[pixels]
+            sums = np.bincount(labels, weights=bitmap[y0:y1, x0:x1][pixels], minlength=len(box_ids) + 1)[1:]
+            counts = np.bincount(labels, minlength=len(box_ids) + 1)[1:]
+            scores[box_ids] = sums / np.maximum(counts, 1)
+        return scores
+
     def box_score_fast(self, bitmap, _box):
         '''
         box_score_fast: use bbox mean score as the mean score
@@ -163,7 +257,8 @@ class DBPostProcess(object):
         pred = pred[:, 0, :, :]
         segmentation = pred > self.thresh
 
-        boxes_batch = []
+        masks = []
+        dest_sizes = []
         for batch_index in range(pred.shape[0]):
             src_h, src_w, ratio_h, ratio_w = shape_list[batch_index]
             if self.dilation_kernel is not None:
@@ -172,8 +267,10 @@ class DBPostProcess(object):
                     self.dilation_kernel)
             else:
                 mask = segmentation[batch_index]
-            boxes, scores = self.boxes_from_bitmap(pred[batch_index], mask,
-                                                   src_w, src_h)
+            masks.append(mask)
+            dest_sizes.append((src_w, src_h))
 
+        boxes_batch = []
+        for boxes, scores in self.boxes_from_bitmaps(pred, masks, dest_sizes):
             boxes_batch.append({'points': boxes})
         return boxes_batch
\ No newline at end of file
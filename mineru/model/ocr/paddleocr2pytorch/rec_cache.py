@@ -0,0 +1,78 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RecResultCache:
+    """LRU cache of text recognition results keyed by crop content.
+
+    Running headers, footers, page numbers and repeated table labels yield
+    many pixel-identical text-line crops. The key is a blake2b digest of the
+    crop bytes together with its shape and a model key (language and
+    recognition model), so a crop is only reused for the same model. Values
+    are ``(text, score)`` tuples. At most ``max_items`` results are kept,
+    the least recently used are dropped first.
+    """
+
+    def __init__(self, max_items: int = 50000):
+        self.max_items = max_items
+        self.lookups = 0
+        self.hits = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def crop_key(img: np.ndarray, model_key: str) -> bytes:
+        hasher = hashlib.blake2b(digest_size=16)
+        hasher.update(f"{img.shape}|{img.dtype}|{model_key}".encode("utf-8"))
+        hasher.update(memoryview(np.ascontiguousarray(img)).cast("B"))
+        return hasher.digest()
+
+    def get(self, key: bytes):
+        with self._lock:
+            self.lookups += 1
+            result = self._results.get(key)
+            if result is not None:
+                self.hits += 1
+                self._results.move_to_end(key)
+            return result
+
+    def put(self, key: bytes, result):
+        with self._lock:
+            self._results[key] = tuple(result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_items:
+                self._results.popitem(last=False)
+
+    def reset_lock(self):
+        self._lock = threading.Lock()
+
+
+_rec_cache: RecResultCache | None = None
+
+
+def get_rec_cache() -> RecResultCache | None:
+    """
+    进程内共用的识别结果缓存，可通过环境变量MINERU_OCR_REC_CACHE=false关闭，
+    MINERU_OCR_REC_CACHE_SIZE: 最多缓存的文本行数，默认50000
+    """
+    global _rec_cache
+    if os.getenv('MINERU_OCR_REC_CACHE', 'true').lower() != 'true':
+        return None
+    if _rec_cache is None:
+        _rec_cache = RecResultCache(int(os.getenv('MINERU_OCR_REC_CACHE_SIZE', 50000)))
+    return _rec_cache
+
+
+def _reset_after_fork():
+    # fork时可能有其他线程持有锁，子进程中重新创建
+    if _rec_cache is not None:
+        _rec_cache.reset_lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -189,18 +189,27 @@ class TextDetector(BaseOCRV20):
         batch_results = []
         total_elapse = time.time() - starttime
 
+        if self.det_algorithm in ['DB', 'DB++']:
+            # DB后处理一次处理整个批次的所有轮廓
+            post_results = self.postprocess_op(preds, batch_shapes)
+        else:
+            post_results = None
+
         for i in range(len(img_list)):
-            # 提取单个图像的预测结果
-            single_preds = {}
-            for key, value in preds.items():
-                if isinstance(value, np.ndarray):
-                    single_preds[key] = value[i:i + 1]  # 保持批次维度
-                else:
-                    single_preds[key] = value
-
-            # 后处理
-            post_result = self.postprocess_op(single_preds, batch_shapes[i:i + 1])
-            dt_boxes = post_result[0]['points']
+            if post_results is not None:
+                dt_boxes = post_results[i]['points']
+            else:
+                # 提取单个图像的预测结果
+                single_preds = {}
+                for key, value in preds.items():
+                    if isinstance(value, np.ndarray):
+                        single_preds[key] = value[i:i + 1]  # 保持批次维度
+                    else:
+                        single_preds[key] = value
+
+                # 后处理
+                post_result = self.postprocess_op(single_preds, batch_shapes[i:i + 1])
+                dt_boxes = post_result[0]['points']
 
             # 过滤和裁剪检测框
             if (self.det_algorithm == "SAST" and
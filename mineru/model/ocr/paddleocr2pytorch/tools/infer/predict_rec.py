@@ -1,3 +1,7 @@
+import os
+import threading
+from concurrent.futures import wait
+
 from PIL import Image
 import cv2
 import numpy as np
@@ -6,6 +10,7 @@ import time
 import torch
 from tqdm import tqdm
 
+from mineru.utils.ocr_utils import get_preprocess_pool
 from ...pytorchocr.base_ocr_v20 import BaseOCRV20
 from . import pytorchocr_utility as utility
 from ...pytorchocr.postprocess import build_post_process
@@ -17,6 +22,15 @@ class TextRecognizer(BaseOCRV20):
         self.rec_image_shape = [int(v) for v in args.rec_image_shape.split(",")]
         self.character_type = args.rec_char_type
         self.rec_batch_num = args.rec_batch_num
+        # 按宽度分桶组batch时每个batch的像素预算(batch*高*宽)，为0时按rec_batch_num张最大宽度的文本行计算
+        self.rec_batch_pixels = args.rec_batch_pixels
+        self.rec_width_bucket = args.rec_width_bucket
+        # 预处理线程数，为负数时自动选择，为0时在推理线程中串行预处理
+        self.rec_preprocess_workers = args.rec_preprocess_workers
+        if self.rec_preprocess_workers < 0:
+            self.rec_preprocess_workers = min(4, os.cpu_count() or 1)
+        # 识别时复用的输入缓冲区，每个线程两块，推理一块的同时预处理另一块(表格和文本的识别可能在不同线程中同时进行)
+        self._input_buffers = threading.local()
         self.rec_algorithm = args.rec_algorithm
         self.max_text_length = args.max_text_length
         postprocess_params = {
@@ -144,6 +158,132 @@ class TextRecognizer(BaseOCRV20):
         padding_im[:, :, 0:resized_w] = resized_image
         return padding_im
 
+    def get_rec_width(self, img):
+        """文本行按高度缩放到imgH后的宽度，与resize_norm_img中的计算相同"""
+        imgH = self.rec_image_shape[1]
+        h, w = img.shape[:2]
+        ratio = w / float(h)
+        return max(math.ceil(imgH * ratio), self.limited_min_width)
+
+    def get_rec_batch_pixels(self):
+        if self.rec_batch_pixels > 0:
+            return self.rec_batch_pixels
+        return self.rec_batch_num * self.rec_image_shape[1] * self.limited_max_width
+
+    def get_bucket_width(self, rec_width):
+        """补齐后的输入宽度，向上取整到rec_width_bucket的倍数，不小于模型的默认宽度"""
+        imgW = self.rec_image_shape[2]
+        step = max(1, self.rec_width_bucket)
+        bucket_width = max(imgW, -(-rec_width // step) * step)
+        return max(min(bucket_width, self.limited_max_width), self.limited_min_width)
+
+    def schedule_batches(self, img_list):
+        """
+        Form batches over the crops sorted by width, each one as large as the
+        pixel budget allows at its padded (bucket) width, so narrow crops go in
+        large batches and wide ones in small batches.
+        returns: [(bucket_width, [crop index, ...]), ...]
+        """
+        imgH = self.rec_image_shape[1]
+        budget = self.get_rec_batch_pixels()
+        rec_widths = [self.get_rec_width(img) for img in img_list]
+        batches = []
+        indices = []
+        bucket_width = 0
+        for index in sorted(range(len(img_list)), key=lambda idx: rec_widths[idx]):
+            width = self.get_bucket_width(rec_widths[index])
+            if indices and (len(indices) + 1) * imgH * width > budget:
+                batches.append((bucket_width, indices))
+                indices = []
+            indices.append(index)
+            bucket_width = width
+        if indices:
+            batches.append((bucket_width, indices))
+        return batches
+
+    def get_input_buffer(self, batch_size, width, slot=0):
+        """
+        连续的输入缓冲区，按batch的形状取前面一段，大小为像素预算，
+        cuda上使用锁页内存，不够用时重新分配
+        """
+        imgC, imgH, _ = self.rec_image_shape
+        size = batch_size * imgC * imgH * width
+        buffers = getattr(self._input_buffers, 'slots', None)
+        if buffers is None:
+            buffers = self._input_buffers.slots = [None, None]
+        if buffers[slot] is None or buffers[slot].size < size:
+            alloc_size = max(size, imgC * self.get_rec_batch_pixels())
+            if str(self.device).startswith('cuda'):
+                buffers[slot] = torch.empty(alloc_size, dtype=torch.float32).pin_memory().numpy()
+            else:
+                buffers[slot] = np.empty(alloc_size, dtype=np.float32)
+        return buffers[slot][:size].reshape(batch_size, imgC, imgH, width)
+
+    def prepare_batch(self, img_list, batch, slot, pool=None):
+        """把一个batch的文本行预处理到slot对应的缓冲区，有线程池时异步执行，返回(缓冲区, futures)"""
+        bucket_width, indices = batch
+        norm_img_batch = self.get_input_buffer(len(indices), bucket_width, slot)
+        futures = []
+        for buffer_index, img_index in enumerate(indices):
+            if pool is None:
+                self.resize_norm_img_into(img_list[img_index], norm_img_batch[buffer_index])
+            else:
+                futures.append(pool.submit(self.resize_norm_img_into, img_list[img_index], norm_img_batch[buffer_index]))
+        return norm_img_batch, futures
+
+    def resize_norm_img_into(self, img, out):
+        """resize_norm_img写入out(imgC, imgH, 桶宽度)，右侧补0"""
+        imgC, imgH, _ = self.rec_image_shape
+        assert imgC == img.shape[2]
+        resized_w = min(self.get_rec_width(img), out.shape[2])
+        resized_image = cv2.resize(img, (resized_w, imgH))
+        norm_img = out[:, :, :resized_w]
+        norm_img[...] = resized_image.transpose((2, 0, 1))
+        norm_img /= 255
+        norm_img -= 0.5
+        norm_img /= 0.5
+        out[:, :, resized_w:] = 0
+
+    def predict_bucketed(self, img_list, tqdm_enable=False):
+        rec_res = [['', 0.0]] * len(img_list)
+        elapse = 0
+        batches = self.schedule_batches(img_list)
+        pool = get_preprocess_pool(self.rec_preprocess_workers) if len(img_list) > 1 else None
+        pending = None
+        try:
+            with tqdm(total=len(img_list), desc='OCR-rec Predict', disable=not tqdm_enable) as pbar:
+                pending = self.prepare_batch(img_list, batches[0], 0, pool) if batches else None
+                for batch_index, (bucket_width, indices) in enumerate(batches):
+                    norm_img_batch, futures = pending
+                    for future in futures:
+                        future.result()
+                    pending = None
+                    if batch_index + 1 < len(batches):
+                        # 当前batch推理的同时，线程池把下一个batch预处理到另一块缓冲区
+                        pending = self.prepare_batch(img_list, batches[batch_index + 1], (batch_index + 1) % 2, pool)
+
+                    starttime = time.time()
+                    with torch.no_grad():
+                        inp = torch.from_numpy(norm_img_batch)
+                        inp = inp.to(self.device, non_blocking=True)
+                        prob_out = self.net(inp)
+
+                    if isinstance(prob_out, list):
+                        preds = [v.cpu().numpy() for v in prob_out]
+                    else:
+                        preds = prob_out.cpu().numpy()
+
+                    rec_result = self.postprocess_op(preds)
+                    for rno, img_index in enumerate(indices):
+                        rec_res[img_index] = rec_result[rno]
+                    elapse += time.time() - starttime
+                    pbar.update(len(indices))
+        finally:
+            if pending is not None:
+                # 出错时等待仍在写缓冲区的预处理任务结束，避免影响下一次调用
+                wait(pending[1])
+        return rec_res, elapse
+
     def resize_norm_img_svtr(self, img, image_shape):
 
         imgC, imgH, imgW = image_shape
@@ -289,6 +429,11 @@ class TextRecognizer(BaseOCRV20):
         return img
 
     def __call__(self, img_list, tqdm_enable=False):
+        if self.rec_algorithm not in ["SAR", "SVTR", "SRN", "CAN", "NRTR", "ViTSTR", "RFL"]:
+            # 使用resize_norm_img按宽度补齐的识别模型按宽度分桶组batch
+            rec_res, elapse = self.predict_bucketed(img_list, tqdm_enable)
+            return self.fix_nan_scores(rec_res), elapse
+
         img_num = len(img_list)
         # Calculate the aspect ratio of all text bars
         width_list = []
@@ -437,10 +582,13 @@ class TextRecognizer(BaseOCRV20):
                 index += 1
                 pbar.update(current_batch_size)
 
+        return self.fix_nan_scores(rec_res), elapse
+
+    @staticmethod
+    def fix_nan_scores(rec_res):
         # Fix NaN values in recognition results
         for i in range(len(rec_res)):
             text, score = rec_res[i]
             if isinstance(score, float) and math.isnan(score):
                 rec_res[i] = (text, 0.0)
-
-        return rec_res, elapse
+        return rec_res
@@ -72,6 +72,9 @@ def init_args():
     parser.add_argument("--rec_image_shape", type=str, default="3, 48, 320")
     parser.add_argument("--rec_char_type", type=str, default='ch')
     parser.add_argument("--rec_batch_num", type=int, default=6)
+    parser.add_argument("--rec_batch_pixels", type=int, default=0)
+    parser.add_argument("--rec_width_bucket", type=int, default=32)
+    parser.add_argument("--rec_preprocess_workers", type=int, default=-1)
     parser.add_argument("--max_text_length", type=int, default=25)
 
     parser.add_argument("--use_space_char", type=str2bool, default=True)
@@ -0,0 +1,80 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import hashlib
+import json
+import os
+import uuid
+
+from loguru import logger
+
+
+class CheckpointStore:
+    """Per-page model results persisted on local disk, so an interrupted run can resume.
+
+    Results are stored as one json file per page under
+    ``<dir>/<doc_hash>/<tag>/<page_id>.json``. The page id is the absolute page
+    index in the original document and the tag is derived from everything that
+    changes the model output (backend, parse options, language, version), so a
+    rerun with other options does not pick up stale results. Writes go through a
+    temporary file and ``os.replace``, a page is either complete or missing.
+    """
+
+    def __init__(self, checkpoint_dir: str):
+        self.checkpoint_dir = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    @staticmethod
+    def make_tag(*parts) -> str:
+        return hashlib.md5("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:16]
+
+    def _path(self, doc_hash: str, tag: str, page_id: int) -> str:
+        return os.path.join(self.checkpoint_dir, doc_hash, tag, f"{page_id}.json")
+
+    def has(self, doc_hash: str, tag: str, page_id: int) -> bool:
+        return os.path.exists(self._path(doc_hash, tag, page_id))
+
+    def get(self, doc_hash: str, tag: str, page_id: int):
+        path = self._path(doc_hash, tag, page_id)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            # 损坏的文件直接删除，重新运行时该页会重新推理
+            logger.warning(f"read checkpoint {path} failed: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, doc_hash: str, tag: str, page_id: int, result):
+        path = self._path(doc_hash, tag, page_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"write checkpoint {path} failed: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+_checkpoint_store: CheckpointStore | None = None
+
+
+def get_checkpoint_store() -> CheckpointStore | None:
+    """推理结果检查点，通过环境变量MINERU_CHECKPOINT_DIR指定目录后启用，
+    重新运行时已保存结果的页面不再推理，解析完成后可以直接删除该目录"""
+    global _checkpoint_store
+    checkpoint_dir = os.getenv('MINERU_CHECKPOINT_DIR')
+    if not checkpoint_dir:
+        return None
+    checkpoint_dir = os.path.abspath(os.path.expanduser(checkpoint_dir))
+    if _checkpoint_store is None or _checkpoint_store.checkpoint_dir != checkpoint_dir:
+        _checkpoint_store = CheckpointStore(checkpoint_dir)
+    return _checkpoint_store
@@ -102,6 +102,33 @@ def get_table_enable(table_enable):
     return table_enable
 
 
+def get_render_workers(render_workers=None):
+    """pdf渲染使用的进程数，未指定时读取环境变量MINERU_PDF_RENDER_WORKERS，默认为1(串行渲染)"""
+    if render_workers is None:
+        render_workers = int(os.getenv('MINERU_PDF_RENDER_WORKERS', 1))
+    return max(1, render_workers)
+
+
+def get_classify_workers(doc_count):
+    """文档分类使用的进程数，读取环境变量MINERU_CLASSIFY_WORKERS，默认为min(4, cpu核数)，不超过待分类的文档数"""
+    classify_workers = int(os.getenv('MINERU_CLASSIFY_WORKERS', min(4, os.cpu_count() or 1)))
+    return max(1, min(classify_workers, doc_count))
+
+
+def get_cpu_workers(cpu_workers=None):
+    """cpu推理使用的进程数，未指定时读取环境变量MINERU_CPU_WORKERS，默认为1(单进程)"""
+    if cpu_workers is None:
+        cpu_workers = int(os.getenv('MINERU_CPU_WORKERS', 1))
+    return max(1, cpu_workers)
+
+
+def get_threads_per_worker(cpu_workers, threads_per_worker=None):
+    """每个cpu推理进程的线程数，未指定时读取环境变量MINERU_THREADS_PER_WORKER，默认平分cpu核数"""
+    if threads_per_worker is None:
+        threads_per_worker = int(os.getenv('MINERU_THREADS_PER_WORKER', (os.cpu_count() or 1) // max(1, cpu_workers)))
+    return max(1, threads_per_worker)
+
+
 def get_latex_delimiter_config():
     config = read_config()
     if config is None:
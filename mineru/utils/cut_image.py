@@ -3,7 +3,7 @@ from loguru import logger
 from .pdf_image_tools import cut_image
 
 
-def cut_image_and_table(span, page_pil_img, page_img_md5, page_id, image_writer, scale=2):
+def cut_image_and_table(span, page_img, page_img_md5, page_id, image_writer, scale=2):
 
     def return_path(path_type):
         return f"{path_type}/{page_img_md5}"
@@ -14,7 +14,7 @@ def cut_image_and_table(span, page_pil_img, page_img_md5, page_id, image_writer,
         span["image_path"] = ""
     else:
         span["image_path"] = cut_image(
-            span["bbox"], page_id, page_pil_img, return_path=return_path(span_type), image_writer=image_writer, scale=scale
+            span["bbox"], page_id, page_img, return_path=return_path(span_type), image_writer=image_writer, scale=scale
         )
 
     return span
@@ -54,7 +54,7 @@ def draw_bbox_with_number(i, bbox_list, page, c, rgb_config, fill_config, draw_b
     return c
 
 
-def draw_layout_bbox(pdf_info, pdf_bytes, out_path, filename):
+def draw_layout_bbox(pdf_info, pdf_bytes, out_path, filename, start_page_id=0):
     dropped_bbox_list = []
     tables_list, tables_body_list = [], []
     tables_caption_list, tables_footnote_list = [], []
@@ -156,7 +156,8 @@ def draw_layout_bbox(pdf_info, pdf_bytes, out_path, filename):
     pdf_docs = PdfReader(pdf_bytes_io)
     output_pdf = PdfWriter()
 
-    for i, page in enumerate(pdf_docs.pages):
+    # 只绘制解析过的页面，pdf_bytes可以是未经裁剪的原始文档
+    for i, page in enumerate(pdf_docs.pages[start_page_id:start_page_id + len(pdf_info)]):
         # 获取原始页面尺寸
         page_width, page_height = float(page.cropbox[2]), float(page.cropbox[3])
         custom_page_size = (page_width, page_height)
@@ -198,7 +199,7 @@ def draw_layout_bbox(pdf_info, pdf_bytes, out_path, filename):
         output_pdf.write(f)
 
 
-def draw_span_bbox(pdf_info, pdf_bytes, out_path, filename):
+def draw_span_bbox(pdf_info, pdf_bytes, out_path, filename, start_page_id=0):
     text_list = []
     inline_equation_list = []
     interline_equation_list = []
@@ -277,7 +278,8 @@ def draw_span_bbox(pdf_info, pdf_bytes, out_path, filename):
     pdf_docs = PdfReader(pdf_bytes_io)
     output_pdf = PdfWriter()
 
-    for i, page in enumerate(pdf_docs.pages):
+    # 只绘制解析过的页面，pdf_bytes可以是未经裁剪的原始文档
+    for i, page in enumerate(pdf_docs.pages[start_page_id:start_page_id + len(pdf_info)]):
         # 获取原始页面尺寸
         page_width, page_height = float(page.cropbox[2]), float(page.cropbox[3])
         custom_page_size = (page_width, page_height)
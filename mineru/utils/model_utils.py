@@ -27,12 +27,18 @@ def crop_img(input_res, input_img, crop_paste_x=0, crop_paste_y=0):
         # Create a white background array
         return_image = np.ones((crop_new_height, crop_new_width, 3), dtype=np.uint8) * 255
 
-        # Crop the original image using numpy slicing
-        cropped_img = input_img[crop_ymin:crop_ymax, crop_xmin:crop_xmax]
-
-        # Paste the cropped image onto the white background
-        return_image[crop_paste_y:crop_paste_y + (crop_ymax - crop_ymin),
-        crop_paste_x:crop_paste_x + (crop_xmax - crop_xmin)] = cropped_img
+        # Crop the original image using numpy slicing, clipped to the image bounds
+        img_h, img_w = input_img.shape[:2]
+        src_xmin, src_ymin = max(crop_xmin, 0), max(crop_ymin, 0)
+        src_xmax, src_ymax = min(crop_xmax, img_w), min(crop_ymax, img_h)
+        if src_xmax > src_xmin and src_ymax > src_ymin:
+            cropped_img = input_img[src_ymin:src_ymax, src_xmin:src_xmax]
+
+            # Paste the cropped image onto the white background
+            paste_x = crop_paste_x + src_xmin - crop_xmin
+            paste_y = crop_paste_y + src_ymin - crop_ymin
+            return_image[paste_y:paste_y + (src_ymax - src_ymin),
+            paste_x:paste_x + (src_xmax - src_xmin)] = cropped_img
     else:
         # Create a white background array
         return_image = Image.new('RGB', (crop_new_width, crop_new_height), 'white')
@@ -1,5 +1,9 @@
 # Copyright (c) Opendatalab. All rights reserved.
 import copy
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 
@@ -408,4 +412,34 @@ def get_rotate_crop_image(img, points):
     dst_img_height, dst_img_width = dst_img.shape[0:2]
     if dst_img_height * 1.0 / dst_img_width >= 1.5:
         dst_img = np.rot90(dst_img)
-    return dst_img
\ No newline at end of file
+    return dst_img
+
+_preprocess_pools: dict[int, ThreadPoolExecutor] = {}
+_preprocess_pool_lock = threading.Lock()
+
+
+def get_preprocess_pool(workers: int) -> ThreadPoolExecutor | None:
+    """
+    OCR预处理(文本行裁剪、缩放归一化)共用的线程池，cv2在计算时释放GIL，
+    可以与模型推理并行。workers<=0时返回None，由调用方串行处理。
+    相同workers的调用方共用一个线程池，线程池不会被关闭(其他线程可能仍在向其提交任务)
+    """
+    if workers <= 0:
+        return None
+    with _preprocess_pool_lock:
+        pool = _preprocess_pools.get(workers)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-preprocess')
+            _preprocess_pools[workers] = pool
+        return pool
+
+
+def _reset_preprocess_pool():
+    # fork出的子进程中没有父进程线程池的线程，丢弃后重新创建
+    global _preprocess_pools, _preprocess_pool_lock
+    _preprocess_pools = {}
+    _preprocess_pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_preprocess_pool)
@@ -1,17 +1,26 @@
 # Copyright (c) Opendatalab. All rights reserved.
+import ctypes
 import re
-from io import BytesIO
+
 import numpy as np
 import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 from loguru import logger
-from pdfminer.high_level import extract_text
-from pdfminer.pdfparser import PDFParser
-from pdfminer.pdfdocument import PDFDocument
-from pdfminer.pdfpage import PDFPage
-from pdfminer.pdfinterp import PDFResourceManager
-from pdfminer.pdfinterp import PDFPageInterpreter
-from pdfminer.layout import LAParams, LTImage, LTFigure
-from pdfminer.converter import PDFPageAggregator
+
+from mineru.utils.pdf_reader import PdfHandle
+
+# 检查的页面数（最多检查10页）
+MAX_SAMPLE_PAGES = 10
+# 如果每页平均少于50个有效字符，认为需要OCR
+CHARS_THRESHOLD = 50
+# 当一篇文章存在5%以上的文本是乱码时,认为该文档为乱码文档
+INVALID_CHARS_RATIO_THRESHOLD = 0.05
+# 单页图像覆盖率达到80%认为是高覆盖率页面
+HIGH_IMAGE_COVERAGE_THRESHOLD = 0.8
+# 逐页判断时，文字少且图像覆盖率达到50%的页面认为是扫描页
+PAGE_IMAGE_COVERAGE_THRESHOLD = 0.5
+# pdf权限位第5位(从1开始)表示是否允许复制/提取内容
+PDF_PERM_EXTRACT = 1 << 4
 
 
 def classify(pdf_bytes):
@@ -19,242 +28,227 @@ def classify(pdf_bytes):
     判断PDF文件是可以直接提取文本还是需要OCR
 
     Args:
-        pdf_bytes: PDF文件的字节数据
+        pdf_bytes: PDF文件的字节数据，或已打开的PdfHandle(只在其选定的页码范围内抽样)
 
     Returns:
         str: 'txt' 表示可以直接提取文本，'ocr' 表示需要OCR
     """
+    pdf = None
     try:
-        # 从字节数据加载PDF
-        sample_pdf_bytes = extract_pages(pdf_bytes)
-        pdf = pdfium.PdfDocument(sample_pdf_bytes)
-
-        # 获取PDF页数
-        page_count = len(pdf)
+        if isinstance(pdf_bytes, PdfHandle):
+            pdf = pdf_bytes.pdf_doc
+            page_ids = list(pdf_bytes.page_ids)
+        else:
+            # 从字节数据加载PDF
+            pdf = pdfium.PdfDocument(pdf_bytes)
+            page_ids = list(range(len(pdf)))
 
         # 如果PDF页数为0，直接返回OCR
-        if page_count == 0:
+        if len(page_ids) == 0:
             return 'ocr'
 
-        # 检查的页面数（最多检查10页）
-        pages_to_check = min(page_count, 10)
-
-        # 设置阈值：如果每页平均少于50个有效字符，认为需要OCR
-        chars_threshold = 50
+        # 直接在原文档上随机抽样，不再另存为新的PDF
+        sample_page_ids = sample_page_indices(page_ids)
+        page_stats = [get_page_stats(pdf[page_id]) for page_id in sample_page_ids]
 
-        if (get_avg_cleaned_chars_per_page(pdf, pages_to_check) < chars_threshold) or detect_invalid_chars(sample_pdf_bytes):
-            return 'ocr'
-        else:
-
-            if get_high_image_coverage_ratio(sample_pdf_bytes, pages_to_check) >= 0.8:
-                return 'ocr'
-
-            return 'txt'
+        return classify_by_stats(page_stats, is_extractable(pdf))
     except Exception as e:
         logger.error(f"判断PDF类型时出错: {e}")
         # 出错时默认使用OCR
         return 'ocr'
+    finally:
+        if pdf is not None and not isinstance(pdf_bytes, PdfHandle):
+            pdf.close()
 
 
-def get_avg_cleaned_chars_per_page(pdf_doc, pages_to_check):
-    # 总字符数
-    total_chars = 0
-    # 清理后的总字符数
-    cleaned_total_chars = 0
-
-    # 检查前几页的文本
-    for i in range(pages_to_check):
-        page = pdf_doc[i]
-        text_page = page.get_textpage()
-        text = text_page.get_text_bounded()
-        total_chars += len(text)
-
-        # 清理提取的文本，移除空白字符
-        cleaned_text = re.sub(r'\s+', '', text)
-        cleaned_total_chars += len(cleaned_text)
-
-    # 计算平均每页字符数
-    avg_cleaned_chars_per_page = cleaned_total_chars / pages_to_check
-
-    # logger.debug(f"PDF分析: 平均每页清理后{avg_cleaned_chars_per_page:.1f}字符")
-
-    pdf_doc.close()  # 关闭PDF文档
-
-    return avg_cleaned_chars_per_page
-
-
-def get_high_image_coverage_ratio(sample_pdf_bytes, pages_to_check):
-    # 创建内存文件对象
-    pdf_stream = BytesIO(sample_pdf_bytes)
-
-    # 创建PDF解析器
-    parser = PDFParser(pdf_stream)
-
-    # 创建PDF文档对象
-    document = PDFDocument(parser)
+def classify_pages(pdf_bytes) -> list[str]:
+    """
+    逐页判断是可以直接提取文本还是需要OCR，用于文本页与扫描页混合的文档
 
-    # 检查文档是否允许文本提取
-    if not document.is_extractable:
-        # logger.warning("PDF不允许内容提取")
-        return 1.0  # 默认为高覆盖率，因为无法提取内容
+    先与classify一样对抽样页面做文档级判断，判为txt的文档所有页面都是txt，不再逐页统计；
+    只有判为ocr的文档才逐页统计，并按page_type_by_stats判断，
+    文字少的标题页、整页插图等页面不会因此被强制OCR。
 
-    # 创建资源管理器和参数对象
-    rsrcmgr = PDFResourceManager()
-    laparams = LAParams(
-        line_overlap=0.5,
-        char_margin=2.0,
-        line_margin=0.5,
-        word_margin=0.1,
-        boxes_flow=None,
-        detect_vertical=False,
-        all_texts=False,
-    )
-
-    # 创建聚合器
-    device = PDFPageAggregator(rsrcmgr, laparams=laparams)
+    Args:
+        pdf_bytes: PDF文件的字节数据，或已打开的PdfHandle(只判断其选定的页码范围)
 
-    # 创建解释器
-    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    Returns:
+        list[str]: 与(选定范围内)页面一一对应的 'txt' 或 'ocr'
+    """
+    pdf = None
+    try:
+        if isinstance(pdf_bytes, PdfHandle):
+            pdf = pdf_bytes.pdf_doc
+            page_ids = list(pdf_bytes.page_ids)
+        else:
+            pdf = pdfium.PdfDocument(pdf_bytes)
+            page_ids = list(range(len(pdf)))
+
+        if len(page_ids) == 0:
+            return []
+
+        extractable = is_extractable(pdf)
+        # 不允许提取内容的文档所有页面都需要OCR
+        if not extractable:
+            return ['ocr'] * len(page_ids)
+
+        sample_page_ids = sample_page_indices(page_ids)
+        page_stats = {page_id: get_page_stats(pdf[page_id]) for page_id in sample_page_ids}
+        if classify_by_stats(list(page_stats.values()), extractable) == 'txt':
+            return ['txt'] * len(page_ids)
+
+        page_types = []
+        for page_id in page_ids:
+            try:
+                stats = page_stats.get(page_id)
+                if stats is None:
+                    stats = get_page_stats(pdf[page_id])
+                page_types.append(page_type_by_stats(stats))
+            except Exception as e:
+                logger.warning(f"判断第{page_id}页类型时出错: {e}")
+                page_types.append('ocr')
+        return page_types
+    except Exception as e:
+        logger.error(f"判断PDF页面类型时出错: {e}")
+        if isinstance(pdf_bytes, PdfHandle):
+            return ['ocr'] * len(pdf_bytes)
+        return ['ocr'] * (len(pdf) if pdf is not None else 0)
+    finally:
+        if pdf is not None and not isinstance(pdf_bytes, PdfHandle):
+            pdf.close()
 
-    # 记录高图像覆盖率的页面数量
-    high_image_coverage_pages = 0
-    page_count = 0
 
-    # 遍历页面
-    for page in PDFPage.create_pages(document):
-        # 控制检查的页数
-        if page_count >= pages_to_check:
-            break
+def classify_range(pdf_bytes: bytes, start_page_id=0, end_page_id=None, page_level=False):
+    """
+    供进程池调用，在子进程中打开PDF并判断选定页码范围的类型
 
-        # 处理页面
-        interpreter.process_page(page)
-        layout = device.get_result()
+    Returns:
+        page_level为True时返回classify_pages的逐页结果，否则返回classify的结果
+    """
+    pdf_handle = PdfHandle(pdf_bytes, start_page_id, end_page_id)
+    try:
+        return classify_pages(pdf_handle) if page_level else classify(pdf_handle)
+    finally:
+        pdf_handle.close()
 
-        # 页面尺寸
-        page_width = layout.width
-        page_height = layout.height
-        page_area = page_width * page_height
 
-        # 计算图像覆盖的总面积
-        image_area = 0
+def sample_page_indices(page_ids: list[int], max_pages: int = MAX_SAMPLE_PAGES) -> list[int]:
+    """从页码中随机选择最多max_pages页，保持原有顺序"""
+    if len(page_ids) <= max_pages:
+        return list(page_ids)
+    selected = np.random.choice(len(page_ids), max_pages, replace=False)
+    return [page_ids[index] for index in sorted(selected.tolist())]
 
-        # 遍历页面元素
-        for element in layout:
-            # 检查是否为图像或图形元素
-            if isinstance(element, (LTImage, LTFigure)):
-                # 计算图像边界框面积
-                img_width = element.width
-                img_height = element.height
-                img_area = img_width * img_height
-                image_area += img_area
 
-        # 计算覆盖率
-        coverage_ratio = min(image_area / page_area, 1.0) if page_area > 0 else 0
-        # logger.debug(f"PDF分析: 页面 {page_count + 1} 图像覆盖率: {coverage_ratio:.2f}")
+def is_extractable(pdf_doc: pdfium.PdfDocument) -> bool:
+    """文档权限是否允许提取内容，未加密的文档权限为全部允许"""
+    permissions = pdfium_c.FPDF_GetDocPermissions(pdf_doc.raw)
+    return bool(permissions & PDF_PERM_EXTRACT)
 
-        # 判断是否为高覆盖率
-        if coverage_ratio >= 0.8:  # 使用80%作为高覆盖率的阈值
-            high_image_coverage_pages += 1
 
-        page_count += 1
+def get_page_stats(page: pdfium.PdfPage) -> dict:
+    """
+    对单页做一次pdfium遍历，同时统计清理后的字符数、无unicode映射的字形数和图像覆盖率
 
-    # 如果没有处理任何页面，返回0
-    if page_count == 0:
+    Returns:
+        dict: cleaned_chars 去除空白后的字符数
+              total_chars 非生成字符总数(pdfium在行尾等处补的空格/换行不计)
+              unmapped_chars 无法映射到unicode的字形数，对应pdfminer提取出的(cid:x)
+              image_coverage 图像对象覆盖页面面积的比例
+    """
+    text_page = page.get_textpage()
+    try:
+        text = text_page.get_text_bounded()
+        cleaned_chars = len(re.sub(r'\s+', '', text))
+
+        total_chars = 0
+        unmapped_chars = 0
+        raw_text_page = text_page.raw
+        for index in range(pdfium_c.FPDFText_CountChars(raw_text_page)):
+            if pdfium_c.FPDFText_IsGenerated(raw_text_page, index) == 1:
+                continue
+            total_chars += 1
+            if pdfium_c.FPDFText_HasUnicodeMapError(raw_text_page, index) == 1:
+                unmapped_chars += 1
+    finally:
+        text_page.close()
+
+    return {
+        'cleaned_chars': cleaned_chars,
+        'total_chars': total_chars,
+        'unmapped_chars': unmapped_chars,
+        'image_coverage': get_image_coverage(page),
+    }
+
+
+def get_image_coverage(page: pdfium.PdfPage) -> float:
+    """图像对象(包括嵌套在form xobject中的)在页面上覆盖的面积比例"""
+    left, bottom, right, top = page.get_mediabox()
+    page_area = (right - left) * (top - bottom)
+    if page_area <= 0:
         return 0.0
 
-    # 计算高图像覆盖率的页面比例
-    high_coverage_ratio = high_image_coverage_pages / page_count
-    # logger.debug(f"PDF分析: 高图像覆盖页面比例: {high_coverage_ratio:.2f}")
-
-    # 关闭资源
-    pdf_stream.close()
+    image_area = 0
+    for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE,)):
+        obj_left, obj_bottom, obj_right, obj_top = get_object_bounds(obj)
+        # 裁剪到页面范围内，超出页面的部分不计入
+        width = min(obj_right, right) - max(obj_left, left)
+        height = min(obj_top, top) - max(obj_bottom, bottom)
+        if width > 0 and height > 0:
+            image_area += width * height
 
-    return high_coverage_ratio
+    return min(image_area / page_area, 1.0)
 
 
-def extract_pages(src_pdf_bytes: bytes) -> bytes:
-    """
-    从PDF字节数据中随机提取最多10页，返回新的PDF字节数据
+def get_object_bounds(obj: pdfium.PdfObject) -> tuple[float, float, float, float]:
+    # pypdfium2 4.x(get_pos)与5.x(get_bounds)的接口名不同，直接调用底层接口
+    left, bottom, right, top = (ctypes.c_float() for _ in range(4))
+    if not pdfium_c.FPDFPageObj_GetBounds(obj.raw, left, bottom, right, top):
+        return 0.0, 0.0, 0.0, 0.0
+    return left.value, bottom.value, right.value, top.value
 
-    Args:
-        src_pdf_bytes: PDF文件的字节数据
-
-    Returns:
-        bytes: 提取页面后的PDF字节数据
-    """
 
-    # 从字节数据加载PDF
-    pdf = pdfium.PdfDocument(src_pdf_bytes)
-
-    # 获取PDF页数
-    total_page = len(pdf)
-    if total_page == 0:
-        # 如果PDF没有页面，直接返回空文档
-        logger.warning("PDF is empty, return empty document")
-        return b''
-
-    # 选择最多10页
-    select_page_cnt = min(10, total_page)
+def classify_by_stats(page_stats: list[dict], extractable: bool = True) -> str:
+    """根据抽样页面的统计结果判断文档类型"""
+    if len(page_stats) == 0:
+        return 'ocr'
 
-    # 从总页数中随机选择页面
-    page_indices = np.random.choice(total_page, select_page_cnt, replace=False).tolist()
+    avg_cleaned_chars_per_page = sum(stats['cleaned_chars'] for stats in page_stats) / len(page_stats)
+    if avg_cleaned_chars_per_page < CHARS_THRESHOLD:
+        return 'ocr'
 
-    # 创建一个新的PDF文档
-    sample_docs = pdfium.PdfDocument.new()
+    total_chars = sum(stats['total_chars'] for stats in page_stats)
+    unmapped_chars = sum(stats['unmapped_chars'] for stats in page_stats)
+    invalid_chars_ratio = unmapped_chars / total_chars if total_chars > 0 else 0
+    if invalid_chars_ratio > INVALID_CHARS_RATIO_THRESHOLD:
+        return 'ocr'
 
-    try:
-        # 将选择的页面导入新文档
-        sample_docs.import_pages(pdf, page_indices)
+    # 不允许提取内容的文档按高覆盖率处理
+    if not extractable:
+        return 'ocr'
 
-        # 将新PDF保存到内存缓冲区
-        output_buffer = BytesIO()
-        sample_docs.save(output_buffer)
+    high_image_coverage_pages = sum(
+        1 for stats in page_stats if stats['image_coverage'] >= HIGH_IMAGE_COVERAGE_THRESHOLD
+    )
+    if high_image_coverage_pages / len(page_stats) >= HIGH_IMAGE_COVERAGE_THRESHOLD:
+        return 'ocr'
 
-        # 获取字节数据
-        return output_buffer.getvalue()
-    except Exception as e:
-        logger.exception(e)
-        return b''  # 出错时返回空字节
+    return 'txt'
 
 
-def detect_invalid_chars(sample_pdf_bytes: bytes) -> bool:
-    """"
-    检测PDF中是否包含非法字符
+def page_type_by_stats(stats: dict) -> str:
     """
-    '''pdfminer比较慢,需要先随机抽取10页左右的sample'''
-    # sample_pdf_bytes = extract_pages(src_pdf_bytes)
-    sample_pdf_file_like_object = BytesIO(sample_pdf_bytes)
-    laparams = LAParams(
-        line_overlap=0.5,
-        char_margin=2.0,
-        line_margin=0.5,
-        word_margin=0.1,
-        boxes_flow=None,
-        detect_vertical=False,
-        all_texts=False,
-    )
-    text = extract_text(pdf_file=sample_pdf_file_like_object, laparams=laparams)
-    text = text.replace("\n", "")
-    # logger.info(text)
-    '''乱码文本用pdfminer提取出来的文本特征是(cid:xxx)'''
-    cid_pattern = re.compile(r'\(cid:\d+\)')
-    matches = cid_pattern.findall(text)
-    cid_count = len(matches)
-    cid_len = sum(len(match) for match in matches)
-    text_len = len(text)
-    if text_len == 0:
-        cid_chars_radio = 0
-    else:
-        cid_chars_radio = cid_count/(cid_count + text_len - cid_len)
-    # logger.debug(f"cid_count: {cid_count}, text_len: {text_len}, cid_chars_radio: {cid_chars_radio}")
-    '''当一篇文章存在5%以上的文本是乱码时,认为该文档为乱码文档'''
-    if cid_chars_radio > 0.05:
-        return True  # 乱码文档
-    else:
-        return False   # 正常文档
+    在文档级判断为ocr的文档中判断单页的类型：乱码页、文字少且大部分被图像覆盖的(扫描)页需要OCR，
+    其余页面(包括文字少但没有大图的标题页、空白页)直接提取文本
+    """
+    if stats['total_chars'] > 0 and stats['unmapped_chars'] / stats['total_chars'] > INVALID_CHARS_RATIO_THRESHOLD:
+        return 'ocr'
+    if stats['cleaned_chars'] < CHARS_THRESHOLD and stats['image_coverage'] >= PAGE_IMAGE_COVERAGE_THRESHOLD:
+        return 'ocr'
+    return 'txt'
 
 
 if __name__ == '__main__':
     with open('/Users/myhloli/pdf/luanma2x10.pdf', 'rb') as f:
         p_bytes = f.read()
-        logger.info(f"PDF分类结果: {classify(p_bytes)}")
\ No newline at end of file
+        logger.info(f"PDF分类结果: {classify(p_bytes)}")
@@ -1,60 +1,461 @@
 # Copyright (c) Opendatalab. All rights reserved.
+import base64
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from functools import cached_property
 from io import BytesIO
 
+import numpy as np
 import pypdfium2 as pdfium
-from loguru import logger
 from PIL import Image
 
 from mineru.data.data_reader_writer import FileBasedDataWriter
-from mineru.utils.pdf_reader import image_to_b64str, image_to_bytes, page_to_image
-from .hash_utils import str_sha256
+from mineru.utils.pdf_reader import PdfHandle, get_end_page_id, image_to_bytes, page_to_numpy, render_pages
+from mineru.utils.render_cache import get_render_cache
+from mineru.utils.stage_timing import timed_stage
+from .hash_utils import bytes_md5, str_sha256
 
 
-def pdf_page_to_image(page: pdfium.PdfPage, dpi=200) -> dict:
-    """Convert pdfium.PdfDocument to image, Then convert the image to base64.
+class PageImage:
+    """A rendered pdf page whose encoded forms are only produced on demand.
+
+    Pages are rendered by pdfium straight into a contiguous BGR array, which is
+    what the layout, formula, OCR and table models consume and what crops are
+    sliced from. The PIL image, the PNG bytes and their base64 string are
+    derived from it lazily and then cached, since only some consumers need them.
+    A page can also be built from a PIL image, in which case the array is the
+    derived form. Item access (``page_image["img_pil"]``) is kept for callers
+    that still treat the page as the dict returned by earlier versions.
+    """
+
+    def __init__(self, image: np.ndarray | Image.Image, scale: float, image_format: str = "PNG"):
+        if isinstance(image, Image.Image):
+            self.__dict__["img_pil"] = image
+            self._primary = "img_pil"
+        else:
+            self.__dict__["np_bgr"] = image
+            self._primary = "np_bgr"
+        self.scale = scale
+        self.image_format = image_format
+
+    @cached_property
+    def np_bgr(self) -> np.ndarray:
+        """Contiguous BGR array of the page, the layout expected by the YOLO and OCR models."""
+        return np.ascontiguousarray(np.asarray(self.img_pil.convert("RGB"))[:, :, ::-1])
+
+    @cached_property
+    def img_pil(self) -> Image.Image:
+        return Image.fromarray(np.ascontiguousarray(self.np_bgr[:, :, ::-1]))
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """(width, height) of the page image, without materializing a derived form."""
+        if self._primary == "img_pil":
+            return self.img_pil.size
+        return self.np_bgr.shape[1], self.np_bgr.shape[0]
+
+    @cached_property
+    def img_bytes(self) -> bytes:
+        return image_to_bytes(self.img_pil, self.image_format)
+
+    @cached_property
+    def img_base64(self) -> str:
+        return base64.b64encode(self.img_bytes).decode("utf-8")
+
+    @cached_property
+    def img_hash(self) -> str:
+        """Content hash of the raw bitmap, cheap compared to encoding the page."""
+        hasher = hashlib.md5()
+        hasher.update(f"{self.np_bgr.shape}".encode("utf-8"))
+        hasher.update(memoryview(self.np_bgr).cast("B"))
+        return hasher.hexdigest()
+
+    def clear_cache(self):
+        """Drop the derived image forms once inference on this page has finished."""
+        for key in ("np_bgr", "img_pil"):
+            if key != self._primary:
+                self.__dict__.pop(key, None)
+
+    @property
+    def resident_bytes(self) -> int:
+        """Bytes of the bitmap held in memory; file-backed (memory-mapped) arrays count as 0."""
+        if self._primary == "img_pil":
+            width, height = self.img_pil.size
+            return width * height * len(self.img_pil.getbands())
+        if isinstance(self.np_bgr, np.memmap):
+            return 0
+        return self.np_bgr.nbytes
+
+    def spill(self, spill_dir: str):
+        """Move the bitmap to a memory-mapped file in spill_dir and drop the in-memory forms.
+
+        The page object stays valid for every holder: the array is reloaded
+        copy-on-write from the file, so the OS pages it in only when it is read
+        again (e.g. for crops in result_to_middle_json) and can drop it under
+        memory pressure. The file is unlinked right away where the platform
+        allows it, the mapping keeps it alive until the page is released.
+        """
+        path = os.path.join(spill_dir, f"{uuid.uuid4().hex}.npy")
+        np.save(path, self.np_bgr)
+        self.__dict__["np_bgr"] = np.load(path, mmap_mode="c")
+        self.__dict__.pop("img_pil", None)
+        self._primary = "np_bgr"
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __getitem__(self, key):
+        if key not in ("img_pil", "img_base64", "img_bytes", "img_hash", "scale"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+class ImagePage:
+    """Synthetic page of an image document.
+
+    Its geometry matches the single page pdf that images_bytes_to_pdf_bytes
+    would produce (one point per pixel), so middle json coordinates are the
+    same as for the converted pdf, but rendering just resizes the decoded image.
+    """
+
+    def __init__(self, image: Image.Image):
+        self.image = image
+
+    def get_size(self) -> tuple[float, float]:
+        return float(self.image.width), float(self.image.height)
+
+    def render(self, dpi=200, max_width_or_height=2560) -> PageImage:
+        scale = dpi / 72
+        long_side_length = max(*self.get_size())
+        if long_side_length > max_width_or_height:
+            scale = max_width_or_height / long_side_length
+        size = (math.ceil(self.image.width * scale), math.ceil(self.image.height * scale))
+        resized = self.image.resize(size, Image.Resampling.BILINEAR) if size != self.image.size else self.image
+        return PageImage(np.ascontiguousarray(np.asarray(resized)[:, :, ::-1]), scale)
+
+
+class ImageDocument:
+    """A png/jpeg input parsed as a one page document, without going through pdf.
+
+    It offers the same interface as PdfHandle. The pdf form of the image is
+    only built when something asks for ``pdf_bytes`` or ``to_bytes``, e.g. when
+    the origin pdf is dumped or bboxes are drawn.
+    """
+
+    def __init__(self, image_bytes: bytes):
+        self.image_bytes = image_bytes
+        self.page = ImagePage(Image.open(BytesIO(image_bytes)).convert("RGB"))
+        self.start_page_id = 0
+        self.end_page_id = 0
+
+    def __len__(self):
+        return 1
+
+    def __getitem__(self, index: int) -> ImagePage:
+        if index not in (0, -1):
+            raise IndexError(f"page index {index} out of range")
+        return self.page
+
+    @property
+    def page_ids(self) -> range:
+        return range(0, 1)
+
+    @property
+    def is_full_document(self) -> bool:
+        return True
+
+    @cached_property
+    def pdf_bytes(self) -> bytes:
+        return images_bytes_to_pdf_bytes(self.image_bytes)
+
+    @cached_property
+    def doc_hash(self) -> str:
+        return bytes_md5(self.image_bytes)
+
+    def to_bytes(self) -> bytes:
+        return self.pdf_bytes
+
+    def close(self):
+        pass
+
+
+def open_document(file_bytes: bytes, start_page_id=0, end_page_id=None) -> PdfHandle | ImageDocument:
+    """Open pdf bytes as a PdfHandle and image bytes as an ImageDocument."""
+    # pdf头允许出现在文件前1024字节内
+    if b"%PDF" in file_bytes[:1024]:
+        return PdfHandle(file_bytes, start_page_id, end_page_id)
+    return ImageDocument(file_bytes)
+
+
+def reopen_document(document: PdfHandle | ImageDocument) -> PdfHandle | ImageDocument:
+    """Open the same pdf and page range again, e.g. in a forked child, since a pdfium document must not be shared
+    across processes. An ImageDocument holds no pdfium state and is returned as it is."""
+    if isinstance(document, PdfHandle):
+        return PdfHandle(document.pdf_bytes, document.start_page_id, document.end_page_id)
+    return document
+
+
+def pdf_page_to_image(page: pdfium.PdfPage | ImagePage, dpi=200) -> PageImage:
+    """Render a pdfium page, deferring any image encoding until it is requested.
 
     Args:
-        page (_type_): pdfium.PdfPage
+        page (_type_): pdfium.PdfPage, or the ImagePage of an ImageDocument
         dpi (int, optional): reset the dpi of dpi. Defaults to 200.
 
     Returns:
-        dict:  {'img_base64': str, 'img_pil': pil_img, 'scale': float }
+        PageImage: exposes np_bgr, scale and the lazily computed img_pil/img_base64/img_hash
     """
-    pil_img, scale = page_to_image(page, dpi=dpi)
-    img_base64 = image_to_b64str(pil_img)
-
-    image_dict = {
-        "img_base64": img_base64,
-        "img_pil": pil_img,
-        "scale": scale,
-    }
-    return image_dict
+    if isinstance(page, ImagePage):
+        return page.render(dpi=dpi)
+    np_img, scale = page_to_numpy(page, dpi=dpi)
+    return PageImage(np_img, scale)
 
 
 def load_images_from_pdf(
-    pdf_bytes: bytes,
+    pdf_bytes: bytes | PdfHandle | ImageDocument,
     dpi=200,
     start_page_id=0,
     end_page_id=None,
+    render_workers=1,
 ):
-    images_list = []
-    pdf_doc = pdfium.PdfDocument(pdf_bytes)
-    pdf_page_num = len(pdf_doc)
-    end_page_id = end_page_id if end_page_id is not None and end_page_id >= 0 else pdf_page_num - 1
-    if end_page_id > pdf_page_num - 1:
-        logger.warning("end_page_id is out of range, use images length")
-        end_page_id = pdf_page_num - 1
+    """Render the selected pages eagerly.
+
+    ``pdf_bytes`` may also be image bytes or an already opened document (see
+    open_document), whose page selection is used instead of
+    start_page_id/end_page_id. The returned handle indexes pages relative to the
+    selection, like the returned image list.
+    """
+    pdf_handle = pdf_bytes if isinstance(pdf_bytes, (PdfHandle, ImageDocument)) else open_document(pdf_bytes, start_page_id, end_page_id)
+
+    render_cache = get_render_cache()
+    with timed_stage('render', len(pdf_handle)):
+        if isinstance(pdf_handle, PdfHandle) and (render_workers > 1 or render_cache is not None):
+            rendered = render_pages(
+                pdf_handle.pdf_doc, pdf_handle.pdf_bytes, list(pdf_handle.page_ids), dpi=dpi, num_workers=render_workers,
+                render_cache=render_cache, doc_hash=pdf_handle.doc_hash if render_cache is not None else None,
+            )
+            images_list = [PageImage(np_img, scale) for np_img, scale in rendered]
+            return images_list, pdf_handle
+
+        images_list = []
+        for page in pdf_handle:
+            page_image = pdf_page_to_image(page, dpi=dpi)
+            images_list.append(page_image)
+
+    return images_list, pdf_handle
+
+
+class PageMemoryBudget:
+    """Bound the memory of rendered pages across all open documents.
+
+    Every page rendered by a PdfPageImages that shares this budget is tracked
+    (weakly, a page that is no longer referenced leaves the budget on its own).
+    When the in-memory bitmaps exceed ``max_bytes`` the least recently used
+    pages are spilled in place to memory-mapped files (see PageImage.spill),
+    instead of being dropped and rendered again. Pages of the active batches
+    are the most recently used ones, so they are spilled last.
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: str | None = None):
+        self.max_bytes = max_bytes
+        self.spill_dir = tempfile.mkdtemp(prefix="mineru_spill_", dir=spill_dir)
+        self.total_bytes = 0
+        self.spilled_pages = 0
+        self._pages = OrderedDict()
+        # 页面被回收时的回调可能在持锁期间触发，使用可重入锁
+        self._lock = threading.RLock()
+        # 共享预算的页面列表都释放后删除溢出目录
+        weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+
+    def track(self, page_image: PageImage):
+        key = id(page_image)
+        with self._lock:
+            if key in self._pages:
+                self._pages.move_to_end(key)
+                return
+            nbytes = page_image.resident_bytes
+            if nbytes == 0:
+                return
+            self._pages[key] = (weakref.ref(page_image, lambda _, key=key: self._forget(key)), nbytes)
+            self.total_bytes += nbytes
+            # 刚渲染的页面即将被使用，即使单页超出预算也保留在内存中
+            while self.total_bytes > self.max_bytes and len(self._pages) > 1:
+                _, (page_ref, nbytes) = self._pages.popitem(last=False)
+                self.total_bytes -= nbytes
+                evicted = page_ref()
+                if evicted is not None:
+                    evicted.spill(self.spill_dir)
+                    self.spilled_pages += 1
+
+    def touch(self, page_image: PageImage):
+        with self._lock:
+            if id(page_image) in self._pages:
+                self._pages.move_to_end(id(page_image))
+
+    def _forget(self, key: int):
+        with self._lock:
+            entry = self._pages.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+
+
+def get_page_memory_budget() -> PageMemoryBudget | None:
+    """渲染页面的内存上限(字节)，通过环境变量MINERU_PAGE_MEMORY_BUDGET设置后启用，
+    超出的页面写入MINERU_PAGE_SPILL_DIR(默认系统临时目录)下的内存映射文件"""
+    max_bytes = os.getenv('MINERU_PAGE_MEMORY_BUDGET')
+    if not max_bytes:
+        return None
+    return PageMemoryBudget(int(max_bytes), os.getenv('MINERU_PAGE_SPILL_DIR') or None)
+
+
+def get_page_window_size() -> int | None:
+    """
+    同时驻留内存的渲染页数，通过环境变量MINERU_PAGE_WINDOW_SIZE设置，未设置或设为0时不限制，
+    页面保留到生成middle json后被释放为止，每页只渲染一次。
+    设置后超出窗口的页面被释放，生成middle json时重新渲染；窗口小于文档页数时渲染量最多翻倍，
+    同时设置MINERU_RENDER_CACHE_DIR时重新渲染的页面从渲染缓存中以内存映射的方式读取，不再经过pdfium。
+    只想限制内存而不重新渲染时使用MINERU_PAGE_MEMORY_BUDGET，见PageMemoryBudget
+    """
+    window_size = int(os.getenv('MINERU_PAGE_WINDOW_SIZE') or 0)
+    return window_size if window_size > 0 else None
 
-    for index in range(0, pdf_page_num):
-        if start_page_id <= index <= end_page_id:
-            page = pdf_doc[index]
-            image_dict = pdf_page_to_image(page, dpi=dpi)
-            images_list.append(image_dict)
 
-    return images_list, pdf_doc
+class PdfPageImages:
+    """Page images of an open pdfium document, rendered on demand.
+
+    Behaves like the list returned by load_images_from_pdf, but a page is only
+    rendered when it is first indexed. By default (``window_size=None``) every
+    rendered page is kept until it is released, so each page is rendered once.
+    With a ``window_size`` at most that many rendered pages are cached; an
+    evicted page is rendered again if it is requested later (or read back from
+    the RenderCache when one is configured), so peak memory is bounded by the
+    window rather than by the length of the document. With a ``memory_budget``
+    shared between documents, cached pages beyond the budget are spilled to
+    memory-mapped files instead (see PageMemoryBudget).
+    """
+
+    def __init__(
+        self,
+        pdf_doc: pdfium.PdfDocument | ImageDocument,
+        dpi=200,
+        start_page_id=0,
+        end_page_id=None,
+        window_size=None,
+        pdf_bytes: bytes | None = None,
+        render_workers=1,
+        doc_hash: str | None = None,
+        memory_budget: PageMemoryBudget | None = None,
+    ):
+        self.pdf_doc = pdf_doc
+        self.dpi = dpi
+        self.start_page_id = start_page_id
+        self.end_page_id = get_end_page_id(end_page_id, len(pdf_doc))
+        self.window_size = window_size
+        self.pdf_bytes = pdf_bytes
+        self.render_workers = render_workers
+        self.doc_hash = doc_hash
+        self.memory_budget = memory_budget
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return max(self.end_page_id - self.start_page_id + 1, 0)
+
+    def __getitem__(self, index: int) -> PageImage:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"page index {index} out of range")
+        page_image = self._cache.get(index)
+        if page_image is None:
+            page_image = self._render([index])[0]
+            self._put(index, page_image)
+        else:
+            self._cache.move_to_end(index)
+            if self.memory_budget is not None:
+                self.memory_budget.touch(page_image)
+        return page_image
+
+    def _put(self, index: int, page_image: PageImage):
+        self._cache[index] = page_image
+        if self.memory_budget is not None:
+            self.memory_budget.track(page_image)
+        if self.window_size is not None:
+            while len(self._cache) > max(self.window_size, 1):
+                self._cache.popitem(last=False)
+
+    def prefetch(self, indices: list[int]) -> list[PageImage]:
+        """Render the given pages up front, in a process pool when render_workers > 1.
+
+        The rendered pages are returned as well, so a caller can hold on to them
+        even if the window is smaller than the number of prefetched pages.
+        """
+        missing = [index for index in indices if index not in self._cache]
+        if len(missing) > 1:
+            prefetched = dict(zip(missing, self._render(missing)))
+            for index, page_image in prefetched.items():
+                self._put(index, page_image)
+            return [prefetched[index] if index in prefetched else self[index] for index in indices]
+        return [self[index] for index in indices]
+
+    def _render(self, indices: list[int]) -> list[PageImage]:
+        with timed_stage('render', len(indices)):
+            return self._render_pages(indices)
+
+    def _render_pages(self, indices: list[int]) -> list[PageImage]:
+        if isinstance(self.pdf_doc, ImageDocument):
+            return [pdf_page_to_image(self.pdf_doc[index], dpi=self.dpi) for index in indices]
+        render_cache = get_render_cache()
+        if render_cache is not None and self.doc_hash is None and self.pdf_bytes is not None:
+            self.doc_hash = bytes_md5(self.pdf_bytes)
+        rendered = render_pages(
+            self.pdf_doc,
+            self.pdf_bytes,
+            [self.start_page_id + index for index in indices],
+            dpi=self.dpi,
+            num_workers=self.render_workers,
+            render_cache=render_cache,
+            doc_hash=self.doc_hash,
+        )
+        return [PageImage(np_img, scale) for np_img, scale in rendered]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def release(self, index: int):
+        """Drop the rendered image of a page once no later stage needs it."""
+        self._cache.pop(index, None)
+
+
+def open_images_from_pdf(
+    pdf_bytes: bytes | PdfHandle | ImageDocument,
+    dpi=200,
+    start_page_id=0,
+    end_page_id=None,
+    window_size=None,
+    render_workers=1,
+    memory_budget: PageMemoryBudget | None = None,
+):
+    """Streaming counterpart of load_images_from_pdf, see PdfPageImages."""
+    pdf_handle = pdf_bytes if isinstance(pdf_bytes, (PdfHandle, ImageDocument)) else open_document(pdf_bytes, start_page_id, end_page_id)
+    if isinstance(pdf_handle, ImageDocument):
+        return PdfPageImages(pdf_handle, dpi, window_size=window_size, memory_budget=memory_budget), pdf_handle
+    images_list = PdfPageImages(
+        pdf_handle.pdf_doc, dpi, pdf_handle.start_page_id, pdf_handle.end_page_id, window_size,
+        pdf_bytes=pdf_handle.pdf_bytes, render_workers=render_workers, memory_budget=memory_budget,
+    )
+    return images_list, pdf_handle
 
 
-def cut_image(bbox: tuple, page_num: int, page_pil_img, return_path, image_writer: FileBasedDataWriter, scale=2):
+def cut_image(bbox: tuple, page_num: int, page_img, return_path, image_writer: FileBasedDataWriter, scale=2):
     """从第page_num页的page中，根据bbox进行裁剪出一张jpg图片，返回图片路径 save_path：需要同时支持s3和本地,
     图片存放在save_path下，文件名是:
     {page_num}_{bbox[0]}_{bbox[1]}_{bbox[2]}_{bbox[3]}.jpg , bbox内数字取整。"""
@@ -69,7 +470,10 @@ def cut_image(bbox: tuple, page_num: int, page_pil_img, return_path, image_write
     img_hash256_path = f"{str_sha256(img_path)}.jpg"
     # img_hash256_path = f'{img_path}.jpg'
 
-    crop_img = get_crop_img(bbox, page_pil_img, scale=scale)
+    crop_img = get_crop_img(bbox, page_img, scale=scale)
+    if isinstance(crop_img, np.ndarray):
+        # BGR视图转为RGB后编码
+        crop_img = Image.fromarray(np.ascontiguousarray(crop_img[:, :, ::-1]))
 
     img_bytes = image_to_bytes(crop_img, image_format="JPEG")
 
@@ -77,14 +481,18 @@ def cut_image(bbox: tuple, page_num: int, page_pil_img, return_path, image_write
     return img_hash256_path
 
 
-def get_crop_img(bbox: tuple, pil_img, scale=2):
+def get_crop_img(bbox: tuple, page_img, scale=2):
+    """Crop bbox (in pdf coordinates) from the page; numpy pages yield a view, not a copy."""
     scale_bbox = (
         int(bbox[0] * scale),
         int(bbox[1] * scale),
         int(bbox[2] * scale),
         int(bbox[3] * scale),
     )
-    return pil_img.crop(scale_bbox)
+    if isinstance(page_img, np.ndarray):
+        x0, y0 = max(scale_bbox[0], 0), max(scale_bbox[1], 0)
+        return page_img[y0:scale_bbox[3], x0:scale_bbox[2]]
+    return page_img.crop(scale_bbox)
 
 
 def images_bytes_to_pdf_bytes(image_bytes):
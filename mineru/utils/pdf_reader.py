@@ -1,22 +1,112 @@
 # Copyright (c) Opendatalab. All rights reserved.
 import base64
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
 from io import BytesIO
 
+import numpy as np
 from loguru import logger
 from PIL import Image
 from pypdfium2 import PdfBitmap, PdfDocument, PdfPage
 
+from mineru.utils.hash_utils import bytes_md5
+from mineru.utils.render_cache import RenderCache, get_render_cache
 
-def page_to_image(
-    page: PdfPage,
-    dpi: int = 144,  # changed from 200 to 144
-    max_width_or_height: int = 2560,  # changed from 4500 to 2560
-) -> (Image.Image, float):
+
+def get_end_page_id(end_page_id, pdf_page_num):
+    end_page_id = end_page_id if end_page_id is not None and end_page_id >= 0 else pdf_page_num - 1
+    if end_page_id > pdf_page_num - 1:
+        logger.warning("end_page_id is out of range, use images length")
+        end_page_id = pdf_page_num - 1
+    return end_page_id
+
+
+class PdfHandle:
+    """A pdf opened once by pdfium, together with the page range selected for parsing.
+
+    Indexing and ``len`` are relative to the selection, so the handle can stand in
+    for the PdfDocument that the middle-json builders iterate over. The original
+    bytes are kept as they are; a pdf holding only the selected pages is built by
+    ``to_bytes`` and only when the selection is not the whole document.
+    """
+
+    def __init__(self, pdf_bytes: bytes, start_page_id: int = 0, end_page_id: int | None = None):
+        self.pdf_bytes = pdf_bytes
+        self.pdf_doc = PdfDocument(pdf_bytes)
+        # 生成middle json后pdf_doc会被关闭，总页数在打开时记下
+        self.page_count = len(self.pdf_doc)
+        self.start_page_id = start_page_id
+        self.end_page_id = get_end_page_id(end_page_id, self.page_count)
+        self._selected_bytes = None
+
+    def __len__(self):
+        return max(self.end_page_id - self.start_page_id + 1, 0)
+
+    def __getitem__(self, index: int) -> PdfPage:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"page index {index} out of range")
+        return self.pdf_doc[self.start_page_id + index]
+
+    @property
+    def page_ids(self) -> range:
+        """Absolute page indices of the selection in the original document."""
+        return range(self.start_page_id, self.end_page_id + 1)
+
+    @property
+    def is_full_document(self) -> bool:
+        return self.start_page_id == 0 and self.end_page_id == self.page_count - 1
+
+    @cached_property
+    def doc_hash(self) -> str:
+        """bytes_md5 of the original pdf bytes, the document key of the render cache."""
+        return bytes_md5(self.pdf_bytes)
+
+    def to_bytes(self) -> bytes:
+        if self.is_full_document:
+            return self.pdf_bytes
+        if self._selected_bytes is None:
+            # 解析流程结束时pdf_doc可能已被关闭，这里单独打开一份用于导出
+            src_pdf = PdfDocument(self.pdf_bytes)
+            output_pdf = PdfDocument.new()
+            try:
+                output_pdf.import_pages(src_pdf, list(self.page_ids))
+                with BytesIO() as output_buffer:
+                    output_pdf.save(output_buffer)
+                    self._selected_bytes = output_buffer.getvalue()
+            finally:
+                output_pdf.close()
+                src_pdf.close()
+        return self._selected_bytes
+
+    def close(self):
+        self.pdf_doc.close()
+
+
+def pdf_document_to_bytes(doc: PdfDocument) -> bytes:
+    """把已打开的文档导出为bytes，供渲染进程池中的子进程各自打开"""
+    with BytesIO() as output_buffer:
+        doc.save(output_buffer)
+        return output_buffer.getvalue()
+
+
+def get_page_scale(page: PdfPage, dpi: int = 144, max_width_or_height: int = 2560) -> float:
     scale = dpi / 72
 
     long_side_length = max(*page.get_size())
     if long_side_length > max_width_or_height:
         scale = max_width_or_height / long_side_length
+    return scale
+
+
+def page_to_image(
+    page: PdfPage,
+    dpi: int = 144,  # changed from 200 to 144
+    max_width_or_height: int = 2560,  # changed from 4500 to 2560
+) -> (Image.Image, float):
+    scale = get_page_scale(page, dpi, max_width_or_height)
 
     bitmap: PdfBitmap = page.render(scale=scale)  # type: ignore
     try:
@@ -29,6 +119,30 @@ def page_to_image(
     return image, scale
 
 
+def page_to_numpy(
+    page: PdfPage,
+    dpi: int = 144,
+    max_width_or_height: int = 2560,
+) -> (np.ndarray, float):
+    """Render a page straight into a contiguous BGR array.
+
+    pdfium renders BGR natively, so the bitmap buffer is copied out once and no
+    RGB/PIL conversion is involved.
+    """
+    scale = get_page_scale(page, dpi, max_width_or_height)
+
+    bitmap: PdfBitmap = page.render(scale=scale, rev_byteorder=False)  # type: ignore
+    try:
+        # bitmap的内存由pdfium管理，关闭前需要拷贝一份
+        image = np.array(bitmap.to_numpy()[:, :, :3], copy=True, order="C")
+    finally:
+        try:
+            bitmap.close()
+        except Exception:
+            pass
+    return image, scale
+
+
 def image_to_bytes(
     image: Image.Image,
     image_format: str = "PNG",  # 也可以用 "JPEG"
@@ -52,6 +166,7 @@ def pdf_to_images(
     max_width_or_height: int = 2560,
     start_page_id: int = 0,
     end_page_id: int | None = None,
+    num_workers: int = 1,
 ) -> list[Image.Image]:
     doc = pdf if isinstance(pdf, PdfDocument) else PdfDocument(pdf)
     page_num = len(doc)
@@ -62,10 +177,25 @@ def pdf_to_images(
         end_page_id = page_num - 1
 
     images = []
+    render_cache = get_render_cache()
     try:
-        for i in range(start_page_id, end_page_id + 1):
-            image, _ = page_to_image(doc[i], dpi, max_width_or_height)
-            images.append(image)
+        if isinstance(pdf, PdfDocument) and num_workers > 1 and end_page_id > start_page_id:
+            # 已打开的文档不能跨进程传递，导出为bytes后交给进程池渲染
+            pdf = pdf_document_to_bytes(pdf)
+        if render_cache is not None and not isinstance(pdf, PdfDocument):
+            page_ids = list(range(start_page_id, end_page_id + 1))
+            rendered = render_pages(
+                doc, pdf, page_ids, dpi, max_width_or_height, num_workers,
+                render_cache=render_cache, doc_hash=get_pdf_hash(pdf),
+            )
+            images = [Image.fromarray(np.ascontiguousarray(np_img[:, :, ::-1])) for np_img, _ in rendered]
+        elif num_workers > 1 and not isinstance(pdf, PdfDocument):
+            page_ids = list(range(start_page_id, end_page_id + 1))
+            images = [image for image, _ in render_pages_parallel(pdf, page_ids, dpi, max_width_or_height, num_workers)]
+        else:
+            for i in range(start_page_id, end_page_id + 1):
+                image, _ = page_to_image(doc[i], dpi, max_width_or_height)
+                images.append(image)
     finally:
         try:
             doc.close()
@@ -74,6 +204,110 @@ def pdf_to_images(
     return images
 
 
+_worker_pdf_doc: PdfDocument | None = None
+
+
+def _init_render_worker(pdf: str | bytes):
+    # pypdfium2 不是线程安全的，每个进程各自打开一份文档
+    global _worker_pdf_doc
+    _worker_pdf_doc = PdfDocument(pdf)
+
+
+def _render_page_range(
+    page_ids: list[int], dpi: int, max_width_or_height: int, as_numpy: bool
+) -> list[tuple[Image.Image | np.ndarray, float]]:
+    render = page_to_numpy if as_numpy else page_to_image
+    return [render(_worker_pdf_doc[i], dpi, max_width_or_height) for i in page_ids]
+
+
+def render_pages_parallel(
+    pdf: str | bytes,
+    page_ids: list[int],
+    dpi: int = 144,
+    max_width_or_height: int = 2560,
+    num_workers: int = 2,
+    as_numpy: bool = False,
+) -> list[tuple[Image.Image | np.ndarray, float]]:
+    """Render pages in a process pool, each worker handling a contiguous page range.
+
+    Workers open the document from the pdf bytes (or the file path) handed to the
+    pool initializer. Results are returned in the order of ``page_ids``, as PIL
+    images or, with ``as_numpy``, as BGR arrays from page_to_numpy.
+    """
+    if len(page_ids) == 0:
+        return []
+    num_workers = max(1, min(num_workers, len(page_ids)))
+    chunk_size = -(-len(page_ids) // num_workers)
+
+    render_start = time.time()
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_render_worker,
+        initargs=(pdf,),
+    ) as executor:
+        futures = [
+            executor.submit(_render_page_range, page_ids[i:i + chunk_size], dpi, max_width_or_height, as_numpy)
+            for i in range(0, len(page_ids), chunk_size)
+        ]
+        results = [result for future in futures for result in future.result()]
+    render_time = round(time.time() - render_start, 2)
+    logger.info(
+        f"render {len(page_ids)} pages with {num_workers} processes cost: {render_time}, "
+        f"speed: {round(len(page_ids) / max(render_time, 1e-6), 3)} pages/s"
+    )
+    return results
+
+
+def get_pdf_hash(pdf: str | bytes) -> str:
+    if isinstance(pdf, str):
+        with open(pdf, "rb") as f:
+            pdf = f.read()
+    return bytes_md5(pdf)
+
+
+def render_pages(
+    doc: PdfDocument,
+    pdf: str | bytes | None,
+    page_ids: list[int],
+    dpi: int = 144,
+    max_width_or_height: int = 2560,
+    num_workers: int = 1,
+    render_cache: RenderCache | None = None,
+    doc_hash: str | None = None,
+) -> list[tuple[np.ndarray, float]]:
+    """Render pages to BGR arrays, consulting the render cache when one is given.
+
+    Only pages missing from the cache are rendered, in a process pool when
+    ``num_workers > 1``, and are written back to it. Without the pdf bytes (or
+    path) the open document is saved to bytes for the pool. ``doc_hash``
+    identifies the document in the cache, normally bytes_md5 of the pdf bytes.
+    """
+    use_cache = render_cache is not None and doc_hash is not None
+    results = {}
+    if use_cache:
+        for page_id in page_ids:
+            np_img = render_cache.get(RenderCache.make_key(doc_hash, page_id, dpi, max_width_or_height))
+            if np_img is not None:
+                # 缓存命中时不需要渲染，缩放比例由页面尺寸直接算出
+                results[page_id] = (np_img, get_page_scale(doc[page_id], dpi, max_width_or_height))
+
+    missing = [page_id for page_id in page_ids if page_id not in results]
+    if num_workers > 1 and len(missing) > 1:
+        if pdf is None:
+            pdf = pdf_document_to_bytes(doc)
+        rendered = render_pages_parallel(pdf, missing, dpi, max_width_or_height, num_workers, as_numpy=True)
+    else:
+        rendered = [page_to_numpy(doc[page_id], dpi, max_width_or_height) for page_id in missing]
+    for page_id, (np_img, scale) in zip(missing, rendered):
+        results[page_id] = (np_img, scale)
+        if use_cache:
+            render_cache.put(RenderCache.make_key(doc_hash, page_id, dpi, max_width_or_height), np_img)
+
+    if use_cache and len(page_ids) > 1:
+        logger.debug(f"render cache hit {len(page_ids) - len(missing)}/{len(page_ids)} pages")
+    return [results[page_id] for page_id in page_ids]
+
+
 def pdf_to_images_bytes(
     pdf: str | bytes | PdfDocument,
     dpi: int = 144,
@@ -0,0 +1,121 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import os
+import threading
+import uuid
+
+import numpy as np
+from loguru import logger
+
+
+class RenderCache:
+    """On-disk cache of rendered pages, shared by every run on the machine.
+
+    Each page is stored as a raw ``.npy`` BGR array named after the document
+    hash, the page index, the dpi and the max side length it was rendered
+    with. Hits are memory-mapped copy-on-write, so a cached page costs a page
+    fault instead of a pdfium render and stays writable for the models. The
+    total size is bounded: once it exceeds ``max_bytes`` the least recently
+    used entries (by file mtime, refreshed on every hit) are deleted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def make_key(doc_hash: str, page_id: int, dpi: int, max_width_or_height: int) -> str:
+        return f"{doc_hash}_{page_id}_{dpi}_{max_width_or_height}"
+
+    def _path(self, key: str) -> str:
+        # 按hash前两位分目录，避免单个目录下文件过多
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".npy"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def get(self, key: str) -> np.ndarray | None:
+        path = self._path(key)
+        try:
+            image = np.load(path, mmap_mode="c")
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return image
+
+    def put(self, key: str, image: np.ndarray):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，多进程同时写入同一页时不会读到残缺文件
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, image)
+            size = os.path.getsize(tmp_path)
+            # 覆盖已有的页面时只计入大小的差值
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"write render cache {path} failed: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._total_bytes += size - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total_bytes = sum(size for _, _, size in entries)
+        # 清理到上限的90%，避免每次写入都触发全目录扫描
+        target_bytes = int(self.max_bytes * 0.9)
+        removed = 0
+        for path, _, size in entries:
+            if total_bytes <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            removed += 1
+        self._total_bytes = total_bytes
+        logger.debug(f"render cache evicted {removed} pages, size now {total_bytes / 1024 ** 2:.1f} MB")
+
+
+_render_cache: RenderCache | None = None
+
+
+def get_render_cache() -> RenderCache | None:
+    """渲染缓存，通过环境变量MINERU_RENDER_CACHE_DIR指定缓存目录后启用，
+    MINERU_RENDER_CACHE_MAX_MB为缓存目录大小上限(默认10240MB)"""
+    global _render_cache
+    cache_dir = os.getenv('MINERU_RENDER_CACHE_DIR')
+    if not cache_dir:
+        return None
+    cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+    if _render_cache is None or _render_cache.cache_dir != cache_dir:
+        max_bytes = int(os.getenv('MINERU_RENDER_CACHE_MAX_MB', 10240)) * 1024 ** 2
+        _render_cache = RenderCache(cache_dir, max_bytes)
+    return _render_cache
@@ -119,7 +119,7 @@ def __replace_unicode(text: str):
 
 
 """pdf_text dict方案 char级别"""
-def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded_blocks):
+def txt_spans_extract(pdf_page, spans, page_img, scale, all_bboxes, all_discarded_blocks):
 
     page_dict = get_page(pdf_page)
 
@@ -194,8 +194,12 @@ def txt_spans_extract(pdf_page, spans, pil_img, scale, all_bboxes, all_discarded
 
         for span in need_ocr_spans:
             # 对span的bbox截图再ocr
-            span_pil_img = get_crop_img(span['bbox'], pil_img, scale)
-            span_img = cv2.cvtColor(np.array(span_pil_img), cv2.COLOR_RGB2BGR)
+            span_img = get_crop_img(span['bbox'], page_img, scale)
+            if isinstance(span_img, np.ndarray):
+                # BGR页面上的裁剪是视图，留给后置ocr前拷贝一份，避免整页数组被引用
+                span_img = span_img.copy()
+            else:
+                span_img = cv2.cvtColor(np.array(span_img), cv2.COLOR_RGB2BGR)
             # 计算span的对比度，低于0.20的span不进行ocr
             if calculate_contrast(span_img, img_mode='bgr') <= 0.17:
                 spans.remove(span)
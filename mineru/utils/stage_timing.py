@@ -0,0 +1,126 @@
+# Copyright (c) Opendatalab. All rights reserved.
+import threading
+import time
+from contextlib import contextmanager
+
+# 报告中各阶段的固定顺序，未列出的阶段排在最后
+STAGE_ORDER = (
+    'render', 'classify', 'layout', 'mfd', 'mfr', 'ocr_det', 'table', 'ocr_rec', 'vlm_infer',
+    'middle_json', 'para_split', 'markdown', 'write',
+)
+
+
+class StageTimer:
+    """Accumulates wall time and item counts per stage.
+
+    Stages may run concurrently (stage pipeline threads, several documents),
+    so ``seconds`` is the summed time spent inside the stage and can exceed
+    the wall time of the whole run, which is reported separately. Nested
+    stages are recorded independently, e.g. ``para_split`` is part of
+    ``middle_json``. Stages can also carry counters (see count_stage); a
+    stage with ``cache_hits`` and ``cache_lookups`` reports its hit rate.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, stage: str) -> dict:
+        return self._stages.setdefault(stage, {'seconds': 0.0, 'items': 0, 'calls': 0, 'counts': {}})
+
+    def add(self, stage: str, seconds: float, items: int = 1):
+        with self._lock:
+            stats = self._stage(stage)
+            stats['seconds'] += seconds
+            stats['items'] += items
+            stats['calls'] += 1
+
+    def add_counts(self, stage: str, counts: dict):
+        with self._lock:
+            stage_counts = self._stage(stage)['counts']
+            for name, value in counts.items():
+                stage_counts[name] = stage_counts.get(name, 0) + value
+
+    def report(self, stages: tuple | None = None) -> dict:
+        """stages指定时只报告这些阶段"""
+        with self._lock:
+            selected = {
+                name: dict(stats, counts=dict(stats['counts']))
+                for name, stats in self._stages.items() if stages is None or name in stages
+            }
+        order = {stage: index for index, stage in enumerate(STAGE_ORDER)}
+        stage_reports = []
+        for stage in sorted(selected, key=lambda name: order.get(name, len(order))):
+            stats = selected[stage]
+            stage_report = {
+                'stage': stage,
+                'seconds': round(stats['seconds'], 4),
+                'items': stats['items'],
+                'calls': stats['calls'],
+                'items_per_s': round(stats['items'] / stats['seconds'], 3) if stats['seconds'] > 0 else None,
+            }
+            counts = stats['counts']
+            if counts:
+                stage_report['counts'] = counts
+                if counts.get('cache_lookups'):
+                    stage_report['cache_hit_rate'] = round(counts.get('cache_hits', 0) / counts['cache_lookups'], 4)
+            stage_reports.append(stage_report)
+        return {
+            'wall_s': round(time.perf_counter() - self.start_time, 4),
+            'stages': stage_reports,
+        }
+
+
+_active_timers: list[StageTimer] = []
+_active_lock = threading.Lock()
+# 每个线程中正在计时的阶段，count_stage默认计入最内层的阶段
+_thread_stages = threading.local()
+
+
+@contextmanager
+def collect_stage_timing(timer: StageTimer | None = None):
+    """在with块内(包括其中启动的线程)记录各阶段耗时，返回StageTimer，可以嵌套使用"""
+    timer = timer or StageTimer()
+    with _active_lock:
+        _active_timers.append(timer)
+    try:
+        yield timer
+    finally:
+        with _active_lock:
+            _active_timers.remove(timer)
+
+
+@contextmanager
+def timed_stage(stage: str, items: int = 1):
+    """把with块的耗时计入所有正在收集的StageTimer，没有收集时几乎没有开销"""
+    if not _active_timers:
+        yield
+        return
+    stage_stack = getattr(_thread_stages, 'stack', None)
+    if stage_stack is None:
+        stage_stack = _thread_stages.stack = []
+    stage_stack.append(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stage_stack.pop()
+        with _active_lock:
+            timers = list(_active_timers)
+        for timer in timers:
+            timer.add(stage, seconds, items)
+
+
+def count_stage(counts: dict, stage: str | None = None):
+    """把计数累加到所有正在收集的StageTimer，stage默认为当前线程中正在计时的阶段"""
+    if not _active_timers:
+        return
+    if stage is None:
+        stage_stack = getattr(_thread_stages, 'stack', None)
+        stage = stage_stack[-1] if stage_stack else 'other'
+    with _active_lock:
+        timers = list(_active_timers)
+    for timer in timers:
+        timer.add_counts(stage, counts)
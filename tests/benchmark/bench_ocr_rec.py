@@ -0,0 +1,98 @@
+# Copyright (c) Opendatalab. All rights reserved.
+"""
+OCR识别的吞吐基准: 对比预处理线程数(0为串行)不同时，纯识别(det=False)与检测+识别两条路径的耗时，
+并检查识别结果是否一致
+
+用法: python tests/benchmark/bench_ocr_rec.py [--device cpu|cuda|npu|mps] [--lang ch] [--lines 2000]
+      [--workers 0 2 4] [--repeat 3]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+WORDS = ['MinerU', 'document', 'parsing', '文本', '识别', 'table', '2025', 'layout', 'formula', '页面', 'OCR', 'pipeline']
+
+
+def make_lines(count, seed):
+    """生成宽度不一的文本行图像(BGR)"""
+    rng = np.random.default_rng(seed)
+    font = load_font(32)
+    lines = []
+    for _ in range(count):
+        text = ' '.join(rng.choice(WORDS, size=int(rng.integers(1, 16))))
+        width = int(font.getlength(text)) + 16
+        image = Image.new('RGB', (width, 48), 'white')
+        ImageDraw.Draw(image).text((8, 6), text, fill='black', font=font)
+        lines.append(np.ascontiguousarray(np.asarray(image)[:, :, ::-1]))
+    return lines
+
+
+def make_page(lines, width=1600):
+    """把文本行排成一页，用于检测+识别路径"""
+    height = 56 * len(lines) + 40
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    for row, line in enumerate(lines):
+        line = line[:, :width - 40]
+        page[20 + 56 * row:20 + 56 * row + line.shape[0], 20:20 + line.shape[1]] = line
+    return page
+
+
+def load_font(size):
+    for path in ['/usr/share/fonts/truetype/wqy/wqy-microhei.ttc', '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+                 '/System/Library/Fonts/PingFang.ttc', 'C:/Windows/Fonts/msyh.ttc']:
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+
+def timed(fn, repeat):
+    result = fn()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default=None, help='cpu, cuda, cuda:0, npu, mps; 默认自动选择')
+    parser.add_argument('--lang', default='ch')
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--page-lines', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.device:
+        os.environ['MINERU_DEVICE_MODE'] = args.device
+    # 重复运行时应测量识别本身，不使用识别结果缓存
+    os.environ['MINERU_OCR_REC_CACHE'] = 'false'
+    from mineru.backend.pipeline.model_init import ocr_model_init
+
+    ocr_model = ocr_model_init(lang=args.lang)
+    recognizer = ocr_model.text_recognizer
+    lines = make_lines(args.lines, args.seed)
+    page = make_page(lines[:args.page_lines])
+    print(f"device: {recognizer.device}, lang: {args.lang}, {len(lines)} lines, page with {args.page_lines} lines")
+
+    baseline_rec = baseline_page = None
+    print(f"{'workers':>7} {'rec(s)':>8} {'lines/s':>9} {'det+rec(s)':>11} {'same':>5}")
+    for workers in args.workers:
+        recognizer.rec_preprocess_workers = workers
+        rec_res, rec_time = timed(lambda: ocr_model.ocr(lines, det=False)[0], args.repeat)
+        page_res, page_time = timed(lambda: ocr_model.ocr(page)[0], args.repeat)
+        if baseline_rec is None:
+            baseline_rec, baseline_page = rec_res, page_res
+        same = [text for text, _ in rec_res] == [text for text, _ in baseline_rec] and \
+            [item[1][0] for item in page_res or []] == [item[1][0] for item in baseline_page or []]
+        print(f"{workers:>7} {rec_time:>8.3f} {len(lines) / rec_time:>9.1f} {page_time:>11.3f} {str(same):>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# Copyright (c) Opendatalab. All rights reserved.
+"""
+对比pdf_classify.classify(pdfium单次遍历)与原先基于pdfminer的分类器的判定结果和耗时
+
+用法: python tests/benchmark/bench_pdf_classify.py [pdf文件或目录 ...] [--repeat N]
+不传路径时使用仓库中的测试pdf
+"""
+import argparse
+import glob
+import os
+import re
+import time
+from io import BytesIO
+
+import numpy as np
+import pypdfium2 as pdfium
+from loguru import logger
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.high_level import extract_text
+from pdfminer.layout import LAParams, LTFigure, LTImage
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+from mineru.utils.pdf_classify import classify
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LAPARAMS = LAParams(
+    line_overlap=0.5,
+    char_margin=2.0,
+    line_margin=0.5,
+    word_margin=0.1,
+    boxes_flow=None,
+    detect_vertical=False,
+    all_texts=False,
+)
+
+
+def legacy_classify(pdf_bytes):
+    """原先的分类流程: 抽样另存为新pdf，pdfium统计字符数，再用pdfminer检测(cid:x)乱码和图像覆盖率"""
+    try:
+        sample_pdf_bytes = legacy_extract_pages(pdf_bytes)
+        pdf = pdfium.PdfDocument(sample_pdf_bytes)
+        page_count = len(pdf)
+        if page_count == 0:
+            return 'ocr'
+        pages_to_check = min(page_count, 10)
+        cleaned_total_chars = 0
+        for i in range(pages_to_check):
+            text = pdf[i].get_textpage().get_text_bounded()
+            cleaned_total_chars += len(re.sub(r'\s+', '', text))
+        pdf.close()
+        if cleaned_total_chars / pages_to_check < 50 or legacy_detect_invalid_chars(sample_pdf_bytes):
+            return 'ocr'
+        if legacy_high_image_coverage_ratio(sample_pdf_bytes, pages_to_check) >= 0.8:
+            return 'ocr'
+        return 'txt'
+    except Exception as e:
+        logger.error(f"legacy classify failed: {e}")
+        return 'ocr'
+
+
+def legacy_extract_pages(src_pdf_bytes):
+    pdf = pdfium.PdfDocument(src_pdf_bytes)
+    total_page = len(pdf)
+    if total_page == 0:
+        return b''
+    page_indices = np.random.choice(total_page, min(10, total_page), replace=False).tolist()
+    sample_docs = pdfium.PdfDocument.new()
+    sample_docs.import_pages(pdf, page_indices)
+    output_buffer = BytesIO()
+    sample_docs.save(output_buffer)
+    return output_buffer.getvalue()
+
+
+def legacy_detect_invalid_chars(sample_pdf_bytes):
+    text = extract_text(pdf_file=BytesIO(sample_pdf_bytes), laparams=LAPARAMS).replace("\n", "")
+    matches = re.findall(r'\(cid:\d+\)', text)
+    cid_count = len(matches)
+    cid_len = sum(len(match) for match in matches)
+    if len(text) == 0:
+        return False
+    return cid_count / (cid_count + len(text) - cid_len) > 0.05
+
+
+def legacy_high_image_coverage_ratio(sample_pdf_bytes, pages_to_check):
+    document = PDFDocument(PDFParser(BytesIO(sample_pdf_bytes)))
+    if not document.is_extractable:
+        return 1.0
+    rsrcmgr = PDFResourceManager()
+    device = PDFPageAggregator(rsrcmgr, laparams=LAPARAMS)
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    high_image_coverage_pages = 0
+    page_count = 0
+    for page in PDFPage.create_pages(document):
+        if page_count >= pages_to_check:
+            break
+        interpreter.process_page(page)
+        layout = device.get_result()
+        page_area = layout.width * layout.height
+        image_area = sum(
+            element.width * element.height for element in layout if isinstance(element, (LTImage, LTFigure))
+        )
+        coverage_ratio = min(image_area / page_area, 1.0) if page_area > 0 else 0
+        if coverage_ratio >= 0.8:
+            high_image_coverage_pages += 1
+        page_count += 1
+    if page_count == 0:
+        return 0.0
+    return high_image_coverage_pages / page_count
+
+
+def collect_pdfs(paths):
+    if not paths:
+        paths = [os.path.join(REPO_ROOT, 'tests'), os.path.join(REPO_ROOT, 'projects'), os.path.join(REPO_ROOT, 'demo')]
+    pdf_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdf_paths.extend(sorted(glob.glob(os.path.join(path, '**', '*.pdf'), recursive=True)))
+        elif path.lower().endswith('.pdf'):
+            pdf_paths.append(path)
+    return pdf_paths
+
+
+def timed(fn, pdf_bytes, repeat, seed):
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        # 两种分类器使用相同的随机种子，保证抽到相同的页面
+        np.random.seed(seed)
+        result = fn(pdf_bytes)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    pdf_paths = collect_pdfs(args.paths)
+    if not pdf_paths:
+        logger.error("no pdf found")
+        return
+
+    total_new = total_legacy = 0.0
+    mismatches = []
+    print(f"{'file':<50} {'legacy':>7} {'new':>7} {'legacy(s)':>10} {'new(s)':>10} {'speedup':>8}")
+    for pdf_path in pdf_paths:
+        with open(pdf_path, 'rb') as f:
+            pdf_bytes = f.read()
+        legacy_result, legacy_time = timed(legacy_classify, pdf_bytes, args.repeat, args.seed)
+        new_result, new_time = timed(classify, pdf_bytes, args.repeat, args.seed)
+        total_legacy += legacy_time
+        total_new += new_time
+        if legacy_result != new_result:
+            mismatches.append(pdf_path)
+        print(
+            f"{os.path.relpath(pdf_path, REPO_ROOT)[-50:]:<50} {legacy_result:>7} {new_result:>7} "
+            f"{legacy_time:>10.4f} {new_time:>10.4f} {legacy_time / max(new_time, 1e-9):>7.1f}x"
+        )
+
+    print(
+        f"\n{len(pdf_paths)} pdfs, {len(pdf_paths) - len(mismatches)} identical decisions, "
+        f"legacy {total_legacy:.3f}s, new {total_new:.3f}s, speedup {total_legacy / max(total_new, 1e-9):.1f}x"
+    )
+    for pdf_path in mismatches:
+        print(f"decision differs: {pdf_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('torch')
+
+from mineru.model.ocr.paddleocr2pytorch.pytorchocr.postprocess.db_postprocess import DBPostProcess
+
+
+def reference_boxes_from_bitmap(post_process: DBPostProcess, pred, bitmap, dest_width, dest_height):
+    # 逐个轮廓处理的原实现，作为批量实现的对照
+    height, width = bitmap.shape
+    outs = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    contours = outs[1] if len(outs) == 3 else outs[0]
+    boxes = []
+    scores = []
+    for contour in contours[:post_process.max_candidates]:
+        points, sside = post_process.get_mini_boxes(contour)
+        if sside < post_process.min_size:
+            continue
+        points = np.array(points)
+        if post_process.score_mode == 'fast':
+            score = post_process.box_score_fast(pred, points.reshape(-1, 2))
+        else:
+            score = post_process.box_score_slow(pred, contour)
+        if post_process.box_thresh > score:
+            continue
+        box = post_process.unclip(points).reshape(-1, 1, 2)
+        box, sside = post_process.get_mini_boxes(box)
+        if sside < post_process.min_size + 2:
+            continue
+        box = np.array(box)
+        box[:, 0] = np.clip(np.round(box[:, 0] / width * dest_width), 0, dest_width)
+        box[:, 1] = np.clip(np.round(box[:, 1] / height * dest_height), 0, dest_height)
+        boxes.append(box.astype(np.int16))
+        scores.append(score)
+    return np.array(boxes, dtype=np.int16), scores
+
+
+def make_pred(seed: int, height: int = 160, width: int = 240) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    pred = (rng.random((height, width)) * 0.2).astype(np.float32)
+    # 水平文本行，部分相互接触或外接矩形相交
+    for _ in range(12):
+        x, y = int(rng.integers(0, width - 40)), int(rng.integers(0, height - 12))
+        w, h = int(rng.integers(8, 60)), int(rng.integers(4, 14))
+        pred[y:y + h, x:x + w] = rng.uniform(0.35, 1.0)
+    # 两个外接矩形相交但不连通的倾斜文本行
+    for offset, value in ((0, 0.9), (9, 0.6)):
+        poly = np.array([[150, 100 + offset], [220, 80 + offset], [222, 86 + offset], [152, 106 + offset]], np.int32)
+        cv2.fillPoly(pred, poly[None], value)
+    # 小于min_size的小轮廓
+    for _ in range(6):
+        x, y = int(rng.integers(0, width - 2)), int(rng.integers(0, height - 2))
+        pred[y:y + 2, x:x + int(rng.integers(1, 3))] = 0.95
+    return pred
+
+
+@pytest.mark.parametrize('score_mode', ['fast', 'slow'])
+@pytest.mark.parametrize('unclip_ratio', [1.5, 2.0, 3.0])
+def test_batched_boxes_match_per_contour(score_mode: str, unclip_ratio: float) -> None:
+    post_process = DBPostProcess(thresh=0.3, box_thresh=0.6, unclip_ratio=unclip_ratio, score_mode=score_mode)
+    preds = [make_pred(seed) for seed in range(6)]
+    bitmaps = [pred > post_process.thresh for pred in preds]
+    dest_sizes = [(480, 320), (240, 160), (600, 333), (480, 320), (97, 61), (1000, 700)]
+    results = post_process.boxes_from_bitmaps(preds, bitmaps, dest_sizes)
+    assert len(results) == len(preds)
+    for pred, bitmap, (dest_width, dest_height), (boxes, scores) in zip(preds, bitmaps, dest_sizes, results):
+        ref_boxes, ref_scores = reference_boxes_from_bitmap(post_process, pred, bitmap, dest_width, dest_height)
+        assert len(ref_boxes) > 0
+        np.testing.assert_array_equal(boxes, ref_boxes)
+        np.testing.assert_allclose(scores, ref_scores, rtol=1e-6)
+        # 单张图的接口与批量接口结果一致
+        single_boxes, single_scores = post_process.boxes_from_bitmap(pred, bitmap, dest_width, dest_height)
+        np.testing.assert_array_equal(single_boxes, boxes)
+        assert single_scores == scores
+
+
+# 没有轮廓或所有轮廓都被过滤时返回空结果
+def test_no_boxes() -> None:
+    post_process = DBPostProcess(thresh=0.3, box_thresh=0.6)
+    empty = np.zeros((32, 32), dtype=np.float32)
+    tiny = empty.copy()
+    tiny[5:7, 5:7] = 1.0
+    results = post_process.boxes_from_bitmaps([empty, tiny], [empty > 0.3, tiny > 0.3], [(64, 64), (64, 64)])
+    for boxes, scores in results:
+        assert len(boxes) == 0 and scores == []
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('torch')
+
+from mineru.model.ocr.paddleocr2pytorch.tools.infer.predict_rec import TextRecognizer
+
+
+def make_recognizer(rec_batch_pixels: int = 0, rec_batch_num: int = 6, rec_width_bucket: int = 64) -> TextRecognizer:
+    # 只设置组batch用到的属性，不加载模型
+    recognizer = TextRecognizer.__new__(TextRecognizer)
+    recognizer.rec_image_shape = [3, 48, 320]
+    recognizer.rec_batch_pixels = rec_batch_pixels
+    recognizer.rec_batch_num = rec_batch_num
+    recognizer.rec_width_bucket = rec_width_bucket
+    recognizer.limited_max_width = 1280
+    recognizer.limited_min_width = 16
+    return recognizer
+
+
+def make_crop(width: int, height: int = 48) -> np.ndarray:
+    return np.zeros((height, width, 3), dtype=np.uint8)
+
+
+def test_bucket_width() -> None:
+    recognizer = make_recognizer()
+    assert recognizer.get_bucket_width(10) == 320
+    assert recognizer.get_bucket_width(321) == 384
+    assert recognizer.get_bucket_width(5000) == 1280
+
+
+# 每个crop恰好在一个batch中，batch按宽度递增，且不超过像素预算(单个crop超出时单独成batch)
+def test_schedule_batches_within_budget() -> None:
+    recognizer = make_recognizer(rec_batch_pixels=48 * 320 * 8)
+    rng = np.random.default_rng(0)
+    img_list = [make_crop(int(width)) for width in rng.integers(20, 2000, size=80)]
+    batches = recognizer.schedule_batches(img_list)
+    assert sorted(index for _, indices in batches for index in indices) == list(range(len(img_list)))
+    budget = recognizer.get_rec_batch_pixels()
+    previous_width = 0
+    for bucket_width, indices in batches:
+        assert bucket_width >= previous_width
+        previous_width = bucket_width
+        assert all(recognizer.get_bucket_width(recognizer.get_rec_width(img_list[index])) <= bucket_width
+                   for index in indices)
+        assert len(indices) == 1 or len(indices) * 48 * bucket_width <= budget
+
+
+# 窄的文本行组成大batch，宽的文本行组成小batch
+def test_schedule_batches_sizes_by_width() -> None:
+    recognizer = make_recognizer(rec_batch_pixels=48 * 320 * 8)
+    img_list = [make_crop(100) for _ in range(16)] + [make_crop(1280) for _ in range(4)]
+    batches = recognizer.schedule_batches(img_list)
+    assert [(bucket_width, len(indices)) for bucket_width, indices in batches] == [
+        (320, 8), (320, 8), (1280, 2), (1280, 2)
+    ]
+
+
+def test_schedule_batches_empty() -> None:
+    assert make_recognizer().schedule_batches([]) == []
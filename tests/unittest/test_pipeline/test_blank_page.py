@@ -0,0 +1,59 @@
+import numpy as np
+
+from mineru.backend.pipeline.blank_page import BlankPageFilter, get_ink_ratio
+from mineru.utils.pdf_image_tools import PageImage
+
+
+def make_page(ink_rows: int = 0, height: int = 400, width: int = 300, value: int = 0) -> PageImage:
+    np_img = np.full((height, width, 3), 255, dtype=np.uint8)
+    np_img[100:100 + ink_rows, 20:280] = value
+    return PageImage(np_img, 1.0)
+
+
+def fake_infer(infer_image: list) -> list:
+    return [[{'ocr': ocr_enable}] for _, ocr_enable, _ in infer_image]
+
+
+def run_batch(blank_filter: BlankPageFilter, batch_image: list) -> tuple[list, list]:
+    infer_image, plan = blank_filter.split(batch_image)
+    return infer_image, blank_filter.merge(plan, fake_infer(infer_image))
+
+
+def test_ink_ratio() -> None:
+    assert get_ink_ratio(make_page().np_bgr) == 0.0
+    np_img = np.zeros((10, 10, 3), dtype=np.uint8)
+    assert get_ink_ratio(np_img, stride=1) == 1.0
+    # 任一通道低于阈值即视为墨迹，彩色内容也计入
+    np_img = np.full((10, 10, 3), 255, dtype=np.uint8)
+    np_img[:5, :, 2] = 0
+    assert get_ink_ratio(np_img, stride=1) == 0.5
+    # 灰度图与空图
+    assert get_ink_ratio(np.zeros((4, 4), dtype=np.uint8), stride=1) == 1.0
+    assert get_ink_ratio(np.zeros((0, 0, 3), dtype=np.uint8)) == 0.0
+
+
+# 走OCR的空白页不推理、得到空结果，有文字的页面正常推理并保持原顺序
+def test_blank_and_text_pages() -> None:
+    blank_filter = BlankPageFilter()
+    batch_image = [(make_page(), True, 'ch'), (make_page(ink_rows=12), True, 'ch'), (make_page(), True, 'ch')]
+    infer_image, results = run_batch(blank_filter, batch_image)
+    assert len(infer_image) == 1 and infer_image[0] is batch_image[1]
+    assert results == [[], [{'ocr': True}], []]
+    assert blank_filter.pages == 3 and blank_filter.blank_pages == 2
+
+
+# txt模式的页面文字来自文字层，即使渲染结果没有墨迹也要推理
+def test_txt_mode_pages_pass_through() -> None:
+    blank_filter = BlankPageFilter()
+    batch_image = [(make_page(), False, 'ch'), (make_page(ink_rows=12), False, 'ch')]
+    infer_image, results = run_batch(blank_filter, batch_image)
+    assert len(infer_image) == 2
+    assert results == [[{'ocr': False}], [{'ocr': False}]]
+    assert blank_filter.blank_pages == 0
+
+
+def test_blank_page_empty_batch() -> None:
+    blank_filter = BlankPageFilter()
+    infer_image, results = run_batch(blank_filter, [])
+    assert infer_image == [] and results == []
+    assert blank_filter.pages == 0
@@ -0,0 +1,72 @@
+import numpy as np
+
+from mineru.backend.pipeline.ocr_det_mosaic import OcrDetMosaic
+
+
+def overlaps(a: tuple, b: tuple) -> bool:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+def test_pack_empty() -> None:
+    mosaic = OcrDetMosaic(canvas_size=256)
+    assert mosaic.pack([]) == []
+
+
+def test_fits() -> None:
+    mosaic = OcrDetMosaic(canvas_size=256)
+    assert mosaic.fits((256, 256, 3))
+    assert not mosaic.fits((257, 10, 3))
+    assert not mosaic.fits((10, 257, 3))
+
+
+# 所有crop都被放置且只放置一次，在画布范围内并且互不重叠
+def test_pack_no_overlap() -> None:
+    mosaic = OcrDetMosaic(canvas_size=256, gutter=8)
+    rng = np.random.default_rng(0)
+    shapes = [(int(h), int(w), 3) for h, w in rng.integers(8, 120, size=(60, 2))]
+    canvases = mosaic.pack(shapes)
+    assert sorted(crop_idx for placements in canvases for crop_idx, _, _ in placements) == list(range(len(shapes)))
+    for placements in canvases:
+        rects = [(x, y, shapes[crop_idx][1], shapes[crop_idx][0]) for crop_idx, x, y in placements]
+        for x, y, w, h in rects:
+            assert x >= 0 and y >= 0 and x + w <= 256 and y + h <= 256
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                assert not overlaps(rects[i], rects[j])
+
+
+# 画布高度裁剪到实际用到的shelf，向上取整到32的倍数
+def test_render_trims_canvas_height() -> None:
+    mosaic = OcrDetMosaic(canvas_size=256, gutter=8)
+    images = [np.zeros((40, 50, 3), dtype=np.uint8), np.zeros((20, 30, 3), dtype=np.uint8)]
+    canvases = mosaic.pack([img.shape for img in images])
+    assert len(canvases) == 1
+    canvas = mosaic.render(canvases[0], images)
+    assert canvas.shape == (64, 256, 3)
+    for crop_idx, x, y in canvases[0]:
+        h, w = images[crop_idx].shape[:2]
+        assert (canvas[y:y + h, x:x + w] == 0).all()
+
+    full_images = [np.zeros((250, 250, 3), dtype=np.uint8)]
+    assert mosaic.render(mosaic.pack([full_images[0].shape])[0], full_images).shape == (256, 256, 3)
+
+
+# 检测框按中心点分回所在的crop，平移回crop坐标并裁剪到crop范围内
+def test_split_boxes_mapping() -> None:
+    shapes = [(40, 50, 3), (20, 30, 3)]
+    placements = [(0, 0, 0), (1, 100, 60)]
+    dt_boxes = np.array([
+        [[10, 10], [40, 10], [40, 30], [10, 30]],
+        [[95, 62], [135, 62], [135, 78], [95, 78]],
+        [[200, 200], [210, 200], [210, 210], [200, 210]],
+    ], dtype=np.float32)
+    crop_boxes = OcrDetMosaic.split_boxes(dt_boxes, placements, shapes)
+    assert set(crop_boxes) == {0, 1}
+    np.testing.assert_array_equal(crop_boxes[0], dt_boxes[:1])
+    np.testing.assert_array_equal(
+        crop_boxes[1], np.array([[[0, 2], [29, 2], [29, 18], [0, 18]]], dtype=np.float32)
+    )
+    assert OcrDetMosaic.split_boxes(None, placements, shapes) == {}
+    assert OcrDetMosaic.split_boxes([], placements, shapes) == {}
@@ -0,0 +1,81 @@
+import numpy as np
+
+from mineru.backend.pipeline.page_dedup import PageDedup
+from mineru.utils.pdf_image_tools import PageImage
+
+
+def make_page(value: int, height: int = 40, width: int = 30) -> PageImage:
+    np_img = np.full((height, width, 3), 255, dtype=np.uint8)
+    np_img[10:20, 5:25] = value
+    return PageImage(np_img, 1.0)
+
+
+def fake_infer(infer_image: list) -> list:
+    # 以页面内容作为推理结果，便于检查结果是否对应到正确的页面
+    return [[{'value': int(page_image.np_bgr[15, 15, 0]), 'ocr': ocr_enable, 'lang': lang}]
+            for page_image, ocr_enable, lang in infer_image]
+
+
+def run_batch(page_dedup: PageDedup, batch_image: list) -> tuple[list, list]:
+    infer_image, plan = page_dedup.split(batch_image)
+    return infer_image, page_dedup.merge(plan, fake_infer(infer_image))
+
+
+# 批次内的重复页只推理一次，所有页面按原顺序得到与自身内容一致的结果
+def test_dedup_within_batch() -> None:
+    page_dedup = PageDedup()
+    batch_image = [(make_page(value), True, 'ch') for value in [0, 50, 0, 100, 50, 0]]
+    infer_image, results = run_batch(page_dedup, batch_image)
+    assert len(infer_image) == 3
+    assert [result[0]['value'] for result in results] == [0, 50, 0, 100, 50, 0]
+    assert results[0] == results[2] == results[5]
+    assert page_dedup.pages == 6 and page_dedup.hits == 3
+
+
+# 跨批次(跨文档)的重复页使用之前批次的结果，各页的结果是独立的副本
+def test_dedup_across_batches() -> None:
+    page_dedup = PageDedup()
+    _, first_results = run_batch(page_dedup, [(make_page(0), False, 'ch'), (make_page(50), False, 'ch')])
+    infer_image, second_results = run_batch(
+        page_dedup, [(make_page(50), False, 'ch'), (make_page(100), False, 'ch'), (make_page(0), False, 'ch')]
+    )
+    assert len(infer_image) == 1
+    assert [result[0]['value'] for result in second_results] == [50, 100, 0]
+    assert second_results[0] == first_results[1]
+    assert second_results[2] == first_results[0]
+    # 下游原地修改一页的结果，不影响之后的重复页
+    second_results[0][0]['value'] = -1
+    _, third_results = run_batch(page_dedup, [(make_page(50), False, 'ch')])
+    assert third_results[0][0]['value'] == 50
+    assert third_results[0] is not second_results[0]
+
+
+# ocr设置、语言或页面尺寸不同时不视为重复页
+def test_dedup_key_includes_settings_and_shape() -> None:
+    page_dedup = PageDedup()
+    batch_image = [
+        (make_page(0), True, 'ch'),
+        (make_page(0), False, 'ch'),
+        (make_page(0), True, 'en'),
+        (make_page(0, height=41), True, 'ch'),
+    ]
+    infer_image, results = run_batch(page_dedup, batch_image)
+    assert len(infer_image) == 4
+    assert [(result[0]['ocr'], result[0]['lang']) for result in results] == [
+        (True, 'ch'), (False, 'ch'), (True, 'en'), (True, 'ch')
+    ]
+
+
+# 超过max_pages后新页面仍然推理，但不再被记住
+def test_dedup_max_pages() -> None:
+    page_dedup = PageDedup(max_pages=1)
+    run_batch(page_dedup, [(make_page(0), True, 'ch'), (make_page(50), True, 'ch')])
+    infer_image, results = run_batch(page_dedup, [(make_page(0), True, 'ch'), (make_page(50), True, 'ch')])
+    assert len(infer_image) == 1
+    assert [result[0]['value'] for result in results] == [0, 50]
+
+
+def test_dedup_empty_batch() -> None:
+    page_dedup = PageDedup()
+    infer_image, results = run_batch(page_dedup, [])
+    assert infer_image == [] and results == []
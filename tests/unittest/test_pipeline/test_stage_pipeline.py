@@ -0,0 +1,86 @@
+import random
+import threading
+import time
+
+import pytest
+
+from mineru.backend.pipeline.stage_pipeline import StagePipeline, parse_stage_workers
+
+
+def sleepy(fn, max_delay: float = 0.005):
+    def wrapper(item):
+        time.sleep(random.random() * max_delay)
+        return fn(item)
+    return wrapper
+
+
+# 多线程的阶段乱序完成，结果仍按输入顺序输出
+def test_results_in_input_order() -> None:
+    pipeline = StagePipeline([
+        ('double', sleepy(lambda item: item * 2), 3),
+        ('inc', sleepy(lambda item: item + 1), 2),
+    ])
+    assert list(pipeline.run(range(50))) == [item * 2 + 1 for item in range(50)]
+    assert [stage_report['items'] for stage_report in pipeline.report()] == [50, 50]
+
+
+def test_empty_input() -> None:
+    pipeline = StagePipeline([('noop', lambda item: item, 2)])
+    assert list(pipeline.run([])) == []
+
+
+# 输入在调用方线程中取出，且不超前于队列容量
+def test_items_consumed_in_caller_thread() -> None:
+    caller = threading.get_ident()
+    produced_in = set()
+    produced = []
+
+    def items():
+        for item in range(20):
+            produced_in.add(threading.get_ident())
+            produced.append(item)
+            yield item
+
+    pipeline = StagePipeline([('noop', lambda item: item, 1)], queue_size=1)
+    results = pipeline.run(items())
+    assert next(results) == 0
+    # 第一个队列、阶段线程和输出队列中最多各有少量条目在途
+    assert len(produced) <= 5
+    assert list(results) == list(range(1, 20))
+    assert produced_in == {caller}
+
+
+# 阶段中的异常在调用方重新抛出，所有阶段线程退出
+def test_stage_error_propagates() -> None:
+    def fail_on_five(item):
+        if item == 5:
+            raise ValueError('bad item')
+        return item
+
+    pipeline = StagePipeline([('check', fail_on_five, 2), ('noop', lambda item: item, 1)])
+    with pytest.raises(ValueError, match='bad item'):
+        list(pipeline.run(range(100)))
+    assert not any(thread.name.startswith('stage-') for thread in threading.enumerate())
+
+
+# 调用方提前停止迭代时，阶段线程退出且不再取输入
+def test_close_stops_pipeline() -> None:
+    produced = []
+
+    def items():
+        for item in range(1000):
+            produced.append(item)
+            yield item
+
+    pipeline = StagePipeline([('noop', lambda item: item, 2)])
+    results = pipeline.run(items())
+    assert next(results) == 0
+    results.close()
+    assert not any(thread.name.startswith('stage-') for thread in threading.enumerate())
+    assert len(produced) < 1000
+
+
+def test_parse_stage_workers() -> None:
+    assert parse_stage_workers(None) == {}
+    assert parse_stage_workers('') == {}
+    assert parse_stage_workers('ocr_det=2, table = 3,invalid') == {'ocr_det': 2, 'table': 3}
@@ -0,0 +1,38 @@
+from mineru.backend.pipeline.worker_pool import can_fork_workers, fork_doc_shards, shard_by_pages
+
+
+def shard_pages(page_counts: list[int], shards: list[list[int]]) -> list[int]:
+    return [sum(page_counts[doc_idx] for doc_idx in shard) for shard in shards]
+
+
+# 每个文档恰好分到一个分片，分片内保持原始顺序，各分片页数接近
+def test_shard_by_pages_balanced() -> None:
+    page_counts = [10, 1, 5, 5, 2, 7, 3]
+    shards = shard_by_pages(page_counts, 3)
+    assert len(shards) == 3
+    assert sorted(doc_idx for shard in shards for doc_idx in shard) == list(range(len(page_counts)))
+    assert all(shard == sorted(shard) for shard in shards)
+    pages = shard_pages(page_counts, shards)
+    assert max(pages) - min(pages) <= max(page_counts)
+    assert sorted(pages) == [10, 11, 12]
+
+
+# 文档数少于分片数时不返回空分片
+def test_shard_by_pages_no_empty_shards() -> None:
+    assert shard_by_pages([3, 8], 4) == [[1], [0]]
+    assert shard_by_pages([], 4) == []
+    assert shard_by_pages([1, 2, 3], 0) == [[0, 1, 2]]
+
+
+def test_can_fork_workers_needs_cpu() -> None:
+    assert not can_fork_workers('cuda')
+    assert not can_fork_workers('mps')
+
+
+# 只有一个进程或一个文档时直接返回None，由调用方单进程执行
+def test_fork_doc_shards_single_worker_or_doc() -> None:
+    def task(doc_indices):
+        raise AssertionError('task should not run')
+
+    assert fork_doc_shards(task, [5, 5], ['ch'] * 2, True, True, cpu_workers=1, threads_per_worker=1) is None
+    assert fork_doc_shards(task, [5], ['ch'], True, True, cpu_workers=4, threads_per_worker=1) is None
@@ -0,0 +1,57 @@
+import os
+
+from mineru.utils.checkpoint import CheckpointStore, get_checkpoint_store
+
+
+def test_put_get(tmp_path) -> None:
+    store = CheckpointStore(str(tmp_path))
+    tag = CheckpointStore.make_tag('pipeline', 'ch', True, True)
+    result = [{'category_id': 1, 'poly': [0, 0, 10, 0, 10, 10, 0, 10], 'text': '中文'}]
+    assert not store.has('abcdef', tag, 3) and store.get('abcdef', tag, 3) is None
+    store.put('abcdef', tag, 3, result)
+    assert store.has('abcdef', tag, 3)
+    assert store.get('abcdef', tag, 3) == result
+    # 不残留临时文件
+    assert os.listdir(os.path.dirname(store._path('abcdef', tag, 3))) == ['3.json']
+
+
+# 解析选项不同时tag不同，不会读到其他选项的结果
+def test_tag_separates_options(tmp_path) -> None:
+    store = CheckpointStore(str(tmp_path))
+    tag = CheckpointStore.make_tag('pipeline', 'ch', True, True)
+    other_tag = CheckpointStore.make_tag('pipeline', 'en', True, True)
+    assert tag != other_tag
+    assert tag == CheckpointStore.make_tag('pipeline', 'ch', True, True)
+    store.put('abcdef', tag, 0, [])
+    assert store.get('abcdef', other_tag, 0) is None
+    assert store.get('abcdef', tag, 0) == []
+
+
+# 损坏的检查点视为缺失并被删除
+def test_corrupted_checkpoint_removed(tmp_path) -> None:
+    store = CheckpointStore(str(tmp_path))
+    tag = CheckpointStore.make_tag('pipeline')
+    store.put('abcdef', tag, 0, [{'score': 1.0}])
+    path = store._path('abcdef', tag, 0)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[{"score": ')
+    assert store.get('abcdef', tag, 0) is None
+    assert not os.path.exists(path)
+
+
+# 无法序列化的结果不写入，也不残留临时文件
+def test_unserializable_result_skipped(tmp_path) -> None:
+    store = CheckpointStore(str(tmp_path))
+    tag = CheckpointStore.make_tag('pipeline')
+    store.put('abcdef', tag, 0, [{'image': object()}])
+    assert not store.has('abcdef', tag, 0)
+    assert os.listdir(os.path.dirname(store._path('abcdef', tag, 0))) == []
+
+
+def test_get_checkpoint_store(tmp_path, monkeypatch) -> None:
+    monkeypatch.delenv('MINERU_CHECKPOINT_DIR', raising=False)
+    assert get_checkpoint_store() is None
+    monkeypatch.setenv('MINERU_CHECKPOINT_DIR', str(tmp_path))
+    store = get_checkpoint_store()
+    assert store is not None and store.checkpoint_dir == str(tmp_path)
+    assert get_checkpoint_store() is store
@@ -0,0 +1,70 @@
+import gc
+import os
+
+import numpy as np
+
+from mineru.utils.pdf_image_tools import PageImage, PageMemoryBudget
+
+
+def make_page(value: int, height: int = 40, width: int = 50) -> PageImage:
+    return PageImage(np.full((height, width, 3), value, dtype=np.uint8), 1.0)
+
+
+def is_spilled(page_image: PageImage) -> bool:
+    return isinstance(page_image.np_bgr, np.memmap)
+
+
+# 超出预算时最久未使用的页面溢出到内存映射文件，页面内容保持不变
+def test_spill_least_recently_used(tmp_path) -> None:
+    page_bytes = make_page(0).resident_bytes
+    budget = PageMemoryBudget(page_bytes * 2, str(tmp_path))
+    pages = [make_page(value) for value in range(3)]
+    budget.track(pages[0])
+    budget.track(pages[1])
+    budget.touch(pages[0])
+    budget.track(pages[2])
+    assert is_spilled(pages[1])
+    assert not is_spilled(pages[0]) and not is_spilled(pages[2])
+    assert budget.spilled_pages == 1 and budget.total_bytes == page_bytes * 2
+    assert pages[1].resident_bytes == 0
+    np.testing.assert_array_equal(pages[1].np_bgr, make_page(1).np_bgr)
+    # 溢出文件在映射后立即删除，页面仍然可以写入(copy-on-write)
+    assert os.listdir(budget.spill_dir) == []
+    pages[1].np_bgr[0, 0] = 255
+    assert pages[1].np_bgr[0, 0, 0] == 255
+
+
+# 刚渲染的页面即使单页超出预算也保留在内存中
+def test_single_page_over_budget_kept(tmp_path) -> None:
+    budget = PageMemoryBudget(1, str(tmp_path))
+    page = make_page(0)
+    budget.track(page)
+    assert not is_spilled(page) and budget.spilled_pages == 0
+
+
+# 不再被引用的页面自动离开预算
+def test_released_page_leaves_budget(tmp_path) -> None:
+    page_bytes = make_page(0).resident_bytes
+    budget = PageMemoryBudget(page_bytes * 2, str(tmp_path))
+    page = make_page(0)
+    kept = make_page(1)
+    budget.track(page)
+    budget.track(kept)
+    del page
+    gc.collect()
+    assert budget.total_bytes == page_bytes
+    budget.track(make_page(2))
+    assert budget.spilled_pages == 0 and not is_spilled(kept)
+
+
+# 预算对象被回收后删除溢出目录
+def test_spill_dir_removed(tmp_path) -> None:
+    budget = PageMemoryBudget(1, str(tmp_path))
+    pages = [make_page(value) for value in range(2)]
+    for page in pages:
+        budget.track(page)
+    spill_dir = budget.spill_dir
+    assert os.path.isdir(spill_dir)
+    del budget
+    gc.collect()
+    assert not os.path.exists(spill_dir)
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+from mineru.utils.render_cache import RenderCache
+
+
+def make_image(value: int, height: int = 32, width: int = 32) -> np.ndarray:
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def dir_bytes(cache_dir: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(cache_dir) for name in files if name.endswith('.npy')
+    )
+
+
+def test_put_get(tmp_path) -> None:
+    cache = RenderCache(str(tmp_path), max_bytes=1024 ** 2)
+    key = RenderCache.make_key('abcdef', 0, 200, 3500)
+    assert cache.get(key) is None
+    cache.put(key, make_image(7))
+    image = cache.get(key)
+    np.testing.assert_array_equal(image, make_image(7))
+    # 命中的页面是copy-on-write映射，修改不影响缓存文件
+    image[:] = 0
+    np.testing.assert_array_equal(cache.get(key), make_image(7))
+    assert cache.hits == 2 and cache.misses == 1
+
+
+# 覆盖已有的页面只计入大小的差值，与磁盘上的实际大小一致
+def test_overwrite_keeps_size(tmp_path) -> None:
+    cache = RenderCache(str(tmp_path), max_bytes=1024 ** 2)
+    key = RenderCache.make_key('abcdef', 0, 200, 3500)
+    cache.put(key, make_image(1))
+    cache.put(key, make_image(2))
+    cache.put(key, make_image(3, height=64))
+    assert cache._total_bytes == dir_bytes(str(tmp_path))
+    np.testing.assert_array_equal(cache.get(key), make_image(3, height=64))
+    # 重新打开时从磁盘统计大小
+    assert RenderCache(str(tmp_path), max_bytes=1024 ** 2)._total_bytes == cache._total_bytes
+
+
+# 超过上限时按最近使用时间淘汰，清理到上限的90%以下
+def test_evict_least_recently_used(tmp_path) -> None:
+    page_bytes = make_image(0).nbytes + 128
+    cache = RenderCache(str(tmp_path), max_bytes=page_bytes * 4)
+    keys = [RenderCache.make_key('abcdef', page_id, 200, 3500) for page_id in range(5)]
+    for idx, key in enumerate(keys[:4]):
+        cache.put(key, make_image(idx))
+        os.utime(cache._path(key), (1000 + idx, 1000 + idx))
+    # 第0页最近被使用过，第1页成为最久未使用的页面
+    os.utime(cache._path(keys[0]), (2000, 2000))
+    cache.put(keys[4], make_image(4))
+    assert cache._total_bytes <= cache.max_bytes * 0.9
+    assert cache._total_bytes == dir_bytes(str(tmp_path))
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[4]) is not None